@@ -0,0 +1,124 @@
+"""
+Per-entry latency of the store backends: writing entries one at a time and in a
+single block, reading them back from a fresh store (cold) and reading them again
+from the same store (warm), plus the throughput of a reader process while a
+writer process writes.
+
+Usage: python -m benchmarks.backend_benchmark
+"""
+
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+from permacache.log_store import LogStore
+from permacache.sqlite_store import SQLiteStore
+
+BACKENDS = {
+    "combined-file": lambda path: LockedShelf(path, multiprocess_safe=True),
+    "individual-file": lambda path: IndividualFileLockedStore(
+        path, multiprocess_safe=True
+    ),
+    "sqlite": SQLiteStore,
+    "log": LogStore,
+}
+NUM_KEYS = 300
+DURATION = 2
+
+
+def value(i):
+    return np.full(1000, i)
+
+
+def per_entry(fn):
+    start = time.time()
+    fn()
+    return (time.time() - start) / NUM_KEYS
+
+
+def latencies(make_store, path):
+    keys = [str(i) for i in range(NUM_KEYS)]
+    store = make_store(path)
+
+    def write():
+        for i, k in enumerate(keys):
+            with store as s:
+                s[k] = value(i)
+
+    def write_batch():
+        with store as s:
+            for i, k in enumerate(keys):
+                s[k] = value(i)
+
+    def read():
+        for i, k in enumerate(keys):
+            with store.reading() as s:
+                assert s[k][0] == i
+
+    t_write = per_entry(write)
+    t_batch = per_entry(write_batch)
+    store.close()
+    store = make_store(path)
+    t_cold = per_entry(read)
+    t_warm = per_entry(read)
+    store.close()
+    return t_write, t_batch, t_cold, t_warm
+
+
+def read_loop(name, path, counts):
+    store = BACKENDS[name](path)
+    end = time.time() + DURATION
+    count = 0
+    while time.time() < end:
+        with store.reading() as s:
+            assert s[str(count % NUM_KEYS)][0] == count % NUM_KEYS
+        count += 1
+    counts[0] = count
+
+
+def write_loop(name, path, counts):
+    store = BACKENDS[name](path)
+    end = time.time() + DURATION
+    count = 0
+    while time.time() < end:
+        with store as s:
+            s[str(NUM_KEYS + count)] = value(count)
+        count += 1
+    counts[1] = count
+
+
+def concurrent_throughput(name, path):
+    counts = multiprocessing.Array("l", 2)
+    processes = [
+        multiprocessing.Process(target=target, args=(name, path, counts))
+        for target in (read_loop, write_loop)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return counts[0] / DURATION, counts[1] / DURATION
+
+
+def main():
+    for name, make_store in BACKENDS.items():
+        path = tempfile.mkdtemp()
+        try:
+            t_write, t_batch, t_cold, t_warm = latencies(make_store, f"{path}/store")
+            reads, writes = concurrent_throughput(name, f"{path}/store")
+        finally:
+            shutil.rmtree(path)
+        print(
+            f"{name:>15}: write {t_write * 1e6:7.0f}us, "
+            f"batched write {t_batch * 1e6:7.0f}us, "
+            f"cold read {t_cold * 1e6:7.0f}us, warm read {t_warm * 1e6:7.0f}us; "
+            f"concurrently {reads:6.0f} reads/s, {writes:6.0f} writes/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compression ratio and write/read throughput of the IndividualFileLockedStore
+drivers, on a few representative payloads: a large float array, a large integer
+array, a dict of floats, and many small dicts (with and without a zstd
+dictionary trained on them).
+
+Throughput is in MB/s of pickled payload, including the file system operations.
+Codecs whose package is not installed are skipped.
+
+Usage: python -m benchmarks.compression_benchmark
+"""
+
+import importlib.util
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from permacache.locked_shelf import IndividualFileLockedStore
+
+DRIVERS = [
+    ("pickle", None),
+    ("pickle.gz", None),
+    ("pickle.gz", 1),
+    ("pickle.zst", 1),
+    ("pickle.zst", 3),
+    ("pickle.zst", 9),
+    ("pickle.lz4", 0),
+]
+
+REQUIRED = {"pickle.zst": "zstandard", "pickle.lz4": "lz4"}
+
+
+def payloads():
+    rng = np.random.RandomState(0)
+    return {
+        "float array": {"x": rng.randn(2_000_000)},
+        "int array": {"x": rng.randint(0, 100, size=2_000_000)},
+        "dict of floats": {
+            f"x{i}": {f"feature {j}": float(rng.randn()) for j in range(20)}
+            for i in range(20)
+        },
+        "small dicts": {
+            f"x{i}": {"name": f"item {i}", "score": float(rng.rand()), "ok": True}
+            for i in range(2000)
+        },
+    }
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for directory, _, filenames in os.walk(path)
+        for filename in filenames
+        if filename.startswith(".")
+    )
+
+
+def benchmark(driver, level, name, payload, train=False):
+    path = tempfile.mkdtemp()
+    try:
+        store = IndividualFileLockedStore(
+            f"{path}/store", driver=driver, compression_level=level
+        )
+        if train:
+            # train on a first copy of the values, so the timed writes use it
+            with store:
+                for key, value in payload.items():
+                    store[key] = value
+            store.train_compression_dictionary(dict_size=16384)
+        raw = sum(len(pickle.dumps({key: value})) for key, value in payload.items())
+        start = time.time()
+        with store:
+            for key, value in payload.items():
+                store[key] = value
+        t_write = time.time() - start
+        start = time.time()
+        with store:
+            for key in payload:
+                store[key]  # pylint: disable=pointless-statement
+        t_read = time.time() - start
+        ratio = raw / directory_size(f"{path}/store")
+        label = f"{driver} level={level}" + (" +dict" if train else "")
+        print(
+            f"{name:>15} {label:>24}: ratio {ratio:6.2f}, "
+            f"write {raw / t_write / 1e6:7.1f} MB/s, read {raw / t_read / 1e6:7.1f} MB/s"
+        )
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    for name, payload in payloads().items():
+        for driver, level in DRIVERS:
+            if driver in REQUIRED and not importlib.util.find_spec(REQUIRED[driver]):
+                continue
+            benchmark(driver, level, name, payload)
+        if name == "small dicts" and importlib.util.find_spec("zstandard"):
+            benchmark("pickle.zst", 3, name, payload, train=True)
+
+
+if __name__ == "__main__":
+    main()
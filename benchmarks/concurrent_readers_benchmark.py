@@ -0,0 +1,72 @@
+"""
+Aggregate throughput of processes reading cache hits from the same LockedShelf,
+as the number of readers grows.
+
+"exclusive" enters the shelf as writers do, so readers serialize on the file
+lock; "shared" uses LockedShelf.reading(), which takes the lock in shared mode.
+Both use multiprocess_safe=True, so the shelf is reopened on every access.
+
+Usage: python -m benchmarks.concurrent_readers_benchmark
+"""
+
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from permacache.locked_shelf import LockedShelf
+
+KEYS = [str(i) for i in range(100)]
+DURATION = 2
+
+
+def reader(path, shared, start, counts, index):
+    shelf = LockedShelf(path, multiprocess_safe=True)
+    start.wait()
+    end = time.time() + DURATION
+    count = 0
+    while time.time() < end:
+        with shelf.reading() if shared else shelf as s:
+            assert s[KEYS[count % len(KEYS)]] == count % len(KEYS)
+        count += 1
+    counts[index] = count
+
+
+def throughput(path, shared, num_readers):
+    start = multiprocessing.Event()
+    counts = multiprocessing.Array("l", num_readers)
+    processes = [
+        multiprocessing.Process(
+            target=reader, args=(path, shared, start, counts, index)
+        )
+        for index in range(num_readers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)
+    start.set()
+    for process in processes:
+        process.join()
+    return sum(counts) / DURATION
+
+
+def main():
+    path = tempfile.mkdtemp()
+    try:
+        with LockedShelf(path, multiprocess_safe=True) as s:
+            for i, k in enumerate(KEYS):
+                s[k] = i
+        print(f"{multiprocessing.cpu_count()} cpus")
+        for num_readers in 1, 2, 4, 8:
+            exclusive = throughput(path, False, num_readers)
+            shared = throughput(path, True, num_readers)
+            print(
+                f"{num_readers} readers: exclusive {exclusive:8.0f} lookups/s, "
+                f"shared {shared:8.0f} lookups/s"
+            )
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Insert and lookup latency of IndividualFileLockedStore as the number of entries
+grows, with all files in one directory (fanout=0) and spread over two levels of
+256 subdirectories (fanout=2).
+
+Sizes are given on the command line, and default to 10^4 and 10^5. Larger sizes
+take a while and need space for that many files.
+
+Usage: python -m benchmarks.fanout_benchmark [size ...]
+"""
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from permacache.locked_shelf import IndividualFileLockedStore
+
+SAMPLE = 1000
+
+
+def key(i):
+    return f"some argument that is long enough to be hashed {i}"
+
+
+def per_operation(fn, keys):
+    start = time.time()
+    for k in keys:
+        fn(k)
+    return (time.time() - start) / len(keys)
+
+
+def benchmark(fanout, sizes):
+    path = tempfile.mkdtemp()
+    store = IndividualFileLockedStore(f"{path}/store", fanout=fanout)
+    rng = random.Random(0)
+    try:
+        count = 0
+        for size in sizes:
+            while count < size - SAMPLE:
+                store[key(count)] = count
+                count += 1
+
+            def insert(k):
+                store[k] = 0
+
+            t_insert = per_operation(insert, [key(i) for i in range(count, size)])
+            count = size
+            hits = [key(rng.randrange(size)) for _ in range(SAMPLE)]
+            misses = [key(size + i) for i in range(SAMPLE)]
+            t_hit = per_operation(store.__getitem__, hits)
+            t_miss = per_operation(store.__contains__, misses)
+            print(
+                f"fanout={fanout} {size:>9} entries: insert {t_insert * 1e6:6.0f}us, "
+                f"hit {t_hit * 1e6:6.0f}us, miss {t_miss * 1e6:6.0f}us"
+            )
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [10**4, 10**5]
+    for fanout in 0, 2:
+        benchmark(fanout, sorted(sizes))
+
+
+if __name__ == "__main__":
+    main()
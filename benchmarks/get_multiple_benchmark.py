@@ -0,0 +1,59 @@
+"""
+Time of IndividualFileLockedStore.get_multiple, reading one file at a time
+(read_threads=1) and on a pool of threads, on local storage and on simulated
+high-latency storage, where opening each file first sleeps for the given latency
+in milliseconds (default 2).
+
+Usage: python -m benchmarks.get_multiple_benchmark [latency_ms]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from permacache.locked_shelf import IndividualFileLockedStore
+
+ENTRIES = 2000
+
+
+class SlowStore(IndividualFileLockedStore):
+    latency = 0
+
+    def _load(self, path):
+        time.sleep(self.latency)
+        return super()._load(path)
+
+
+def benchmark(path, driver, latency, read_threads):
+    SlowStore.latency = latency
+    store = SlowStore(path, driver=driver, read_threads=read_threads)
+    keys = [f"key {i}" for i in range(ENTRIES)]
+    start = time.time()
+    with store.reading():
+        store.get_multiple(keys)
+    elapsed = time.time() - start
+    print(
+        f"{driver:>10} latency={latency * 1e3:4.1f}ms read_threads={read_threads:>2}: "
+        f"{elapsed * 1e3:8.1f}ms for {ENTRIES} entries"
+    )
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+    for driver in "pickle", "pickle.gz":
+        path = tempfile.mkdtemp()
+        try:
+            store = IndividualFileLockedStore(f"{path}/store", driver=driver)
+            with store:
+                for i in range(ENTRIES):
+                    store[f"key {i}"] = {"values": list(range(i % 100, 1000))}
+            for delay in 0, latency:
+                for read_threads in 1, 8, 32:
+                    benchmark(f"{path}/store", driver, delay, read_threads)
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Latency of cache hits on a LockedShelf with multiprocess_safe, each in its own
+access, as a cached function does, when closing the shelf after every access and
+with keep_open, along with a shelf that is not multiprocess safe for reference.
+
+Usage: python -m benchmarks.keep_open_benchmark [entries]
+"""
+
+import shutil
+import sys
+import tempfile
+import timeit
+
+from permacache.locked_shelf import LockedShelf
+
+MODES = {
+    "not multiprocess safe": {},
+    "close every time": dict(multiprocess_safe=True),
+    "keep_open": dict(multiprocess_safe=True, keep_open=True),
+}
+
+
+def time_per_hit(path, entries, **kwargs):
+    keys = [str(i) for i in range(entries)]
+    shelf = LockedShelf(path, **kwargs)
+    with shelf as s:
+        s.set_multiple((k, {"value": k}) for k in keys)
+    hits = keys[:: max(1, entries // 100)]
+
+    def hit():
+        for k in hits:
+            with shelf.reading() as s:
+                assert s[k]["value"] == k
+
+    number = 10
+    result = timeit.timeit(hit, number=number) / number / len(hits)
+    shelf.close()
+    return result
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for name, kwargs in MODES.items():
+        path = tempfile.mkdtemp()
+        try:
+            t_hit = time_per_hit(f"{path}/shelf", entries, **kwargs)
+        finally:
+            shutil.rmtree(path)
+        print(f"{name:>22}: {t_hit * 1e6:9.2f}us per hit ({entries} entries)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Per-call overhead of dict_function key functions, for a small and a wide signature.
+
+"uncompiled" reproduces the previous key path (inspect.signature + Signature.bind
++ apply_defaults on every call, then a per-argument isinstance/callable walk);
+"compiled" is the current dict_function.
+
+Usage: python -m benchmarks.key_function_benchmark
+"""
+
+import timeit
+
+from permacache.dict_function import (
+    DEFAULT_FUNCTIONS,
+    dict_function,
+    drop_if,
+    drop_if_equal,
+)
+from permacache.utils import bind_arguments
+
+
+def uncompiled_dict_function(d, fn):
+    def key(args, kwargs):
+        result = {}
+        for k, v in bind_arguments(fn, args, kwargs).items():
+            if k in d:
+                if isinstance(d[k], drop_if):
+                    if d[k].predicate(v):
+                        continue
+                    v = d[k].mapper(v)
+                elif callable(d[k]):
+                    v = d[k](v)
+                else:
+                    v = DEFAULT_FUNCTIONS[d[k]](v)
+            result[k] = v
+        return result
+
+    return key
+
+
+def small(x, y=2, z=3, verbose=False):
+    del x, y, z, verbose
+
+
+WIDE_NAMES = [f"a{i}" for i in range(30)]
+# pylint: disable=exec-used
+namespace = {}
+exec(f"def wide({', '.join(n + '=0' for n in WIDE_NAMES)}): pass", namespace)
+wide = namespace["wide"]
+
+CASES = {
+    "small": (
+        small,
+        dict(verbose=None, z=drop_if_equal(3)),
+        (1,),
+        dict(y=5),
+    ),
+    "wide": (
+        wide,
+        {n: (str if i % 3 == 0 else None) for i, n in enumerate(WIDE_NAMES[:10])},
+        tuple(range(10)),
+        {n: 1 for n in WIDE_NAMES[20:]},
+    ),
+}
+
+
+def time_per_call(key, args, kwargs, number):
+    return timeit.timeit(lambda: key(args, kwargs), number=number) / number
+
+
+def main():
+    number = 20_000
+    for name, (fn, spec, args, kwargs) in CASES.items():
+        before = uncompiled_dict_function(spec, fn)
+        after = dict_function(spec, fn)
+        assert before(args, kwargs) == after(args, kwargs)
+        t_before = time_per_call(before, args, kwargs, number)
+        t_after = time_per_call(after, args, kwargs, number)
+        print(
+            f"{name:>6}: uncompiled {t_before * 1e6:7.2f}us/call, "
+            f"compiled {t_after * 1e6:7.2f}us/call "
+            f"({t_before / t_after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
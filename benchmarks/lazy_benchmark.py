@@ -0,0 +1,53 @@
+"""
+Time to look up a large cached result dict and read its one small field, with
+and without lazy=True, for the combined-file and individual-file stores. The
+large fields are python objects, which are slow to unpickle.
+
+Usage: python -m benchmarks.lazy_benchmark
+"""
+
+import shutil
+import tempfile
+import time
+
+from permacache import cache
+
+REPEATS = 5
+
+
+def result(x):
+    return {
+        "summary": x,
+        "rows": [{"id": i, "score": i / 3} for i in range(200_000)],
+        "values": [float(i) for i in range(1_000_000)],
+    }
+
+
+def benchmark(shelf_type, **kwargs):
+    path = tempfile.mkdtemp()
+    cache.CACHE = path
+    try:
+        f = cache.permacache("f", shelf_type=shelf_type, **kwargs)(result)
+        f(0)
+        start = time.time()
+        for _ in range(REPEATS):
+            # a fresh function each time, so the value is not in memory yet
+            f = cache.permacache("f", shelf_type=shelf_type, **kwargs)(result)
+            assert f(0)["summary"] == 0
+            f.shelf.close()
+        t_lookup = (time.time() - start) / REPEATS
+        options = " ".join(f"{k}={v}" for k, v in kwargs.items())
+        print(f"{shelf_type:>15} {options:>40}: {t_lookup * 1e3:8.2f}ms per lookup")
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    for shelf_type in "combined-file", "individual-file":
+        benchmark(shelf_type)
+        benchmark(shelf_type, lazy=True)
+        benchmark(shelf_type, lazy=True, out_of_band_threshold=2**16)
+
+
+if __name__ == "__main__":
+    main()
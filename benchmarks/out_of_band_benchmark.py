@@ -0,0 +1,56 @@
+"""
+Time to load a large numpy array from a LockedShelf, with the array pickled
+in-band (allow_large_values=True) and written to a memory mapped file
+(out_of_band_threshold). Each load is from a freshly opened shelf, so no value is
+cached in memory.
+
+Sizes in MB are given on the command line, and default to 10 and 100.
+
+Usage: python -m benchmarks.out_of_band_benchmark [size ...]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from permacache.locked_shelf import LockedShelf
+
+REPEATS = 5
+
+
+def benchmark(name, size, **kwargs):
+    path = tempfile.mkdtemp()
+    try:
+        with LockedShelf(f"{path}/shelf", **kwargs) as shelf:
+            shelf["x"] = np.ones(size * 2**20, dtype=np.uint8)
+        shelf.close()
+        start = time.time()
+        for _ in range(REPEATS):
+            shelf = LockedShelf(f"{path}/shelf", **kwargs)
+            with shelf.reading():
+                array = shelf["x"]
+            shelf.close()
+        t_load = (time.time() - start) / REPEATS
+        start = time.time()
+        array.sum()
+        t_sum = time.time() - start
+        print(
+            f"{name:>12} {size:>6} MB: load {t_load * 1e3:8.2f}ms, "
+            f"first sum {t_sum * 1e3:8.2f}ms"
+        )
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [10, 100]
+    for size in sizes:
+        benchmark("in-band", size, allow_large_values=True)
+        benchmark("out-of-band", size, out_of_band_threshold=2**20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Time to populate a parallel= cache with a CPU-bound function, computing the
+missing elements in-process, and in chunks on a process pool with as many workers
+as CPUs.
+
+Usage: python -m benchmarks.parallel_executor_benchmark [size]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from permacache import cache
+
+
+def work(xs):
+    results = []
+    for x in xs:
+        total = 0
+        for i in range(20_000):
+            total += (x * i) % 7
+        results.append(total)
+    return results
+
+
+def benchmark(name, size, **kwargs):
+    path = tempfile.mkdtemp()
+    cache.CACHE = path
+    try:
+        f = cache.permacache("f", parallel=("xs",), **kwargs)(work)
+        start = time.time()
+        f(list(range(size)))
+        print(f"{name:>12}: {time.time() - start:6.2f}s for {size} elements")
+        f.shelf.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = os.cpu_count() or 1
+    print(f"{workers} CPUs")
+    benchmark("in-process", size)
+    with ProcessPoolExecutor(workers) as executor:
+        benchmark("process pool", size, executor=executor, chunk_size=100)
+
+
+if __name__ == "__main__":
+    main()
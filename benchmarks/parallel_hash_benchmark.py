@@ -0,0 +1,36 @@
+"""
+Time to stable_hash a key made of many large arrays, serially and with the
+arrays pre-hashed on a thread pool.
+
+Usage: python -m benchmarks.parallel_hash_benchmark
+"""
+
+import os
+import time
+
+import numpy as np
+
+from permacache.hash import stable_hash
+
+KEY = {f"feature_{i}": np.random.RandomState(i).randn(2**22) for i in range(16)}
+
+
+def measure(**kwargs):
+    start = time.time()
+    digest = stable_hash(KEY, version=2, **kwargs)
+    return digest, time.time() - start
+
+
+def main():
+    size = sum(x.nbytes for x in KEY.values())
+    expected, elapsed = measure()
+    print(f"serial: {size / elapsed / 1e9:.2f}GB/s")
+    for threads in (2, 4, 8):
+        digest, elapsed = measure(threads=threads)
+        assert digest == expected
+        print(f"{threads} threads: {size / elapsed / 1e9:.2f}GB/s")
+    print(f"({os.cpu_count()} cpus available)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Time to compute the stringified keys of a parallel= call, binding and stringifying
+each element's full argument dictionary (the previous path), and binding and
+encoding the shared arguments once (dict_function's stringify_parallel).
+
+Usage: python -m benchmarks.parallel_keys_benchmark [max_size]
+"""
+
+import sys
+import time
+
+from permacache import stringify
+from permacache.dict_function import dict_function
+
+
+def predict(model, xs, config, verbose=False):
+    del model, xs, config, verbose
+
+
+def per_element_keys(key, args, kwargs):
+    values = key(args, kwargs, parallel=("xs",)).values
+    return [stringify(v, version=2) for v in values]
+
+
+def batched_keys(key, args, kwargs):
+    return key.stringify_parallel(args, kwargs, parallel=("xs",), version=2)
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    key = dict_function(dict(verbose=None), predict)
+    config = {"layers": [float(i) for i in range(20)], "name": "model"}
+    size = 10**3
+    while size <= max_size:
+        args = ("resnet",)
+        kwargs = dict(xs=[f"example {i}" for i in range(size)], config=config)
+        start = time.time()
+        before = per_element_keys(key, args, kwargs)
+        t_before = time.time() - start
+        start = time.time()
+        after = batched_keys(key, args, kwargs)
+        t_after = time.time() - start
+        assert before == after
+        print(
+            f"{size:>8} elements: per element {t_before:7.3f}s, "
+            f"batched {t_after:7.3f}s ({t_before / t_after:.0f}x)"
+        )
+        size *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time per call of a batch of cache hits, each on a fresh function so that the
+values are not in memory yet, without prefetch, and after prefetching all of
+the calls, along with the time the prefetch itself took, for each shelf_type.
+
+Usage: python -m benchmarks.prefetch_benchmark [calls]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from permacache import cache
+
+
+def result(x):
+    return {"x": x, "rows": [{"id": i, "score": i / 3} for i in range(100)]}
+
+
+def benchmark(shelf_type, calls):
+    path = tempfile.mkdtemp()
+    cache.CACHE = path
+    try:
+        f = cache.permacache("f", shelf_type=shelf_type)(result)
+        for x in range(calls):
+            f(x)
+        f.shelf.close()
+
+        f = cache.permacache("f", shelf_type=shelf_type)(result)
+        start = time.time()
+        for x in range(calls):
+            assert f(x)["x"] == x
+        t_cold = (time.time() - start) / calls
+        f.shelf.close()
+
+        f = cache.permacache("f", shelf_type=shelf_type)(result)
+        start = time.time()
+        report = f.prefetch([((x,), {}) for x in range(calls)], background=False)
+        t_prefetch = time.time() - start
+        assert not report.missing
+        start = time.time()
+        for x in range(calls):
+            assert f(x)["x"] == x
+        t_warm = (time.time() - start) / calls
+        f.shelf.close()
+        print(
+            f"{shelf_type:>15}: {t_cold * 1e6:8.2f}us per call cold,"
+            f" {t_warm * 1e6:8.2f}us per call after prefetch"
+            f" (prefetch of {calls} calls: {t_prefetch * 1e3:.1f}ms)"
+        )
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for shelf_type in "combined-file", "sqlite", "log", "individual-file":
+        benchmark(shelf_type, calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time to write many small entries to each store under a single lock, setting them
+one at a time and with set_multiple, which is what parallel= functions use.
+
+Usage: python -m benchmarks.set_multiple_benchmark [entries]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+from permacache.log_store import LogStore
+from permacache.sqlite_store import SQLiteStore
+
+BACKENDS = {
+    "combined-file": LockedShelf,
+    "individual-file": IndividualFileLockedStore,
+    "sqlite": SQLiteStore,
+    "log": LogStore,
+}
+
+
+def one_at_a_time(store, items):
+    with store as s:
+        for k, v in items:
+            s[k] = v
+
+
+def batched(store, items):
+    with store as s:
+        s.set_multiple(items)
+
+
+def benchmark(make_store, write, items):
+    path = tempfile.mkdtemp()
+    try:
+        store = make_store(f"{path}/store")
+        start = time.time()
+        write(store, items)
+        elapsed = time.time() - start
+        store.close()
+    finally:
+        shutil.rmtree(path)
+    return elapsed / len(items)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    items = [(f"key {i}", [i, i / 3, str(i)]) for i in range(entries)]
+    for name, make_store in BACKENDS.items():
+        t_single = benchmark(make_store, one_at_a_time, items)
+        t_batch = benchmark(make_store, batched, items)
+        print(
+            f"{name:>15}: one at a time {t_single * 1e6:6.1f}us, "
+            f"set_multiple {t_batch * 1e6:6.1f}us per entry "
+            f"({t_single / t_batch:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Latency of cache hits and writes on a LockedShelf.
+
+"time file" reproduces the previous staleness check, which read and parsed a
+file holding the wall-clock time of the last modification on every access and
+rewrote it on every write; "generation" is the current memory-mapped counter.
+
+Usage: python -m benchmarks.shelf_hit_benchmark
+"""
+
+import shutil
+import tempfile
+import time
+import timeit
+
+from permacache.locked_shelf import Lock, LockedShelf
+
+
+class TimeFileLock(Lock):
+    def __init__(self, lock_path, time_path):
+        super().__init__(lock_path, time_path)
+        self.last_opened = float("-inf")
+
+    def _get_last_modified(self):
+        self._check()
+        try:
+            with open(self.generation_path) as f:
+                return float(f.read())
+        except (FileNotFoundError, ValueError):
+            self.set_last_modified()
+            return self._get_last_modified()
+
+    def opened_after_last_modification(self):
+        return self.last_opened >= self._get_last_modified()
+
+    def set_last_opened(self):
+        self.last_opened = time.time()
+
+    def set_last_modified(self):
+        self._check()
+        self.set_last_opened()
+        with open(self.generation_path, "w") as f:
+            f.write(str(self.last_opened))
+
+
+def time_per_operation(shelf, number):
+    keys = [str(i) for i in range(100)]
+    with shelf as s:
+        for k in keys:
+            s[k] = k
+
+        def hit():
+            for k in keys:
+                assert s[k] == k
+
+        def write():
+            for k in keys:
+                s[k] = k
+
+        t_hit = timeit.timeit(hit, number=number) / number / len(keys)
+        t_write = timeit.timeit(write, number=number // 10) / (number // 10) / len(keys)
+    shelf.close()
+    return t_hit, t_write
+
+
+def main():
+    number = 100
+    path = tempfile.mkdtemp()
+    try:
+        results = {}
+        for name in "time file", "generation":
+            shelf = LockedShelf(f"{path}/{name}")
+            if name == "time file":
+                shelf.lock = TimeFileLock(shelf.path + "/lock", shelf.path + "/time")
+            results[name] = time_per_operation(shelf, number)
+        for name, (t_hit, t_write) in results.items():
+            print(f"{name:>10}: hit {t_hit * 1e6:7.2f}us, write {t_write * 1e6:7.2f}us")
+        print(f"hit speedup {results['time file'][0] / results['generation'][0]:.1f}x")
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
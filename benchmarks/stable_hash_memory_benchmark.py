@@ -0,0 +1,48 @@
+"""
+Peak memory and time of stable_hash with and without streaming, for keys whose
+json representation is large.
+
+Usage: python -m benchmarks.stable_hash_memory_benchmark
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from permacache.hash import stable_hash
+
+CASES = {
+    "array, fast_bytes=False": (np.random.RandomState(0).randn(4_000_000), False),
+    "long list, fast_bytes=True": ([i / 3 for i in range(1_000_000)], True),
+}
+
+
+def measure(obj, **kwargs):
+    tracemalloc.start()
+    start = time.time()
+    result = stable_hash(obj, version=2, **kwargs)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    for name, (obj, fast_bytes) in CASES.items():
+        size = getattr(obj, "nbytes", None) or len(obj) * 8
+        results = {}
+        for streaming in (False, True):
+            digest, peak, elapsed = measure(
+                obj, fast_bytes=fast_bytes, streaming=streaming
+            )
+            results[streaming] = digest
+            print(
+                f"{name} ({size / 1e6:.0f}MB), streaming={streaming}: "
+                f"peak {peak / 1e6:8.1f}MB, {elapsed:6.2f}s"
+            )
+        assert results[False] == results[True]
+
+
+if __name__ == "__main__":
+    main()
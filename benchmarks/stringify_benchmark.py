@@ -0,0 +1,58 @@
+"""
+Throughput of stringify on small and large nested keys.
+
+"two-pass" reproduces the previous implementation (a fresh encoder class per
+call, json.dumps of fix_dictionary(obj)); "stringify" is the current one.
+
+Usage: python -m benchmarks.stringify_benchmark
+"""
+
+import json
+import timeit
+
+from permacache.hash import fix_dictionary, make_json_encoder, stringify
+
+
+def two_pass_stringify(obj, *, version, fast_bytes=False):
+    make_json_encoder.cache_clear()
+    return json.dumps(
+        fix_dictionary(obj, version=version),
+        cls=make_json_encoder(fast_bytes=fast_bytes, version=version),
+        sort_keys=True,
+    )
+
+
+CASES = {
+    "small key": ({"x": 1, "y": "abc", "z": [1.5, 2.5], "flag": None}, 20_000),
+    "wide list": ({"xs": list(range(200_000)), "name": "abc"}, 10),
+    "nested": (
+        {
+            "records": [
+                {"id": i, "tags": ["a", "b"], "scores": {"p": i / 7, "q": -i}}
+                for i in range(20_000)
+            ]
+        },
+        10,
+    ),
+}
+
+
+def main():
+    for name, (obj, number) in CASES.items():
+        assert two_pass_stringify(obj, version=2) == stringify(obj, version=2)
+        t_before = timeit.timeit(
+            lambda obj=obj: two_pass_stringify(obj, version=2), number=number
+        )
+        t_after = timeit.timeit(
+            lambda obj=obj: stringify(obj, version=2), number=number
+        )
+        size = len(stringify(obj, version=2))
+        print(
+            f"{name:>10}: two-pass {size * number / t_before / 1e6:8.2f}MB/s, "
+            f"stringify {size * number / t_after / 1e6:8.2f}MB/s "
+            f"({t_before / t_after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ from .cache import permacache
 from .cache_miss_error import CacheMissError, error_on_miss_global
 from .dict_function import drop_if, drop_if_equal
 from .hash import migrated_attrs, stable_hash, stringify
+from .hash_memo import HashMemo, hash_memo_global
 from .locked_shelf import close_all_caches, sync_all_caches
 from .no_cache import no_cache_global
 from .swap_unpickler import renamed_symbol_unpickler, swap_unpickler_context_manager
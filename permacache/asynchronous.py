@@ -0,0 +1,48 @@
+import asyncio
+import functools
+
+
+class AsyncState:
+    """
+    The state of a cached function used from a given event loop: the executor its
+    blocking operations run on, a semaphore bounding how many of them run at once,
+    and the computations currently in flight, by key.
+
+    :param executor: the executor to run blocking operations on, or None for the
+        loop's default executor.
+    :param concurrency: the maximum number of blocking operations to run at once,
+        or None for no limit beyond the executor's.
+    """
+
+    def __init__(self, executor=None, concurrency=None):
+        self.executor = executor
+        self.semaphore = None if concurrency is None else asyncio.Semaphore(concurrency)
+        self.flights = {}
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Run the given blocking function on the executor.
+        """
+        call = functools.partial(function, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            return await loop.run_in_executor(self.executor, call)
+        async with self.semaphore:
+            return await loop.run_in_executor(self.executor, call)
+
+    async def deduplicate(self, key, start):
+        """
+        Await the result of start(), a coroutine, unless a call for the same key is
+        already in flight, in which case await its result instead. The computation
+        is shielded, so cancelling one caller does not cancel it for the others.
+        """
+        task = self.flights.get(key)
+        if task is None:
+            task = self.flights[key] = asyncio.ensure_future(start())
+
+            def done(_):
+                if self.flights.get(key) is task:
+                    del self.flights[key]
+
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
@@ -1,6 +1,11 @@
+import asyncio
+import importlib
+import inspect
 import os
 import shutil
 import sys
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import wraps
 from pickle import UnpicklingError
 
@@ -14,14 +19,22 @@ from permacache.out_file_cache import (
     split_out_files,
 )
 
+from .asynchronous import AsyncState
 from .cache_miss_error import CacheMissError, error_on_miss, error_on_miss_global
 from .dict_function import dict_function, parallel_output
 from .hash import stringify
+from .lazy import SegmentedValue
 from .locked_shelf import IndividualFileLockedStore, LockedShelf
-from .utils import bind_arguments
+from .log_store import LogStore
+from .single_flight import SingleFlight
+from .sqlite_store import SQLiteStore
+from .utils import compile_binder
 
 CACHE = user_cache_dir("permacache")
 
+# keys prefetched under each acquisition of the lock, see CachedFunction.prefetch
+PREFETCH_CHUNK_SIZE = 256
+
 
 class CachedFunction:
     def __init__(
@@ -33,19 +46,42 @@ class CachedFunction:
         parallel,
         shelf_type="combined-file",
         stringify_version=None,
+        single_flight=False,
+        lazy=False,
+        async_executor=None,
+        async_concurrency=None,
+        executor=None,
+        chunk_size=None,
         **kwargs,
     ):
         self.function = function
         self.key_function = key_function
+        self._bind_arguments = compile_binder(function)
         self.parallel = parallel
         if shelf_type == "combined-file":
             self.shelf = LockedShelf(path, **kwargs)
         elif shelf_type == "individual-file":
             self.shelf = IndividualFileLockedStore(path, **kwargs)
+        elif shelf_type == "sqlite":
+            self.shelf = SQLiteStore(path, **kwargs)
+        elif shelf_type == "log":
+            self.shelf = LogStore(path, **kwargs)
         else:
             raise ValueError(f"Unknown shelf type {shelf_type}")
         self._error_on_miss = False
         self.stringify_version = stringify_version
+        if single_flight is True:
+            single_flight = SingleFlight(os.path.join(path, "leases"))
+        self.single_flight = single_flight or None
+        self.lazy = lazy
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.async_executor = async_executor
+        self.async_concurrency = async_concurrency
+        # by event loop, since asyncio primitives are bound to one
+        self._async_states = weakref.WeakKeyDictionary()
+        self._prefetch_pool = None
+        self._prefetch_pool_pid = None
 
     def _run_underlying(self, *args, **kwargs):
         if self._error_on_miss or error_on_miss_global.error_on_miss:
@@ -59,38 +95,243 @@ class CachedFunction:
         if no_cache_global.no_cache:
             return self._run_underlying(*args, **kwargs)
 
-        key = self.key_function(args, kwargs, parallel=self.parallel)
+        key = self._key(args, kwargs)
         if isinstance(key, parallel_output):
             return self.call_parallel(key.values, args, kwargs)
 
-        key = stringify(key, version=self.stringify_version)
+        found, value = self._lookup(key)
+        if found:
+            return value
+        if self.single_flight is None:
+            return self._compute_and_store(key, args, kwargs)
+        return self.single_flight.run(
+            key,
+            lambda: self._lookup(key),
+            lambda: self._compute_and_store(key, args, kwargs),
+        )
 
-        with self.shelf as db:
+    def _key(self, args, kwargs):
+        """
+        The stringified key of a call, or for a parallel call, a parallel_output of
+        the stringified keys of its elements.
+        """
+        stringify_parallel = getattr(self.key_function, "stringify_parallel", None)
+        if self.parallel and stringify_parallel is not None:
+            keys = stringify_parallel(
+                args, kwargs, parallel=self.parallel, version=self.stringify_version
+            )
+            return parallel_output(keys)
+        key = self.key_function(args, kwargs, parallel=self.parallel)
+        if isinstance(key, parallel_output):
+            return parallel_output(self._stringify_keys(key.values))
+        return stringify(key, version=self.stringify_version)
+
+    async def acall(self, *args, **kwargs):
+        """
+        Like calling the function, but awaitable: lock acquisition, reads, writes,
+        and computing the key run on async_executor (by default, the event loop's
+        default executor), at most async_concurrency of them at a time, so many
+        calls can be gathered without blocking the event loop. The function itself
+        also runs on the executor, unless it is an async function.
+
+        Concurrent calls for the same key, from the same event loop, share a
+        single lookup and computation.
+        """
+        state = self._async_state()
+        if no_cache_global.no_cache:
+            return await self._arun_underlying(state, args, kwargs)
+        key = await state.run(self._key, args, kwargs)
+        if isinstance(key, parallel_output):
+            return await self._acall_parallel(state, key.values, args, kwargs)
+        return await state.deduplicate(
+            key, lambda: self._acall_key(state, key, args, kwargs)
+        )
+
+    def _async_state(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_states:
+            self._async_states[loop] = AsyncState(
+                self.async_executor, self.async_concurrency
+            )
+        return self._async_states[loop]
+
+    async def _acall_key(self, state, key, args, kwargs):
+        found, value = await state.run(self._lookup, key)
+        if found:
+            return value
+        if self.single_flight is not None:
+            # the function is not async, see AsyncCachedFunction
+            return await state.run(
+                self.single_flight.run,
+                key,
+                lambda: self._lookup(key),
+                lambda: self._compute_and_store(key, args, kwargs),
+            )
+        value = await self._arun_underlying(state, args, kwargs)
+        await state.run(self._store, key, value)
+        return value
+
+    async def _arun_underlying(self, state, args, kwargs):
+        if not inspect.iscoroutinefunction(self.function):
+            return await state.run(self._run_underlying, *args, **kwargs)
+        if self._error_on_miss or error_on_miss_global.error_on_miss:
+            raise CacheMissError
+        return await self.function(*args, **kwargs)
+
+    async def _acall_parallel(self, state, keys, args, kwargs):
+        keys_for_indices, indices = await state.run(self._parallel_missing, keys)
+        values_for_indices = []
+        if indices and self.executor is not None:
+            await state.run(
+                self._compute_parallel_chunks, keys_for_indices, indices, args, kwargs
+            )
+            keys_for_indices = []
+        elif indices:
+            values_for_indices = await self._arun_underlying(
+                state, (), self._parallel_arguments(args, kwargs, indices)
+            )
+        return await state.run(
+            self._parallel_store, keys, keys_for_indices, values_for_indices
+        )
+
+    def _lookup(self, key):
+        unreadable = False
+        with self.shelf.reading() as db:
             if key in db:
                 try:
-                    return db[key]
+                    return True, self._from_stored(db[key])
+                except KeyError:
+                    # removed since, see IndividualFileLockedStore
+                    return False, None
                 except UnpicklingError as e:
                     # total hack. not sure why this is happening
                     print(f"Unpickling error: {e}", file=sys.stderr)
                     print(repr(key), file=sys.stderr)
                     print("Deleting key", file=sys.stderr)
+                    unreadable = True
+        if unreadable:
+            with self.shelf as db:
+                if key in db:
                     del db[key]
+        return False, None
+
+    def _compute_and_store(self, key, args, kwargs):
         value = self._run_underlying(*args, **kwargs)
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
         with self.shelf as db:
-            # TODO maybe check if key is now in db
-            db[key] = value
+            db[key] = self._to_stored(value)
+
+    def _to_stored(self, value):
+        if self.lazy:
+            return SegmentedValue.of(value)
+        return value
+
+    def _from_stored(self, value):
+        # a cache can be written with lazy=True and read without it, or vice versa
+        if isinstance(value, SegmentedValue):
+            return value.proxy() if self.lazy else value.materialize()
         return value
 
     def cache_contains(self, *args, **kwargs):
         key = self.key_function(args, kwargs, parallel=self.parallel)
         assert not isinstance(key, parallel_output), "not supported"
         key = stringify(key, version=self.stringify_version)
-        with self.shelf as db:
+        with self.shelf.reading() as db:
             return key in db
 
+    def prefetch(self, calls, *, background=True):
+        """
+        Load the cached values of the given calls, each an (args, kwargs) pair,
+        into the in-memory cache of the store, so that making the calls afterwards
+        does not read from disk. Returns a PrefetchReport of the calls that are not
+        cached, or with background=True, a future of it, so that the calls can be
+        made while it runs. The keys are loaded PREFETCH_CHUNK_SIZE at a time, each
+        chunk under its own lock, so that calls are not blocked for long.
+
+        For parallel functions, the report also lists the missing elements of each
+        call. Stores without an in-memory cache (shelf_type="individual-file") are
+        only checked for the keys. With multiprocess_safe, the default shelf keeps
+        its in-memory cache between accesses only with keep_open.
+        """
+        calls = [(tuple(args), dict(kwargs)) for args, kwargs in calls]
+        if not background:
+            return self._prefetch(calls)
+        if self._prefetch_pool is None or self._prefetch_pool_pid != os.getpid():
+            # a pool inherited through fork has no worker threads
+            self._prefetch_pool = ThreadPoolExecutor(
+                1, thread_name_prefix="permacache-prefetch"
+            )
+            self._prefetch_pool_pid = os.getpid()
+        return self._prefetch_pool.submit(self._prefetch, calls)
+
+    def _prefetch(self, calls):
+        keys_for_calls = []
+        for args, kwargs in calls:
+            key = self._key(args, kwargs)
+            keys_for_calls.append(
+                key.values if isinstance(key, parallel_output) else [key]
+            )
+        keys = list(dict.fromkeys(k for keys in keys_for_calls for k in keys))
+        present = set()
+        for start in range(0, len(keys), PREFETCH_CHUNK_SIZE):
+            with self.shelf.reading() as db:
+                chunk = [
+                    k for k in keys[start : start + PREFETCH_CHUNK_SIZE] if k in db
+                ]
+                if self.shelf.cache is not None:
+                    chunk = self._load_into_cache(db, chunk)
+            present.update(chunk)
+        return PrefetchReport(
+            [
+                [i for i, k in enumerate(keys) if k not in present]
+                for keys in keys_for_calls
+            ],
+            len(present),
+        )
+
+    @staticmethod
+    def _load_into_cache(db, keys):
+        """
+        Load the given keys into the in-memory cache of db, returning those that
+        could be read. Those that cannot are left to the call, see _lookup.
+        """
+        try:
+            db.get_multiple(keys)
+            return keys
+        except UnpicklingError:
+            pass
+        loaded = []
+        for key in keys:
+            try:
+                db[key]  # pylint: disable=pointless-statement
+            except UnpicklingError:
+                continue
+            loaded.append(key)
+        return loaded
+
     def call_parallel(self, keys, args, kwargs):
-        keys = [stringify(key, version=self.stringify_version) for key in keys]
-        with self.shelf as db:
+        keys_for_indices, indices = self._parallel_missing(keys)
+        if not indices:
+            values_for_indices = []
+        elif self.executor is not None:
+            self._compute_parallel_chunks(keys_for_indices, indices, args, kwargs)
+            keys_for_indices, values_for_indices = [], []
+        else:
+            arguments = self._parallel_arguments(args, kwargs, indices)
+            values_for_indices = self._run_underlying(**arguments)
+        return self._parallel_store(keys, keys_for_indices, values_for_indices)
+
+    def _stringify_keys(self, keys):
+        return [stringify(key, version=self.stringify_version) for key in keys]
+
+    def _parallel_missing(self, keys):
+        """
+        The keys that are not in the cache, each once, and their first indices.
+        """
+        with self.shelf.reading() as db:
             keys_to_run = {k for k in set(keys) if k not in db}
         indices = []
         keys_for_indices = []
@@ -100,21 +341,105 @@ class CachedFunction:
                 indices.append(i)
                 keys_for_indices.append(k)
         assert not keys_to_run
-        if not indices:
-            values_for_indices = []
-        else:
-            arguments = bind_arguments(self.function, args, kwargs)
-            arguments = arguments.copy()
-            for k in self.parallel:
-                arg = arguments[k]
-                arg = [arg[i] for i in indices]
-                arguments[k] = arg
+        return keys_for_indices, indices
 
-            values_for_indices = self._run_underlying(**arguments)
+    def _parallel_arguments(self, args, kwargs, indices):
+        arguments = self._bind_arguments(args, kwargs)
+        arguments = arguments.copy()
+        for k in self.parallel:
+            arg = arguments[k]
+            arg = [arg[i] for i in indices]
+            arguments[k] = arg
+        return arguments
+
+    def _parallel_store(self, keys, keys_for_indices, values_for_indices):
         with self.shelf as db:
-            for k, v in zip(keys_for_indices, values_for_indices):
-                db[k] = v
-            return db.get_multiple(keys)
+            db.set_multiple(
+                (k, self._to_stored(v))
+                for k, v in zip(keys_for_indices, values_for_indices)
+            )
+            return [self._from_stored(v) for v in db.get_multiple(keys)]
+
+    def _compute_parallel_chunks(self, keys_for_indices, indices, args, kwargs):
+        """
+        Compute the values at the given indices on the executor, in chunks of
+        chunk_size, storing the values of each chunk as soon as it is done. If a
+        chunk fails, the chunks that have not started are cancelled, those that
+        have are still stored, and the first error is raised.
+        """
+        if self._error_on_miss or error_on_miss_global.error_on_miss:
+            raise CacheMissError
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            chunk_size = -(-len(indices) // (os.cpu_count() or 1))
+        if isinstance(self.executor, ThreadPoolExecutor):
+            function = self.function
+        else:
+            function = UnderlyingFunction(self.function)
+        futures = {}
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start : start + chunk_size]
+            future = self.executor.submit(
+                function, **self._parallel_arguments(args, kwargs, chunk)
+            )
+            futures[future] = keys_for_indices[start : start + chunk_size]
+        error = None
+        for future in as_completed(futures):
+            try:
+                values = future.result()
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                if error is None:
+                    error = e
+                    for other in futures:
+                        other.cancel()
+                continue
+            values = list(values)
+            assert len(values) == len(futures[future]), "wrong number of results"
+            with self.shelf as db:
+                db.set_multiple(
+                    (k, self._to_stored(v)) for k, v in zip(futures[future], values)
+                )
+        if error is not None:
+            raise error
+
+
+class UnderlyingFunction:
+    """
+    A reference to the function underlying a cached function, by module and name,
+    so that it can be sent to another process even though the name refers to the
+    cached function rather than to the function itself.
+    """
+
+    def __init__(self, function):
+        self.module = function.__module__
+        self.qualname = function.__qualname__
+
+    def __call__(self, *args, **kwargs):
+        function = importlib.import_module(self.module)
+        for name in self.qualname.split("."):
+            function = getattr(function, name)
+        if isinstance(function, CachedFunction):
+            function = function.function
+        return function(*args, **kwargs)
+
+
+class PrefetchReport:
+    """
+    The result of CachedFunction.prefetch.
+
+    missing_elements[i] lists the indices of the elements of the ith call that are
+        not cached, which for a function that is not parallel is [0] or [].
+    missing lists the indices of the calls with any element that is not cached.
+    loaded is the number of distinct keys that were found.
+    """
+
+    def __init__(self, missing_elements, loaded):
+        self.missing_elements = missing_elements
+        self.missing = [i for i, elements in enumerate(missing_elements) if elements]
+        self.loaded = loaded
+
+    def __repr__(self):
+        return f"PrefetchReport(missing={self.missing!r}, loaded={self.loaded!r})"
 
 
 class FileCachedFunction(CachedFunction):
@@ -124,6 +449,8 @@ class FileCachedFunction(CachedFunction):
 
     def __init__(self, *args, out_files, **kwargs):
         super().__init__(*args, **kwargs)
+        assert self.single_flight is None, "single_flight is not supported"
+        assert not self.lazy, "lazy is not supported"
         self.out_files = out_files
 
     def __call__(self, *args, **kwargs):
@@ -135,7 +462,7 @@ class FileCachedFunction(CachedFunction):
 
         key = stringify(key, version=self.stringify_version)
 
-        with self.shelf as db:
+        with self.shelf.reading() as db:
             if key in db:
                 result, file_cache_info = db[key]
                 file_cache_info, success = do_copy_files(file_cache_info, out_files)
@@ -153,6 +480,32 @@ class FileCachedFunction(CachedFunction):
         del args, kwargs
         raise NotImplementedError("not implemented for outfile cache")
 
+    def prefetch(self, calls, *, background=True):
+        del calls, background
+        raise NotImplementedError("not implemented for outfile cache")
+
+    async def acall(self, *args, **kwargs):
+        del args, kwargs
+        raise NotImplementedError("not implemented for outfile cache")
+
+
+class AsyncCachedFunction(CachedFunction):
+    """
+    Like CachedFunction, but for async functions: calling it returns a coroutine,
+    see acall.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert (
+            self.single_flight is None
+        ), "single_flight is not supported for async functions"
+        # the executor would only create the coroutines, the event loop runs them
+        assert self.executor is None, "executor is not supported for async functions"
+
+    def __call__(self, *args, **kwargs):
+        return self.acall(*args, **kwargs)
+
 
 def permacache(path, key_function=None, *, parallel=(), out_file=None, **kwargs):
     if key_function is None:
@@ -169,11 +522,18 @@ def permacache(path, key_function=None, *, parallel=(), out_file=None, **kwargs)
         if isinstance(kf, dict):
             kf = dict_function(kf, f)
         if out_file is not None:
+            assert not inspect.iscoroutinefunction(
+                f
+            ), "out_file is not supported for async functions"
             return wraps(f)(
                 FileCachedFunction(
                     f, kf, path, parallel=parallel, out_files=out_file, **kwargs
                 )
             )
+        if inspect.iscoroutinefunction(f):
+            return wraps(f)(
+                AsyncCachedFunction(f, kf, path, parallel=parallel, **kwargs)
+            )
         return wraps(f)(CachedFunction(f, kf, path, parallel=parallel, **kwargs))
 
     return annotator
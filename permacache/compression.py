@@ -0,0 +1,212 @@
+import gzip
+import os
+import threading
+import uuid
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+
+# a dictionary is only worth it if its size is small compared to what it compresses
+DEFAULT_DICTIONARY_SIZE = 112640
+
+
+class GzipCodec:
+    """
+    Compresses values with gzip, from the standard library. Slow, but always
+    available.
+    """
+
+    name = "gzip"
+    magic = GZIP_MAGIC
+
+    def __init__(self, level=None):
+        self.level = 9 if level is None else level
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+
+class ZstdCodec:
+    """
+    Compresses values with zstd, using the zstandard package.
+
+    If a dictionary directory is given, dictionaries trained with train() are stored
+    in it, and the most recently trained one is used to compress. Each compressed
+    value records the id of the dictionary it was compressed with, so values
+    compressed with older dictionaries (or none) remain readable.
+    """
+
+    name = "zstd"
+    magic = ZSTD_MAGIC
+
+    def __init__(self, level=None, dictionary_directory=None):
+        # pylint: disable=import-outside-toplevel
+        import zstandard
+
+        self.zstandard = zstandard
+        self.level = 3 if level is None else level
+        self.dictionary_directory = dictionary_directory
+        self.dictionaries = {}
+        self.current_dictionary = None
+        # compressors and decompressors cannot be used by several threads at once
+        self.local = threading.local()
+        self._load_current_dictionary()
+
+    def _current_path(self):
+        return os.path.join(self.dictionary_directory, "current")
+
+    def _dictionary_path(self, dict_id):
+        return os.path.join(self.dictionary_directory, f"{dict_id}.zdict")
+
+    def _load_dictionary(self, dict_id):
+        if dict_id not in self.dictionaries:
+            with open(self._dictionary_path(dict_id), "rb") as f:
+                self.dictionaries[dict_id] = self.zstandard.ZstdCompressionDict(
+                    f.read()
+                )
+        return self.dictionaries[dict_id]
+
+    def _load_current_dictionary(self):
+        if self.dictionary_directory is None:
+            return
+        try:
+            with open(self._current_path()) as f:
+                dict_id = int(f.read())
+        except FileNotFoundError:
+            return
+        if self.current_dictionary != dict_id:
+            self._load_dictionary(dict_id)
+            self.current_dictionary = dict_id
+
+    def _thread_local(self, name):
+        if not hasattr(self.local, name):
+            setattr(self.local, name, {})
+        return getattr(self.local, name)
+
+    def _compressor(self):
+        compressors = self._thread_local("compressors")
+        dict_id = self.current_dictionary
+        if dict_id not in compressors:
+            dictionary = None if dict_id is None else self.dictionaries[dict_id]
+            compressors[dict_id] = self.zstandard.ZstdCompressor(
+                level=self.level, dict_data=dictionary
+            )
+        return compressors[dict_id]
+
+    def _decompressor(self, dict_id):
+        decompressors = self._thread_local("decompressors")
+        if dict_id not in decompressors:
+            dictionary = self._load_dictionary(dict_id) if dict_id else None
+            decompressors[dict_id] = self.zstandard.ZstdDecompressor(
+                dict_data=dictionary
+            )
+        return decompressors[dict_id]
+
+    def compress(self, data):
+        return self._compressor().compress(data)
+
+    def decompress(self, data):
+        dict_id = self.zstandard.get_frame_parameters(data).dict_id
+        return self._decompressor(dict_id).decompress(data)
+
+    def train(self, samples, dict_size=DEFAULT_DICTIONARY_SIZE):
+        """
+        Train a dictionary on the given samples, uncompressed values, and use it to
+        compress from now on. Returns the id of the dictionary.
+        """
+        assert (
+            self.dictionary_directory is not None
+        ), "codec does not have a dictionary directory"
+        dictionary = self.zstandard.train_dictionary(
+            dict_size, list(samples), level=self.level
+        )
+        dict_id = dictionary.dict_id()
+        os.makedirs(self.dictionary_directory, exist_ok=True)
+        for path, content in [
+            (self._dictionary_path(dict_id), dictionary.as_bytes()),
+            (self._current_path(), str(dict_id).encode("utf-8")),
+        ]:
+            temporary_path = path + "." + uuid.uuid4().hex[:10]
+            with open(temporary_path, "wb") as f:
+                f.write(content)
+            os.replace(temporary_path, path)
+        self.dictionaries[dict_id] = dictionary
+        self.current_dictionary = dict_id
+        return dict_id
+
+
+class Lz4Codec:
+    """
+    Compresses values with lz4, using the lz4 package. Compresses less than zstd,
+    but decompresses faster.
+    """
+
+    name = "lz4"
+    magic = LZ4_MAGIC
+
+    def __init__(self, level=None):
+        # pylint: disable=import-outside-toplevel
+        import lz4.frame
+
+        self.lz4_frame = lz4.frame
+        self.level = 0 if level is None else level
+
+    def compress(self, data):
+        return self.lz4_frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return self.lz4_frame.decompress(data)
+
+
+CODECS = {"gzip": GzipCodec, "zstd": ZstdCodec, "lz4": Lz4Codec}
+
+
+def create_codec(name, level=None, dictionary_directory=None):
+    """
+    Create the codec with the given name, one of gzip, zstd, or lz4, or None for no
+    compression. Dictionaries are only supported by zstd.
+    """
+    if name is None:
+        return None
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression {name}, must be one of {list(CODECS)}")
+    if name == "zstd":
+        return ZstdCodec(level, dictionary_directory)
+    return CODECS[name](level)
+
+
+class CompressedValues:
+    """
+    Compresses values on write with the given compression, if any, and decompresses
+    them on read, whichever codec they were compressed with. Values are told apart
+    by the magic number at the start of each codec's frames, which a pickle never
+    starts with, so uncompressed values remain readable.
+    """
+
+    def __init__(self, compression=None, level=None, dictionary_directory=None):
+        self.level = level
+        self.dictionary_directory = dictionary_directory
+        self.codecs = {}
+        self.codec = None if compression is None else self._codec(compression)
+
+    def _codec(self, name):
+        if name not in self.codecs:
+            self.codecs[name] = create_codec(
+                name, self.level, self.dictionary_directory
+            )
+        return self.codecs[name]
+
+    def compress(self, data):
+        if self.codec is None:
+            return data
+        return self.codec.compress(data)
+
+    def decompress(self, data):
+        for name, codec_type in CODECS.items():
+            if data[: len(codec_type.magic)] == codec_type.magic:
+                return self._codec(name).decompress(data)
+        return data
@@ -1,10 +1,13 @@
 from dataclasses import dataclass
 from typing import List
 
-from .utils import bind_arguments, parallelize_arguments
+from .hash import stringify, stringify_rows
+from .utils import compile_binder, parallel_columns, parallelize_arguments
 
 DEFAULT_FUNCTIONS = {None: lambda x: None}
 
+_DROPPED = object()
+
 
 class drop_if:
     def __init__(self, predicate, mapper=lambda x: x):
@@ -21,9 +24,38 @@ def drop_if_equal(value, mapper=lambda x: x):
     return drop_if(lambda x: x == value, mapper)
 
 
+def compile_transform(spec):
+    """
+    Turn one value of a dict_function specification into a function from the
+    argument to its key, returning _DROPPED if the argument is to be left out.
+    """
+    if isinstance(spec, drop_if):
+
+        def transform(v):
+            if spec.predicate(v):
+                return _DROPPED
+            return spec.mapper(v)
+
+        return transform
+    if callable(spec):
+        return spec
+    if spec in DEFAULT_FUNCTIONS:
+        return DEFAULT_FUNCTIONS[spec]
+
+    def unknown(v):
+        # fail only once the argument is actually seen, as before
+        return DEFAULT_FUNCTIONS[spec](v)
+
+    return unknown
+
+
 def dict_function(d, fn):
+    bind_arguments = compile_binder(fn)
+    transforms = {k: compile_transform(spec) for k, spec in d.items()}
+    droppable = {k for k, spec in d.items() if isinstance(spec, drop_if)}
+
     def key(args, kwargs, *, parallel=()):
-        arguments = bind_arguments(fn, args, kwargs)
+        arguments = bind_arguments(args, kwargs)
         if not parallel:
             return bind(arguments)
         all_args = parallelize_arguments(arguments, parallel)
@@ -32,16 +64,39 @@ def dict_function(d, fn):
     def bind(arguments):
         result = {}
         for k, v in arguments.items():
-            if k in d:
-                if isinstance(d[k], drop_if):
-                    if d[k].predicate(v):
-                        continue
-                    v = d[k].mapper(v)
-                elif callable(d[k]):
-                    v = d[k](v)
-                else:
-                    v = DEFAULT_FUNCTIONS[d[k]](v)
+            transform = transforms.get(k)
+            if transform is not None:
+                v = transform(v)
+                if v is _DROPPED:
+                    continue
             result[k] = v
         return result
 
+    def stringify_parallel(args, kwargs, *, parallel, version):
+        """
+        Equivalent to stringifying each of key(args, kwargs, parallel=parallel).values,
+        but the arguments that are not parallel are only bound and encoded once.
+        """
+        arguments = bind_arguments(args, kwargs)
+        columns = {}
+        for k, column in zip(parallel, parallel_columns(arguments, parallel)):
+            transform = transforms.get(k)
+            if transform is not None:
+                column = [transform(v) for v in column]
+            columns[k] = column
+        shared = bind({k: v for k, v in arguments.items() if k not in columns})
+        if any(v is _DROPPED for k in droppable & set(columns) for v in columns[k]):
+            # the keys do not all have the same arguments, encode them one by one
+            return [
+                stringify(
+                    {**shared, **{k: v for k, v in row.items() if v is not _DROPPED}},
+                    version=version,
+                )
+                for row in (
+                    dict(zip(columns, values)) for values in zip(*columns.values())
+                )
+            ]
+        return stringify_rows(shared, columns, version=version)
+
+    key.stringify_parallel = stringify_parallel
     return key
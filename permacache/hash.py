@@ -1,60 +1,93 @@
+import contextvars
 import enum
+import functools
 import hashlib
 import json
 import numbers
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from json.encoder import encode_basestring_ascii
 from types import SimpleNamespace
 
+from .hash_memo import hash_memo_global
+
 valid_versions = [None, 1, 2]
 
+# buffers smaller than this are not worth handing to another thread
+PARALLEL_HASH_MIN_BYTES = 2**20
+
+# digests computed ahead of time by stable_hash(..., threads=n), see prehash_buffers
+_prehashed_digests = contextvars.ContextVar("prehashed_digests", default=None)
+
+
+def encode_module_legacy(o):
+    return {
+        ".type": "Module",
+        "hash": dict(
+            other_dict={k: v for k, v in o.__dict__.items() if not k.startswith("_")},
+            state_dict=o.state_dict(),
+        ),
+    }
+
+
+def encode_module(o, *, version):
+    if version is None:
+        warnings.warn(
+            "Using legacy encoding for torch.nn.Module; this is dangerous as it "
+            "does not uniquely identify the module's state. "
+            "To preserve this behavior, set version=1. To use the new encoding, set version>=2.",
+            source="permacache",
+            category=FutureWarning,
+        )
+        return encode_module_legacy(o)
+
+    if version == 1:
+        return encode_module_legacy(o)
+    assert version >= 2, "unreachable"
+    o_contents = {
+        k: v
+        for k, v in o.__dict__.items()
+        if not (k.startswith("_") and (set(k.split("_")) & {"hook", "hooks"}))
+        and not k == "_non_persistent_buffers_set"
+    }
+    o_contents = {k: stable_hash(v, version=version) for k, v in o_contents.items()}
+    o_contents = sorted(o_contents.items())
+    return {
+        ".type": o.__class__.__module__ + "." + o.__class__.__name__,
+        "elements": o_contents,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def make_json_encoder(fast_bytes, version, fix_dictionaries=True):
+    """
+    Produce the encoder class used by stringify. Memoized, since the class only
+    depends on its arguments.
 
-def make_json_encoder(fast_bytes, version):
+    :param fix_dictionaries: whether default() should run fix_dictionary over the
+        objects it produces. See stringify for when this can be turned off.
+    """
     if version not in valid_versions:
         raise ValueError(
             f"stringify/stable_hash version must be one of {valid_versions}"
         )
 
-    def encode_module_legacy(o):
-        return {
-            ".type": "Module",
-            "hash": dict(
-                other_dict={
-                    k: v for k, v in o.__dict__.items() if not k.startswith("_")
-                },
-                state_dict=o.state_dict(),
-            ),
-        }
-
-    def encode_module(o):
-        if version is None:
-            warnings.warn(
-                "Using legacy encoding for torch.nn.Module; this is dangerous as it "
-                "does not uniquely identify the module's state. "
-                "To preserve this behavior, set version=1. To use the new encoding, set version>=2.",
-                source="permacache",
-                category=FutureWarning,
-            )
-            return encode_module_legacy(o)
-
-        if version == 1:
-            return encode_module_legacy(o)
-        assert version >= 2, "unreachable"
-        o_contents = {
-            k: v
-            for k, v in o.__dict__.items()
-            if not (k.startswith("_") and (set(k.split("_")) & {"hook", "hooks"}))
-            and not k == "_non_persistent_buffers_set"
-        }
-        o_contents = {k: stable_hash(v, version=version) for k, v in o_contents.items()}
-        o_contents = sorted(o_contents.items())
-        return {
-            ".type": o.__class__.__module__ + "." + o.__class__.__name__,
-            "elements": o_contents,
-        }
-
     class TensorEncoder(json.JSONEncoder):
 
         def default(self, o):
+            o, fix = self.convert(o)
+            return fix_dictionary(o, version=version) if fix and fix_dictionaries else o
+
+        def convert(self, o, keep_bytes=False):
+            """
+            Convert o into something json can encode. Returns the converted object and
+            whether it should go through fix_dictionary (the pandas and enum encodings
+            never have).
+
+            :param keep_bytes: if fast_bytes is off, return byte strings, arrays and
+                tensors as a ByteBuffer rather than as the string representation of
+                their bytes, so they can be streamed.
+            """
             original = o
             if hasattr(type(o), "__permacache_hash__"):
                 o = {".custom": True, "content": type(o).__permacache_hash__(o)}
@@ -78,50 +111,52 @@ def make_json_encoder(fast_bytes, version):
                 and type(o).__name__ == "Parameter"
             ):
                 o = o.data
-            o = best_effort_to_bytes(o)
-            if isinstance(o, bytes):
+            buffer = best_effort_to_buffer(o)
+            if buffer is not None:
                 if fast_bytes:
-                    o = hashlib.sha256(o).hexdigest()
+                    o = buffer.sha256()
+                elif keep_bytes:
+                    return buffer, False
                 else:
-                    o = str(o)
+                    o = str(buffer.tobytes())
             if isinstance(o, range):
                 o = {".type": "range", "representation": str(o)}
             if isinstance(o, type):
                 o = {".type": "type", "name": o.__module__ + "." + o.__qualname__}
-            if self.isinstance_str(o, "Module"):
-                o = encode_module(o)
-            if self.isinstance_str(o, "DataFrame"):
+            if isinstance_str(o, "Module"):
+                o = encode_module(o, version=version)
+            if isinstance_str(o, "DataFrame"):
                 return {
                     ".type": "pandas.DataFrame",
                     "columns": list(o),
                     "values": {k: o[k] for k in o},
-                }
-            if self.isinstance_str(o, "Series"):
+                }, False
+            if isinstance_str(o, "Series"):
                 return {
                     ".type": "pandas.Series",
                     "index": list(o.index),
                     "values": list(o),
-                }
+                }, False
             if isinstance(o, enum.Enum):
                 return {
                     ".type": "enum",
                     "enum.name": type(o).__name__,
                     "enum.value": o.value,
-                }
-            o = fix_dictionary(o, version=version)
+                }, False
             if o is original:
-                return super().default(o)
-            return o
-
-        def isinstance_str(self, obj, str_type):
-            try:
-                return any(x.__name__ == str_type for x in type(obj).mro())
-            except TypeError:
-                return False
+                return super().default(o), False
+            return o, True
 
     return TensorEncoder
 
 
+def isinstance_str(obj, str_type):
+    try:
+        return any(x.__name__ == str_type for x in type(obj).mro())
+    except TypeError:
+        return False
+
+
 def fix_dictionary(obj, *, version):
     """
     Fix dictionaries with non-json keys.
@@ -155,18 +190,435 @@ def best_effort_to_bytes(obj):
     return obj
 
 
+class ByteBuffer:
+    """
+    The bytes best_effort_to_bytes would produce for an object, made available in
+    chunks so that arrays never have to be copied in full.
+
+    C-contiguous arrays are exposed directly through the buffer protocol, other
+    arrays are copied a bounded number of bytes at a time.
+    """
+
+    def __init__(self, contents, source=None):
+        # either a bytes object or a numpy array
+        self.contents = contents
+        # the array or tensor the contents come from, if any
+        self.source = source
+
+    def chunks(self, chunk_size=2**22):
+        """
+        Buffers whose concatenation is the contents as bytes, in C order.
+        """
+        if isinstance(self.contents, bytes):
+            yield self.contents
+        else:
+            yield from _array_chunks(self.contents, chunk_size)
+
+    def contents_nbytes(self):
+        if isinstance(self.contents, bytes):
+            return len(self.contents)
+        return self.contents.nbytes
+
+    def tobytes(self):
+        if isinstance(self.contents, bytes):
+            return self.contents
+        return self.contents.tobytes()
+
+    def identity(self):
+        """
+        Identifies the memory the contents are in, which is shared by all the
+        arrays and tensors viewing it the same way.
+        """
+        if isinstance(self.contents, bytes):
+            return ("bytes", id(self.contents))
+        array = self.contents
+        return (
+            array.__array_interface__["data"][0],
+            array.shape,
+            array.strides,
+            array.dtype.str,
+        )
+
+    def sha256(self):
+        prehashed = _prehashed_digests.get()
+        if prehashed is not None and self.contents_nbytes() >= PARALLEL_HASH_MIN_BYTES:
+            digest = prehashed.get(self.identity())
+            if digest is not None:
+                return digest
+        memo = hash_memo_global.memo
+        if memo is not None and self.source is not None:
+            return memo.digest(self.source, self.contents.nbytes, self._sha256)
+        return self._sha256()
+
+    def _sha256(self):
+        hasher = hashlib.sha256()
+        for chunk in self.chunks():
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+def _array_chunks(array, chunk_size):
+    if array.flags.c_contiguous or array.size == 0:
+        yield _uint8_view(array)
+        return
+    row_bytes = array[0].nbytes
+    if array.ndim == 1 or row_bytes <= chunk_size:
+        rows = max(1, chunk_size // row_bytes)
+        for start in range(0, len(array), rows):
+            yield _uint8_view(array[start : start + rows].copy(order="C"))
+    else:
+        for row in array:
+            yield from _array_chunks(row, chunk_size)
+
+
+def _uint8_view(array):
+    """
+    View of a C-contiguous array's memory as a flat uint8 array, which can be
+    hashed without copying, whatever the dtype of the array.
+    """
+    try:
+        return array.reshape(-1).view("uint8")
+    except (TypeError, ValueError):
+        return array.tobytes()
+
+
+def best_effort_to_buffer(obj):
+    """
+    Like best_effort_to_bytes, but returns a ByteBuffer that does not copy the
+    contents of arrays and tensors, or None if obj has no byte representation.
+    """
+    source = obj
+    if type(obj).__module__ == "torch" and type(obj).__name__ == "Tensor":
+        if obj.is_cuda:
+            obj = obj.cpu()
+        obj = obj.detach().numpy()
+    if (
+        type(obj).__module__ == "numpy"
+        and type(obj).__name__ == "ndarray"
+        and not obj.dtype.hasobject
+    ):
+        return ByteBuffer(obj, source=source)
+    obj = best_effort_to_bytes(obj)
+    if isinstance(obj, bytes):
+        return ByteBuffer(obj)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def json_encoder(fast_bytes, version, fix_dictionaries):
+    """
+    A shared instance of the encoder, these are stateless between calls to encode.
+    """
+    return make_json_encoder(fast_bytes, version, fix_dictionaries)(sort_keys=True)
+
+
 def stringify(obj, *, version, fast_bytes=False):
-    return json.dumps(
-        fix_dictionary(obj, version=version),
-        cls=make_json_encoder(fast_bytes=fast_bytes, version=version),
-        sort_keys=True,
+    """
+    Canonical json representation of obj.
+
+    The output is defined as json.dumps of fix_dictionary(obj), but that requires
+    a full python-level copy of obj before encoding. Instead, we first encode obj
+    directly, in one pass of the C encoder. This produces the same output unless
+    some dictionary would have been rewritten by fix_dictionary, i.e., it has a
+    key that is not a string or a number. The json encoder rejects all such keys
+    except None, which it writes as "null". So if encoding fails, or a "null" key
+    shows up in the output, we fall back to the full computation.
+    """
+    encoder = json_encoder(fast_bytes, version, fix_dictionaries=False)
+    try:
+        result = encoder.encode(obj)
+    except (TypeError, ValueError):
+        result = None
+    if result is None or '"null": ' in result:
+        encoder = json_encoder(fast_bytes, version, fix_dictionaries=True)
+        result = encoder.encode(fix_dictionary(obj, version=version))
+    return result
+
+
+def stringify_rows(shared, columns, *, version, fast_bytes=False):
+    """
+    Equivalent to [stringify({**shared, **row}, ...) for row in rows], where the
+    rows are the dictionaries from the names of the columns to the i-th element of
+    each column, for many rows at once.
+
+    Since json.dumps of a dictionary with string keys is the concatenation of the
+    encodings of its values, with the keys in sorted order, the values in shared
+    are only encoded once, into a template that the encoded elements of the
+    columns are then substituted into. Strings, numbers, booleans and None are
+    encoded directly, anything else with stringify.
+
+    :param shared: the entries common to all rows, as a dictionary with string keys.
+    :param columns: dictionary from names, distinct from those in shared, to lists
+        of the same length.
+    """
+    # validates the version, even if nothing below needs the encoder
+    json_encoder(fast_bytes, version, fix_dictionaries=False)
+    names = sorted([*shared, *columns])
+    template = []
+    for name in names:
+        if name in columns:
+            value = "%s"
+        else:
+            value = stringify(shared[name], version=version, fast_bytes=fast_bytes)
+            value = value.replace("%", "%%")
+        entry = encode_basestring_ascii(name).replace("%", "%%") + ": " + value
+        template.append(entry)
+    template = "{" + ", ".join(template) + "}"
+    encoded = [
+        [_stringify_element(x, version, fast_bytes) for x in columns[name]]
+        for name in names
+        if name in columns
+    ]
+    if not encoded:
+        return []
+    return [template % row for row in zip(*encoded)]
+
+
+def _stringify_element(x, version, fast_bytes):
+    """
+    stringify(x, ...), skipping the encoder for the types json encodes natively.
+    Subclasses of these types are left to stringify, as json does not always
+    encode them the same way.
+    """
+    kind = type(x)
+    if kind is str:
+        return encode_basestring_ascii(x)
+    if kind is int:
+        return int.__repr__(x)
+    if kind is float:
+        return _floatstr(x)
+    if kind is bool:
+        return "true" if x else "false"
+    if x is None:
+        return "null"
+    return stringify(x, version=version, fast_bytes=fast_bytes)
+
+
+def iter_stringify(obj, *, version, fast_bytes=False):
+    """
+    Like stringify, but produces the output in chunks, so that it never has to be
+    held in memory all at once. "".join(iter_stringify(obj, ...)) is always equal
+    to stringify(obj, ...).
+
+    Byte buffers that are included in full (fast_bytes=False) are also streamed,
+    so the only large allocation left is the buffer itself.
+    """
+    encoder = json_encoder(fast_bytes, version, fix_dictionaries=True)
+    return _iterencode(obj, encoder=encoder, version=version, fix=True)
+
+
+def _iterencode(o, *, encoder, version, fix):
+    """
+    Generator version of json.dumps(fix_dictionary(o), sort_keys=True) where
+    fix_dictionary is only applied if fix is set.
+    """
+    if isinstance(o, str):
+        yield encode_basestring_ascii(o)
+    elif o is None:
+        yield "null"
+    elif o is True:
+        yield "true"
+    elif o is False:
+        yield "false"
+    elif isinstance(o, int):
+        yield int.__repr__(o)
+    elif isinstance(o, float):
+        yield _floatstr(o)
+    elif isinstance(o, (list, tuple)):
+        if not o:
+            yield "[]"
+            return
+        separator = "["
+        for x in o:
+            yield separator
+            separator = ", "
+            yield from _iterencode(x, encoder=encoder, version=version, fix=fix)
+        yield "]"
+    elif isinstance(o, dict):
+        if fix and any(not isinstance(k, (str, numbers.Number)) for k in o):
+            o = {
+                ".fixed_dictionary_nonjson_keys": True,
+                "contents": {
+                    stringify(k, fast_bytes=True, version=version): v
+                    for k, v in o.items()
+                },
+            }
+        if not o:
+            yield "{}"
+            return
+        separator = "{"
+        for k, v in sorted(o.items()):
+            yield separator
+            separator = ", "
+            yield encode_basestring_ascii(_keystr(k))
+            yield ": "
+            yield from _iterencode(v, encoder=encoder, version=version, fix=fix)
+        yield "}"
+    else:
+        o, fix = encoder.convert(o, keep_bytes=True)
+        if isinstance(o, ByteBuffer):
+            yield from _iterencode_bytes(o)
+        else:
+            yield from _iterencode(o, encoder=encoder, version=version, fix=fix)
+
+
+def _floatstr(o):
+    if o != o:  # pylint: disable=comparison-with-itself
+        return "NaN"
+    if o == float("inf"):
+        return "Infinity"
+    if o == float("-inf"):
+        return "-Infinity"
+    return float.__repr__(o)
+
+
+def _keystr(key):
+    """
+    Convert a dictionary key the way json does.
+    """
+    if isinstance(key, str):
+        return key
+    if isinstance(key, float):
+        return _floatstr(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, int):
+        return int.__repr__(key)
+    raise TypeError(
+        f"keys must be str, int, float, bool or None, not {key.__class__.__name__}"
     )
 
 
-def stable_hash(obj, *, version=None, fast_bytes=True):
-    return hashlib.sha256(
-        stringify(obj, fast_bytes=fast_bytes, version=version).encode("utf-8")
-    ).hexdigest()
+def _iterencode_bytes(buffer, chunk_size=2**20):
+    """
+    Equivalent to encode_basestring_ascii(str(buffer.tobytes())), in chunks.
+
+    The repr of a chunk is the same as the corresponding part of the repr of the
+    whole, except that the two might pick different quote characters. That only
+    matters when the chunk contains ' but not ", while the whole contains both;
+    the chunk then uses double quotes and leaves its ' unescaped.
+    """
+    has_single = has_double = False
+    for piece in _pieces(buffer, chunk_size):
+        has_single = has_single or b"'" in piece
+        has_double = has_double or b'"' in piece
+    quote = '"' if has_single and not has_double else "'"
+    yield '"' + encode_basestring_ascii("b" + quote)[1:-1]
+    for piece in _pieces(buffer, chunk_size):
+        chunk = repr(piece)
+        body = chunk[2:-1]
+        if chunk[1] != quote:
+            body = body.replace("'", "\\'")
+        yield encode_basestring_ascii(body)[1:-1]
+    yield encode_basestring_ascii(quote)[1:-1] + '"'
+
+
+def _pieces(buffer, size):
+    """
+    The contents of the buffer, as bytes objects of at most the given size.
+    """
+    for chunk in buffer.chunks():
+        view = memoryview(chunk).cast("B")
+        for start in range(0, len(view), size):
+            yield bytes(view[start : start + size])
+
+
+def large_buffers(obj, min_bytes=PARALLEL_HASH_MIN_BYTES):
+    """
+    Find the arrays and tensors of at least min_bytes that encoding obj will hash,
+    as a dictionary from ByteBuffer.identity() to ByteBuffer.
+
+    This is best effort: it looks through containers, dataclasses, attrs classes,
+    namespaces and torch modules, and anything it misses is just hashed when it
+    is encountered during encoding. CUDA tensors are always left to the encoding,
+    as their identities are those of temporary copies.
+    """
+    result = {}
+    seen = set()
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, (str, bytes, int, float, type(None))):
+            continue
+        seen.add(id(o))
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+        elif hasattr(o, "__attrs_attrs__"):
+            stack.extend(getattr(o, a.name) for a in o.__attrs_attrs__)
+        elif hasattr(o, "__dataclass_fields__"):
+            stack.extend(getattr(o, a) for a in o.__dataclass_fields__)
+        elif isinstance(o, SimpleNamespace) or isinstance_str(o, "Module"):
+            stack.extend(o.__dict__.values())
+        elif isinstance_str(o, "Tensor") or isinstance_str(o, "ndarray"):
+            if type(o).__name__ == "Parameter":
+                o = o.data
+            if getattr(o, "is_cuda", False):
+                # hashed through a temporary copy on the cpu, whose memory can be
+                # reused by the copy made during encoding, of another tensor
+                continue
+            buffer = best_effort_to_buffer(o)
+            if buffer is not None and buffer.contents_nbytes() >= min_bytes:
+                result[buffer.identity()] = buffer
+    return result
+
+
+def prehash_buffers(obj, threads):
+    """
+    Hash the large buffers in obj on a pool of threads (hashlib releases the GIL
+    while hashing large buffers), returning a dictionary from their identities to
+    their digests.
+    """
+    buffers = large_buffers(obj)
+    if len(buffers) < 2 or threads <= 1:
+        return {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        digests = executor.map(ByteBuffer.sha256, buffers.values())
+        return dict(zip(buffers.keys(), digests))
+
+
+def stable_hash(obj, *, version=None, fast_bytes=True, streaming=False, threads=None):
+    """
+    Hash of stringify(obj, ...).
+
+    :param streaming: feed the json to the hash in chunks as it is produced, rather
+        than building the whole string first. Slower for keys made up of many small
+        objects, but uses far less memory for large ones.
+    :param threads: if set, large arrays and tensors in obj are first hashed in
+        parallel, on this many threads. Only applies when fast_bytes is set, so
+        not to the keys of cached functions, which include the bytes themselves,
+        unless an argument is hashed with e.g. partial(stable_hash, threads=8) in
+        the key function.
+    """
+    if threads is not None and fast_bytes:
+        outer = _prehashed_digests.get() or {}
+        token = _prehashed_digests.set({**outer, **prehash_buffers(obj, threads)})
+        try:
+            return stable_hash(
+                obj, version=version, fast_bytes=fast_bytes, streaming=streaming
+            )
+        finally:
+            _prehashed_digests.reset(token)
+    if not streaming:
+        return hashlib.sha256(
+            stringify(obj, fast_bytes=fast_bytes, version=version).encode("utf-8")
+        ).hexdigest()
+    hasher = hashlib.sha256()
+    buffer, buffer_size = [], 0
+    for chunk in iter_stringify(obj, fast_bytes=fast_bytes, version=version):
+        buffer.append(chunk)
+        buffer_size += len(chunk)
+        if buffer_size >= 2**16:
+            hasher.update("".join(buffer).encode("utf-8"))
+            buffer, buffer_size = [], 0
+    hasher.update("".join(buffer).encode("utf-8"))
+    return hasher.hexdigest()
 
 
 def migrated_attrs(cls):
@@ -0,0 +1,137 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+
+@dataclass
+class _MemoEntry:
+    ref: weakref.ref
+    version: object
+    digest: str
+
+
+class HashMemo:
+    """
+    Memo of the digests of large arrays and tensors, keyed by object identity, so
+    that passing the same array to stable_hash repeatedly only hashes it once.
+
+    Only objects that are known not to have changed since they were hashed are
+    looked up:
+        - numpy arrays that are not writeable, and neither is any array they are a
+            view of. Making such an array writeable again and modifying it is not
+            detected.
+        - torch tensors whose version counter (bumped by every in-place operation)
+            is the same as when they were hashed. Writes to the tensor's memory from
+            outside of torch (e.g., through a numpy array it shares memory with)
+            are not detected.
+
+    Entries are dropped when their object is garbage collected, and the least
+    recently used entry is evicted when there are more than max_entries.
+    """
+
+    def __init__(self, max_entries=1024, min_bytes=2**16):
+        self.max_entries = max_entries
+        self.min_bytes = min_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # (key, ref) of collected objects, appended without the lock, since the
+        # weakref callbacks can run during any allocation, including under it
+        self._dead = deque()
+
+    def digest(self, obj, nbytes, compute):
+        """
+        Return the digest of obj, using compute() to produce it if it is not
+        memoized or obj is not known to be unchanged.
+        """
+        version = immutable_version(obj) if nbytes >= self.min_bytes else None
+        if version is None:
+            return compute()
+        key = id(obj)
+        with self._lock:
+            self._remove_dead()
+            entry = self.entries.get(key)
+            if entry is not None and entry.ref() is obj and entry.version == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.digest
+            self.misses += 1
+        digest = compute()
+        with self._lock:
+            self._remove_dead()
+            self.entries[key] = _MemoEntry(
+                weakref.ref(obj, self._remover(key)), version, digest
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return digest
+
+    def _remover(self, key):
+        dead = self._dead
+
+        def remove(ref):
+            dead.append((key, ref))
+
+        return remove
+
+    def _remove_dead(self):
+        while self._dead:
+            key, ref = self._dead.popleft()
+            entry = self.entries.get(key)
+            if entry is not None and entry.ref is ref:
+                del self.entries[key]
+
+    def __len__(self):
+        with self._lock:
+            self._remove_dead()
+            return len(self.entries)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._dead.clear()
+
+
+def immutable_version(obj):
+    """
+    A value that changes whenever obj is modified, or None if obj might change
+    without this being detectable.
+    """
+    if type(obj).__module__ == "torch" and type(obj).__name__ == "Tensor":
+        # pylint: disable=protected-access
+        return ("torch", obj._version)
+    if type(obj).__module__ == "numpy" and type(obj).__name__ == "ndarray":
+        while type(obj).__module__ == "numpy" and type(obj).__name__ == "ndarray":
+            if obj.flags.writeable:
+                return None
+            obj = obj.base
+        if obj is None or isinstance(obj, bytes):
+            return ("numpy",)
+    return None
+
+
+class hash_memo_global:
+    """
+    context manager that makes stable_hash and stringify use the given HashMemo
+    (a new one if none is given), and then restores the previous one when the
+    context is exited
+    """
+
+    memo = None
+
+    def __init__(self, memo=None):
+        self.new = memo if memo is not None else HashMemo()
+        self.old = None
+
+    def __enter__(self):
+        self.old = hash_memo_global.memo
+        hash_memo_global.memo = self.new
+        return self.new
+
+    def __exit__(self, *args):
+        hash_memo_global.memo = self.old
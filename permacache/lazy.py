@@ -0,0 +1,154 @@
+import io
+import pickle
+import shelve
+from collections.abc import Mapping, Sequence
+
+
+class SegmentedValue:
+    """
+    The stored form of a value cached with lazy=True. Each field of a dict or
+    tuple is pickled separately, as a segment, and any other value is a single
+    segment, so that loading the stored value only copies bytes around, and each
+    field is unpickled when it is first used.
+
+    With pickle protocol 5, segments are pickled as out-of-band buffers, so a
+    store with out_of_band_threshold keeps large segments in their own memory
+    mapped files, which are then only read when their field is used.
+    """
+
+    def __init__(self, kind, keys, segments, unpickler=pickle.Unpickler):
+        self.kind = kind
+        self.keys = keys
+        self.segments = segments
+        self.unpickler = unpickler
+        # by index, so that proxies of a value in the memory cache share its fields
+        self.loaded = {}
+
+    @classmethod
+    def of(cls, value):
+        """
+        The segmented form of the given value.
+        """
+        # pylint: disable=unidiomatic-typecheck
+        # subclasses, like namedtuples, are stored whole so they keep their type
+        if type(value) is dict:
+            return cls("dict", list(value), [_dumps(v) for v in value.values()])
+        if type(value) is tuple:
+            return cls("tuple", None, [_dumps(v) for v in value])
+        return cls("value", None, [_dumps(value)])
+
+    def __reduce_ex__(self, protocol):
+        segments = self.segments
+        if protocol >= 5:
+            segments = [pickle.PickleBuffer(segment) for segment in segments]
+        return _restore_segmented_value, (self.kind, self.keys, segments)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(len(s) for s in self.segments)
+
+    def load_segment(self, index):
+        value = self.loaded.get(index, _MISSING)
+        if value is _MISSING:
+            value = self.loaded[index] = self._unpickle(self.segments[index])
+        return value
+
+    def _unpickle(self, segment):
+        if self.unpickler is pickle.Unpickler:
+            # avoids copying memory mapped segments
+            return pickle.loads(segment)
+        return self.unpickler(io.BytesIO(segment)).load()
+
+    def proxy(self):
+        """
+        A proxy for a dict or tuple, which unpickles its fields as they are used.
+        Any other value is returned itself, as a proxy could not behave exactly
+        like it.
+        """
+        if self.kind == "dict":
+            return LazyDict(self)
+        if self.kind == "tuple":
+            return LazyTuple(self)
+        return self.load_segment(0)
+
+    def materialize(self):
+        """
+        The value itself, with every field unpickled.
+        """
+        values = [self.load_segment(i) for i in range(len(self.segments))]
+        if self.kind == "dict":
+            return dict(zip(self.keys, values))
+        if self.kind == "tuple":
+            return tuple(values)
+        return values[0]
+
+
+def _dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _restore_segmented_value(kind, keys, segments):
+    # the unpickler in effect when the stored value is read, which might have been
+    # swapped out with swap_unpickler_context_manager, is used for its fields too
+    return SegmentedValue(kind, keys, segments, shelve.Unpickler)
+
+
+class LazyDict(Mapping):
+    """
+    A read-only dict whose values are unpickled when first accessed.
+    """
+
+    def __init__(self, segmented):
+        self._segmented = segmented
+        self._indices = {key: i for i, key in enumerate(segmented.keys)}
+
+    def __getitem__(self, key):
+        return self._segmented.load_segment(self._indices[key])
+
+    def __iter__(self):
+        return iter(self._indices)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __contains__(self, key):
+        return key in self._indices
+
+    def materialize(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"LazyDict({self.materialize()!r})"
+
+
+class LazyTuple(Sequence):
+    """
+    A tuple whose elements are unpickled when first accessed.
+    """
+
+    def __init__(self, segmented):
+        self._segmented = segmented
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(len(self))[index])
+        return self._segmented.load_segment(range(len(self))[index])
+
+    def __len__(self):
+        return len(self._segmented.segments)
+
+    def materialize(self):
+        return tuple(self)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyTuple):
+            other = other.materialize()
+        return isinstance(other, tuple) and self.materialize() == other
+
+    def __hash__(self):
+        return hash(self.materialize())
+
+    def __repr__(self):
+        return f"LazyTuple({self.materialize()!r})"
+
+
+_MISSING = object()
@@ -1,63 +1,271 @@
-import gzip
+import dbm
+import hashlib
 import json
+import mmap
 import os
-import pickle
 import shelve
-import time
+import threading
 import uuid
 import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 from filelock import FileLock
 
+from permacache.compression import DEFAULT_DICTIONARY_SIZE, CompressedValues
 from permacache.hash import stable_hash
+from permacache.manifest import Manifest, ManifestEntry
+from permacache.memory_cache import MemoryCache
+from permacache.out_of_band import OutOfBandBuffers
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # no shared locks, readers take the exclusive lock instead
+    fcntl = None
+
+GENERATION_SIZE = 8
+
+HEX = set("0123456789abcdef")
+
+DRIVER_SUFFIXES = {
+    "json": ".json",
+    "pickle": ".pkl",
+    "pickle.gz": ".pkl.gz",
+    "pickle.zst": ".pkl.zst",
+    "pickle.lz4": ".pkl.lz4",
+}
+
+DRIVER_COMPRESSION = {"pickle.gz": "gzip", "pickle.zst": "zstd", "pickle.lz4": "lz4"}
 
 
 class Lock:
-    def __init__(self, lock_path, time_path):
-        self.lock = FileLock(lock_path)
-        self.time_path = time_path
-        self.last_opened = float("-inf")
-        self.unlocked = False
+    """
+    A file lock, along with a generation counter that is incremented on every
+    modification of the store it protects. The counter lives in a small memory-mapped
+    file, so checking whether anyone has modified the store since we last looked is
+    a memory read rather than a file read.
+
+    The lock can be taken in shared mode, for readers, or exclusive mode, for
+    writers. Any number of processes can hold it in shared mode at once. Within a
+    process, it is held by at most one thread at a time, and is reentrant.
+    """
 
-    def _get_last_modified(self):
+    def __init__(self, lock_path, generation_path):
+        self.lock = FileLock(lock_path)
+        self.lock_path = lock_path
+        self.generation_path = generation_path
+        self.generation_map = None
+        self.seen_generation = None
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.shared_fd = None
+        self.gate_fd = None
+        self.exclusive = False
+
+    def _generation_map(self):
+        if self.generation_map is None:
+            fd = os.open(self.generation_path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if os.fstat(fd).st_size < GENERATION_SIZE:
+                    os.ftruncate(fd, GENERATION_SIZE)
+                self.generation_map = mmap.mmap(fd, GENERATION_SIZE)
+            finally:
+                os.close(fd)
+        return self.generation_map
+
+    def generation(self):
         self._check()
-        try:
-            with open(self.time_path) as f:
-                return float(f.read())
-        # pylint: disable=broad-except
-        except Exception:
-            self.set_last_modified()
-            return self._get_last_modified()
+        return int.from_bytes(self._generation_map()[:GENERATION_SIZE], "little")
 
     def opened_after_last_modification(self):
-        self._check()
-        last_modified_time = self._get_last_modified()
-        return self.last_opened >= last_modified_time
+        return self.seen_generation == self.generation()
 
     def set_last_opened(self):
-        self.last_opened = time.time()
+        self.seen_generation = self.generation()
 
-    def set_last_modified(self):
+    def check_exclusive(self):
         self._check()
-        self.set_last_opened()
-        with open(self.time_path, "w") as f:
-            f.write(str(self.last_opened))
+        assert self.exclusive, "can only modify the store under an exclusive lock"
+
+    def set_last_modified(self):
+        self.check_exclusive()
+        self.seen_generation = self.generation() + 1
+        self._generation_map()[:GENERATION_SIZE] = self.seen_generation.to_bytes(
+            GENERATION_SIZE, "little"
+        )
+
+    def acquire(self, shared=False):
+        self.thread_lock.acquire()  # pylint: disable=consider-using-with
+        if self.depth > 0:
+            if not shared and not self.exclusive:
+                self.thread_lock.release()
+                raise RuntimeError(
+                    "cannot take an exclusive lock while holding a shared one"
+                )
+        else:
+            try:
+                self._acquire_file_lock(shared)
+            except BaseException:
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def _acquire_file_lock(self, shared):
+        # Writers hold the gate exclusively while waiting for the lock and while
+        # holding it, and readers pass through the gate on their way to the lock,
+        # so that a stream of readers cannot starve the writers.
+        gate_path = self.lock_path + ".gate"
+        if shared and fcntl is not None:
+            gate_fd = _flock(gate_path, fcntl.LOCK_SH)
+            if gate_fd is not None:
+                try:
+                    # compatible with the exclusive flock taken by FileLock
+                    self.shared_fd = _flock(self.lock_path, fcntl.LOCK_SH)
+                finally:
+                    _unflock(gate_fd)
+            if self.shared_fd is not None:
+                self.exclusive = False
+                return
+        if fcntl is not None:
+            self.gate_fd = _flock(gate_path, fcntl.LOCK_EX)
+        try:
+            self.lock.acquire()
+        except BaseException:
+            self._release_gate()
+            raise
+        self.exclusive = True
+
+    def _release_gate(self):
+        if self.gate_fd is not None:
+            _unflock(self.gate_fd)
+            self.gate_fd = None
+
+    def release(self):
+        if self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            if self.shared_fd is None:
+                self.lock.release()
+                self._release_gate()
+            else:
+                _unflock(self.shared_fd)
+                self.shared_fd = None
+            self.exclusive = False
+        self.thread_lock.release()
 
     def __enter__(self):
-        self.lock.__enter__()
-        self.unlocked = True
+        self.acquire()
         return self
 
     def __exit__(self, *args, **kwargs):
-        self.unlocked = False
-        self.lock.__exit__(*args, **kwargs)
+        self.release()
 
     def _check(self):
-        assert self.unlocked, "can only perform this operation on an unlocked lock"
+        assert self.depth > 0, "can only perform this operation on an unlocked lock"
+
+
+def _flock(path, operation):
+    """
+    Open the given file and flock it, returning the file descriptor, or None if
+    flock is not supported on its filesystem.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, operation)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unflock(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+class SharedAccess:
+    """
+    Context manager for read-only access to a store, see the reading() method of
+    LockedShelf and IndividualFileLockedStore.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self.store.acquire(shared=True)
+
+    def __exit__(self, *args, **kwargs):
+        self.store.__exit__(*args, **kwargs)
 
 
 all_locked_shelves = weakref.WeakValueDictionary()
 
+_MISSING = object()
+
+
+class EncodedShelf(shelve.Shelf):
+    """
+    A shelf whose values are compressed with the given CompressedValues, and whose
+    large buffers are stored with the given OutOfBandBuffers.
+    """
+
+    def __init__(self, db, values, buffers, protocol=None):
+        super().__init__(db, protocol=protocol)
+        self.values = values
+        self.buffers = buffers
+
+    def __getitem__(self, key):
+        # the unpickler is looked up on every read, like shelve does, so it can be
+        # swapped out
+        return self.buffers.loads(
+            self.dict[key.encode(self.keyencoding)],
+            self.values.decompress,
+            shelve.Unpickler,
+        )
+
+    def __setitem__(self, key, value):
+        stored = self.buffers.dumps(value, self._protocol, self.values.compress)
+        self._remove_buffers(key)
+        self.dict[key.encode(self.keyencoding)] = stored
+
+    def __delitem__(self, key):
+        self._remove_buffers(key)
+        del self.dict[key.encode(self.keyencoding)]
+
+    def set_multiple(self, items):
+        """
+        Like setting each of the (key, value) pairs in turn, but the values are all
+        serialized before anything is written.
+        """
+        stored = {}
+        try:
+            for key, value in items:
+                key = key.encode(self.keyencoding)
+                out = self.buffers.dumps(value, self._protocol, self.values.compress)
+                if key in stored:
+                    self.buffers.remove_buffers(stored[key])
+                stored[key] = out
+        except BaseException:
+            for out in stored.values():
+                self.buffers.remove_buffers(out)
+            raise
+        if os.path.isdir(self.buffers.directory):
+            for key in stored:
+                self._remove_buffers(key.decode(self.keyencoding))
+        for key, value in stored.items():
+            self.dict[key] = value
+
+    def _remove_buffers(self, key):
+        if not os.path.isdir(self.buffers.directory):
+            return
+        try:
+            previous = self.dict[key.encode(self.keyencoding)]
+        except KeyError:
+            return
+        self.buffers.remove_buffers(previous)
+
 
 class LockedShelf:
     """
@@ -66,7 +274,23 @@ class LockedShelf:
     Mantains a cache of some of the elements of the dictionary. If it ever was not
         the most recent accessor of the shelf, the cache is entirely flushed.
 
-    The cache is mantained over opening and closing of the shelf.
+    The cache is mantained over opening and closing of the shelf. It is unbounded by
+        default, use max_cache_entries and max_cache_bytes to bound it, in which case
+        the least recently used entries are evicted first.
+
+    Values can be compressed with compression="gzip", "zstd" or "lz4", at the
+        given compression_level. Values are readable whatever they were compressed
+        with, so the compression of an existing shelf can be changed.
+
+    With out_of_band_threshold, buffers of at least that many bytes, such as the
+        data of large numpy arrays, are written to their own files, which are memory
+        mapped on read, so the arrays loaded from them are read-only.
+
+    With multiprocess_safe, the shelf is closed after every access, so that other
+        processes see its writes and it sees theirs. With keep_open as well, it is
+        only closed after writing, and reopened when the generation counter shows
+        that another process has written to it since, so reads of an unchanged
+        shelf do not reopen it or drop the memory cache.
     """
 
     def __init__(
@@ -75,17 +299,32 @@ class LockedShelf:
         multiprocess_safe=False,
         read_from_shelf_context_manager=None,
         allow_large_values=False,
+        *,
+        max_cache_entries=None,
+        max_cache_bytes=None,
+        compression=None,
+        compression_level=None,
+        out_of_band_threshold=None,
+        keep_open=False,
     ):
         try:
             os.makedirs(path)
         except FileExistsError:
             pass
         self.path = path
-        self.lock = Lock(self.path + "/lock", self.path + "/time")
+        self.values = CompressedValues(
+            compression, compression_level, os.path.join(path, "dictionaries")
+        )
+        self.buffers = OutOfBandBuffers(
+            os.path.join(path, "buffers"), out_of_band_threshold
+        )
+        self.lock = Lock(self.path + "/lock", self.path + "/generation")
         self.shelve_path = self.path + "/shelf"
         self.shelf = None
-        self.cache = None
+        self.shelf_writable = False
+        self.cache = MemoryCache(max_cache_entries, max_cache_bytes)
         self.multiprocess_safe = multiprocess_safe
+        self.keep_open = keep_open
         self.read_from_shelf_context_manager = read_from_shelf_context_manager
         self.allow_large_values = allow_large_values
 
@@ -95,14 +334,44 @@ class LockedShelf:
             return {"protocol": 5}
         return {}
 
+    def _open_shelf(self):
+        self.shelf_writable = self.lock.exclusive
+        if self.shelf_writable:
+            db = dbm.open(self.shelve_path, "c")
+        else:
+            kind = dbm.whichdb(self.shelve_path)
+            flag = "r"
+            if self.keep_open and kind == "dbm.gnu":
+                # gdbm readers lock the file, which would keep other processes from
+                # writing while we hold it open between accesses
+                flag = "ru"
+            if kind is None and not any(
+                # the files of dbm.gnu, dbm.ndbm and dbm.dumb
+                os.path.exists(self.shelve_path + suffix)
+                for suffix in ("", ".db", ".dat")
+            ):
+                # nothing has been written yet
+                db = {}
+            else:
+                db = dbm.open(self.shelve_path, flag)
+        return EncodedShelf(db, self.values, self.buffers, **self.shelf_kwargs)
+
     def _update(self):
+        if self.shelf is not None and self.lock.exclusive and not self.shelf_writable:
+            self.close()
+        if self.shelf is not None and self.multiprocess_safe and self.keep_open:
+            if not self.lock.opened_after_last_modification():
+                # written to by another process, which our handle might not see
+                self.close()
         if self.shelf is None:
-            self.shelf = shelve.open(self.shelve_path, **self.shelf_kwargs)
-            self.cache = {}
+            unchanged = self.keep_open and self.lock.opened_after_last_modification()
+            self.shelf = self._open_shelf()
+            if not unchanged:
+                self.cache.clear()
+            self.lock.set_last_opened()
         else:
-            assert self.cache is not None
             if not self.lock.opened_after_last_modification():
-                self.cache = {}
+                self.cache.clear()
                 self.lock.set_last_opened()
 
     def _read_from_underlying_shelf(self, key):
@@ -116,11 +385,10 @@ class LockedShelf:
         return self._get_without_checking(key)
 
     def _get_without_checking(self, key):
-        if key not in self.cache:
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
             result = self.cache[key] = self._read_from_underlying_shelf(key)
-            return result
-
-        return self.cache[key]
+        return result
 
     def __contains__(self, key):
         self._update()
@@ -128,12 +396,29 @@ class LockedShelf:
         return key in self.cache or key in self.shelf
 
     def __setitem__(self, key, value):
+        self.lock.check_exclusive()
         self._update()
         self.cache[key] = value
         self.shelf[key] = value
         self.lock.set_last_modified()
 
+    def set_multiple(self, items):
+        """
+        Set each of the (key, value) pairs, in one batch, marking the shelf as
+        modified once rather than after every value.
+        """
+        self.lock.check_exclusive()
+        self._update()
+        items = list(items)
+        if not items:
+            return
+        self.shelf.set_multiple(items)
+        for key, value in items:
+            self.cache[key] = value
+        self.lock.set_last_modified()
+
     def __delitem__(self, key):
+        self.lock.check_exclusive()
         self._update()
         if key in self.cache:
             del self.cache[key]
@@ -144,15 +429,66 @@ class LockedShelf:
         self._update()
         return list(self.shelf.items())
 
-    def __enter__(self):
-        self.lock.__enter__()
+    def count(self):
+        self._update()
+        return len(self.shelf)
+
+    def key_sizes(self):
+        """
+        List (key, size) for each entry, where size is the size in bytes of the
+        stored value, without loading the values.
+        """
+        self._update()
+        db = self.shelf.dict
+        # dbm.dumb keeps the position and size of each value in memory
+        index = getattr(db, "_index", None)
+        return [
+            (
+                key.decode(self.shelf.keyencoding),
+                index[key][1] if index is not None else len(db[key]),
+            )
+            for key in db.keys()
+        ]
+
+    def train_compression_dictionary(
+        self, dict_size=DEFAULT_DICTIONARY_SIZE, max_samples=10000
+    ):
+        """
+        Train a zstd dictionary on up to max_samples of the values in the shelf,
+        and compress values written from now on with it. Worth it when there are
+        many small values, which compress poorly on their own.
+        """
+        assert self.values.codec is not None and self.values.codec.name == "zstd"
+        with self:
+            self._update()
+            db = self.shelf.dict
+            samples = [
+                self.values.decompress(self.buffers.payload(db[key]))
+                for key, _ in zip(db.keys(), range(max_samples))
+            ]
+        return self.values.codec.train(samples, dict_size)
+
+    def acquire(self, shared=False):
+        self.lock.acquire(shared=shared)
         return self
 
+    def __enter__(self):
+        return self.acquire()
+
+    def reading(self):
+        """
+        Like entering the shelf, but only allows reading from it. This takes the lock
+        in shared mode, so readers in other processes are not blocked.
+        """
+        return SharedAccess(self)
+
     def __exit__(self, *args, **kwargs):
-        if self.multiprocess_safe:
-            # for multi-processing safety, the only way is to close the shelf every time
-            self.close()
-        self.lock.__exit__(*args, **kwargs)
+        if self.multiprocess_safe and self.lock.depth == 1:
+            # for multi-processing safety, the only way is to close the shelf every
+            # time, or at least after writing, see keep_open
+            if not self.keep_open or self.shelf_writable:
+                self.close()
+        self.lock.release()
 
     def sync(self):
         all_locked_shelves[self.path] = self
@@ -174,6 +510,27 @@ class IndividualFileLockedStore:
     Like LockedShelf, but stores each key in a separate file. Should be
     broadly multiprocess safe, but you can enhance this by using the
     multiprocess_safe flag.
+
+    With fanout > 0, the files are spread over that many levels of 256
+    subdirectories each, named after a hash of the file name, which keeps
+    directories small for stores with many entries. A store that was created
+    without fanout can still be read with it, entries are moved as they are
+    written, or all at once with migrate_to_fanout().
+
+    With out_of_band_threshold, as for LockedShelf, large buffers are written to
+    their own files and memory mapped on read. Overwriting or deleting an entry
+    removes its buffer files, so without multiprocess_safe, a concurrent reader of
+    that entry might find them missing, in which case reading it raises KeyError,
+    which cached functions treat as a miss.
+
+    With manifest=True, every write and deletion is also recorded in a manifest,
+    so the keys of the store and the sizes of their files can be listed (see
+    entries()) without loading every file. The manifest is built from the files
+    when it does not exist, and can be rebuilt with rebuild_manifest() if the store
+    was modified without it.
+
+    get_multiple reads files on a pool of read_threads threads, so that the
+    latency of many reads overlaps, which matters most on network storage.
     """
 
     def __init__(
@@ -181,100 +538,337 @@ class IndividualFileLockedStore:
         path,
         multiprocess_safe=False,
         driver="pickle",
+        *,
+        fanout=0,
+        manifest=False,
+        compression_level=None,
+        out_of_band_threshold=None,
+        read_threads=8,
     ):
         try:
             os.makedirs(path)
+            created = True
         except FileExistsError:
-            pass
+            created = False
         self.path = path
-        self.lock = Lock(self.path + "/lock", self.path + "/time")
+        self.lock = Lock(self.path + "/lock", self.path + "/generation")
         self.cache = None
         self.multi_process_safe = multiprocess_safe
-        assert driver in (
-            "json",
-            "pickle",
-            "pickle.gz",
-        ), "driver must be json or pickle"
+        self.read_threads = read_threads
+        self.read_pool = None
+        self.read_pool_pid = None
+        assert driver in DRIVER_SUFFIXES, "driver must be json or pickle"
         self.driver = driver
+        self.values = CompressedValues(
+            DRIVER_COMPRESSION.get(driver),
+            compression_level,
+            os.path.join(path, "dictionaries"),
+        )
+        assert out_of_band_threshold is None or driver != "json"
+        self.buffers = OutOfBandBuffers(
+            os.path.join(path, "buffers"), out_of_band_threshold
+        )
+        assert 0 <= fanout <= 4, "fanout must be between 0 and 4"
+        self.fanout = fanout
+        # whether there might be entries that are not in their fanout directory
+        self.flat_entries = False
+        if fanout:
+            fanout_path = os.path.join(self.path, "fanout")
+            if created:
+                with open(fanout_path, "w") as f:
+                    f.write(str(fanout))
+            else:
+                try:
+                    with open(fanout_path) as f:
+                        self.flat_entries = int(f.read()) != fanout
+                except FileNotFoundError:
+                    self.flat_entries = True
+        self.manifest = None
+        if manifest:
+            self.manifest = Manifest(os.path.join(self.path, "manifest.jsonl"))
+            if not self.manifest.exists():
+                self.rebuild_manifest()
 
-    def _path_for_key(self, key):
+    @property
+    def suffix(self):
+        return DRIVER_SUFFIXES[self.driver]
+
+    def _filename_for_key(self, key):
         if len(key) < 40 and all(c.isalnum() or c in "-_.,[](){} " for c in key):
             key = "." + key
         else:
             key = stable_hash(key)[:20]
-        key = (
-            key
-            + {"json": ".json", "pickle": ".pkl", "pickle.gz": ".pkl.gz"}[self.driver]
+        return key + self.suffix
+
+    def _fanout_directory(self, filename):
+        if not self.fanout:
+            return self.path
+        digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+        return os.path.join(
+            self.path, *[digest[2 * i : 2 * i + 2] for i in range(self.fanout)]
         )
-        return os.path.join(self.path, key)
 
-    def __getitem__(self, key):
+    def _path_for_key(self, key):
+        filename = self._filename_for_key(key)
+        return os.path.join(self._fanout_directory(filename), filename)
+
+    def _flat_path_for_key(self, key):
+        return os.path.join(self.path, self._filename_for_key(key))
+
+    def _load(self, path):
         if self.driver == "json":
-            with open(self._path_for_key(key), "r") as f:
-                result = json.load(f)
-        elif self.driver == "pickle":
-            with open(self._path_for_key(key), "rb") as f:
-                result = pickle.load(f)
-        elif self.driver == "pickle.gz":
-            with gzip.open(self._path_for_key(key), "rb") as f:
-                result = pickle.load(f)
-        else:
-            raise ValueError(f"Unknown driver {self.driver}")
+            with open(path, "r") as f:
+                return json.load(f)
+        with open(path, "rb") as f:
+            stored = f.read()
+        try:
+            return self.buffers.loads(stored, self.values.decompress)
+        except FileNotFoundError as e:
+            # its buffers were removed by a concurrent write, see the class docstring
+            raise KeyError(path) from e
+
+    def __getitem__(self, key):
+        try:
+            result = self._load(self._path_for_key(key))
+        except FileNotFoundError:
+            if not self.flat_entries:
+                raise
+            result = self._load(self._flat_path_for_key(key))
         return result[key]
 
     def __contains__(self, key):
-        return os.path.exists(self._path_for_key(key))
+        if os.path.exists(self._path_for_key(key)):
+            return True
+        return self.flat_entries and os.path.exists(self._flat_path_for_key(key))
 
     def __setitem__(self, key, value):
-        temporary_path = self._path_for_key(key) + "." + uuid.uuid4().hex[:10]
+        path = self._path_for_key(key)
+        temporary_path = path + "." + uuid.uuid4().hex[:10]
+        out = self._serialize(key, value)
+        try:
+            self._write(temporary_path, out)
+        except FileNotFoundError:
+            if not self.fanout:
+                raise
+            # first entry in this fanout directory
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write(temporary_path, out)
+        previous = self._buffers_header(path)
+        os.replace(temporary_path, path)
+        self.buffers.remove_buffers(previous)
+        if self.manifest is not None:
+            self.manifest.record_write(
+                os.path.relpath(path, self.path), key, os.path.getsize(path)
+            )
+        if self.flat_entries:
+            self._remove(self._flat_path_for_key(key))
+
+    def set_multiple(self, items):
+        """
+        Set each of the (key, value) pairs. Every entry is its own file, so this is
+        the same as setting them one at a time.
+        """
+        for key, value in items:
+            self[key] = value
+
+    def _remove(self, path):
+        """
+        Remove the file at the given path, returning whether it existed.
+        """
+        header = self._buffers_header(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        self.buffers.remove_buffers(header)
+        if self.manifest is not None:
+            self.manifest.record_delete(os.path.relpath(path, self.path))
+        return True
+
+    def _buffers_header(self, path):
+        """
+        The start of the file at the given path, enough to find its out-of-band
+        buffers, if any.
+        """
+        if self.driver == "json" or not os.path.isdir(self.buffers.directory):
+            return b""
+        try:
+            return self.buffers.read_header(path)
+        except FileNotFoundError:
+            return b""
+
+    def _serialize(self, key, value):
         if self.driver == "json":
-            out = json.dumps({key: value})
-            with open(temporary_path, "w") as f:
-                f.write(out)
-        elif self.driver == "pickle":
-            out = pickle.dumps({key: value})
-            with open(temporary_path, "wb") as f:
-                f.write(out)
-        elif self.driver == "pickle.gz":
-            out = pickle.dumps({key: value})
-            with gzip.GzipFile(temporary_path, "wb", mtime=0) as f:
-                f.write(out)
-        else:
-            raise ValueError(f"Unknown driver {self.driver}")
-        os.replace(temporary_path, self._path_for_key(key))
+            return json.dumps({key: value})
+        return self.buffers.dumps({key: value}, compress=self.values.compress)
+
+    @staticmethod
+    def _write(temporary_path, out):
+        with open(temporary_path, "w" if isinstance(out, str) else "wb") as f:
+            f.write(out)
 
     def __delitem__(self, key):
-        os.remove(self._path_for_key(key))
+        removed = self._remove(self._path_for_key(key))
+        if self.flat_entries:
+            removed = self._remove(self._flat_path_for_key(key)) or removed
+        if not removed:
+            raise FileNotFoundError(self._path_for_key(key))
+
+    def _entry_paths(self):
+        for directory, subdirectories, filenames in os.walk(self.path):
+            # entries are only in the top directory or in fanout directories
+            depth = os.path.relpath(directory, self.path).count(os.sep) + (
+                directory != self.path
+            )
+            if depth == self.fanout:
+                subdirectories.clear()
+            subdirectories[:] = [
+                d for d in subdirectories if len(d) == 2 and all(c in HEX for c in d)
+            ]
+            for filename in filenames:
+                if filename.endswith(self.suffix):
+                    yield os.path.join(directory, filename)
 
     def items(self):
-        for filename in os.listdir(self.path):
-            if self.driver == "json":
-                with open(os.path.join(self.path, filename), "r") as f:
-                    item = json.load(f)
-            elif self.driver == "pickle":
-                with open(os.path.join(self.path, filename), "rb") as f:
-                    item = pickle.load(f)
-            elif self.driver == "pickle.gz":
-                with gzip.open(os.path.join(self.path, filename), "rb") as f:
-                    item = pickle.load(f)
-            else:
-                raise ValueError(f"Unknown driver {self.driver}")
-            yield from item.items()
-
-    def __enter__(self):
+        if self.manifest is None:
+            for path in self._entry_paths():
+                yield from self._load(path).items()
+            return
+        for entry in list(self.manifest.current_entries().values()):
+            try:
+                result = self._load(os.path.join(self.path, entry.filename))
+            except FileNotFoundError:
+                # deleted since we read the manifest
+                continue
+            yield entry.key, result[entry.key]
+
+    def keys(self):
+        return [entry.key for entry in self.entries()]
+
+    def count(self):
+        if self.manifest is None:
+            return sum(1 for _ in self._entry_paths())
+        return len(self.manifest.current_entries())
+
+    def key_sizes(self):
+        """
+        List (key, size) for each entry, where size is the size in bytes of its
+        file, without loading the files. Without a manifest, the key of an entry is
+        not known without loading its file, so its file name is given instead.
+        """
+        if self.manifest is None:
+            return [
+                (os.path.relpath(path, self.path), os.path.getsize(path))
+                for path in self._entry_paths()
+            ]
+        return [
+            (entry.key, entry.size)
+            for entry in self.manifest.current_entries().values()
+        ]
+
+    def entries(self):
+        """
+        List the entries of the store, as ManifestEntry objects. Only fast if the
+        store has a manifest, otherwise every file is loaded.
+        """
+        if self.manifest is None:
+            return list(self._scan_entries())
+        return list(self.manifest.current_entries().values())
+
+    def _scan_entries(self):
+        for path in self._entry_paths():
+            stat = os.stat(path)
+            for key in self._load(path):
+                yield ManifestEntry(
+                    key, os.path.relpath(path, self.path), stat.st_size, stat.st_mtime
+                )
+
+    def rebuild_manifest(self):
+        """
+        Rebuild the manifest from the files in the store.
+        """
+        assert self.manifest is not None, "store does not have a manifest"
+        with self:
+            self.manifest.rewrite(self._scan_entries())
+
+    def train_compression_dictionary(
+        self, dict_size=DEFAULT_DICTIONARY_SIZE, max_samples=10000
+    ):
+        """
+        Train a zstd dictionary on up to max_samples of the files in the store, and
+        compress files written from now on with it. Worth it when there are many
+        small values, which compress poorly on their own.
+        """
+        assert self.driver == "pickle.zst", "dictionaries require the pickle.zst driver"
+        with self:
+            samples = []
+            for path, _ in zip(self._entry_paths(), range(max_samples)):
+                with open(path, "rb") as f:
+                    samples.append(
+                        self.values.decompress(self.buffers.payload(f.read()))
+                    )
+        return self.values.codec.train(samples, dict_size)
+
+    def migrate_to_fanout(self):
+        """
+        Move any entries that are not in their fanout directory into it.
+        """
+        with self:
+            for path in list(self._entry_paths()):
+                filename = os.path.basename(path)
+                directory = self._fanout_directory(filename)
+                if os.path.dirname(path) != directory:
+                    os.makedirs(directory, exist_ok=True)
+                    os.replace(path, os.path.join(directory, filename))
+                    if self.manifest is not None:
+                        self._record_move(path, os.path.join(directory, filename))
+            with open(os.path.join(self.path, "fanout"), "w") as f:
+                f.write(str(self.fanout))
+            self.flat_entries = False
+
+    def _record_move(self, old_path, new_path):
+        old = os.path.relpath(old_path, self.path)
+        entry = self.manifest.current_entries().get(old)
+        self.manifest.record_delete(old)
+        if entry is not None:
+            self.manifest.record_write(
+                os.path.relpath(new_path, self.path), entry.key, entry.size
+            )
+
+    def acquire(self, shared=False):
         if self.multi_process_safe:
-            self.lock.__enter__()
+            self.lock.acquire(shared=shared)
         return self
 
+    def __enter__(self):
+        return self.acquire()
+
+    def reading(self):
+        """
+        Like entering the store, but only allows reading from it.
+        """
+        return SharedAccess(self)
+
     def __exit__(self, *args, **kwargs):
         if self.multi_process_safe:
-            self.lock.__exit__(*args, **kwargs)
+            self.lock.release()
 
     def close(self):
         self.__exit__()
 
     def get_multiple(self, keys):
-        return [self[key] for key in keys]
+        keys = list(keys)
+        if self.read_threads <= 1 or len(keys) <= 1:
+            return [self[key] for key in keys]
+        if self.read_pool is None or self.read_pool_pid != os.getpid():
+            # a pool inherited through fork has no worker threads
+            self.read_pool = ThreadPoolExecutor(
+                self.read_threads, thread_name_prefix="permacache-read"
+            )
+            self.read_pool_pid = os.getpid()
+        # results are in order, and the error raised, if any, is the one for the
+        # first key that fails, as when reading one at a time
+        return list(self.read_pool.map(self.__getitem__, keys))
 
 
 def sync_all_caches():
@@ -0,0 +1,566 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from .locked_shelf import Lock, SharedAccess
+from .memory_cache import MemoryCache
+
+# key length, value length, crc32 of the key and value
+RECORD_HEADER = struct.Struct("<IQI")
+# value length of a record that deletes its key
+TOMBSTONE = 2**64 - 1
+
+INDEX_MAGIC = b"PCLOGIX1"
+# magic, capacity, count, segment and offset up to which the index is complete
+INDEX_HEADER = struct.Struct("<8sQQQQ")
+# key hash, segment, offset and length of the record, segment 0 means empty
+INDEX_ENTRY = struct.Struct("<QIQQ")
+
+SEGMENT_SUFFIX = ".log"
+# each rewrite of the index is a new file, index.<number>, see LogStore._write_index
+INDEX_NAME = "index"
+
+_MISSING = object()
+
+
+def key_hash(key):
+    return int.from_bytes(
+        hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class LogStore:
+    """
+    A store that appends entries to segment files, rather than updating a file in
+    place or writing a file per entry.
+
+    Records are located using an index, an open addressing hash table from key hashes
+    to record locations that is memory-mapped, so opening the store is cheap and
+    reads take a constant number of file accesses. The index covers the segments up
+    to a certain point, and records written after that are found by scanning the
+    tail of the log when the store is opened or another process has written to it.
+    An incomplete record at the end of the log, e.g., from a crash while writing,
+    is ignored, and truncated by the next writer.
+
+    The index is rewritten once index_flush_entries records have been written since
+    it was last written. Overwritten and deleted entries are only reclaimed by
+    compact(), which can also be run from the command line with
+    `permacache compact <cache_name>`.
+
+    Files that other instances might still have open are never replaced: each
+    rewrite of the index is a new file, and superseded index files and segments are
+    removed once nothing refers to them. Where open files cannot be removed (on
+    Windows), they are left for the next rewrite of the index to remove.
+
+    Mantains a cache of some of the elements of the dictionary, as LockedShelf does.
+
+    :param multiprocess_safe: accepted for compatibility with the other stores,
+        this store is always safe to use from multiple processes.
+    :param segment_size: size in bytes after which a new segment file is started.
+    :param index_flush_entries: number of records after which the index is rewritten.
+    """
+
+    def __init__(
+        self,
+        path,
+        multiprocess_safe=True,
+        *,
+        segment_size=2**28,
+        index_flush_entries=4096,
+        max_cache_entries=None,
+        max_cache_bytes=None,
+    ):
+        del multiprocess_safe
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.lock = Lock(os.path.join(path, "lock"), os.path.join(path, "generation"))
+        self.segment_size = segment_size
+        self.index_flush_entries = index_flush_entries
+        self.cache = MemoryCache(max_cache_entries, max_cache_bytes)
+        self.index = None
+        self.index_identity = None
+        # key -> location of its latest record after the index, None if deleted
+        self.overlay = {}
+        self.scanned_to = None
+        self.segments = {}
+        self.append_file = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _segment_numbers(self):
+        return sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.path)
+            if name.endswith(SEGMENT_SUFFIX) and name[: -len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _segment(self, segment):
+        if segment not in self.segments:
+            # pylint: disable=consider-using-with
+            self.segments[segment] = open(self._segment_path(segment), "rb")
+        return self.segments[segment]
+
+    def acquire(self, shared=False):
+        self.lock.acquire(shared=shared)
+        return self
+
+    def __enter__(self):
+        return self.acquire()
+
+    def reading(self):
+        """
+        Like entering the store, but only allows reading from it.
+        """
+        return SharedAccess(self)
+
+    def __exit__(self, *args, **kwargs):
+        if self.lock.depth == 1:
+            if self.append_file is not None:
+                self.append_file.close()
+                self.append_file = None
+            if self.lock.exclusive and len(self.overlay) >= self.index_flush_entries:
+                self._write_index()
+        self.lock.release()
+
+    def _update(self):
+        if self.scanned_to is None or not self.lock.opened_after_last_modification():
+            self._sync()
+            self.lock.set_last_opened()
+
+    def _index_identity(self):
+        """
+        The number and path of the current index file, or None if there is none.
+        """
+        return max(_index_files(self.path), default=None)
+
+    def _sync(self):
+        identity = self._index_identity()
+        if self.scanned_to is None or identity != self.index_identity:
+            self._load_index(identity)
+        self._scan_tail()
+
+    def _load_index(self, identity, keep_cache=False):
+        self._close_files()
+        if self.index is not None:
+            self.index.close()
+        self.index = None
+        self.index_identity = identity
+        self.overlay = {}
+        if not keep_cache:
+            # we might have missed writes between our last scan and the new index
+            self.cache.clear()
+        if identity is None:
+            segments = self._segment_numbers()
+            self.scanned_to = (segments[0] if segments else 1), 0
+            return
+        with open(identity[1], "rb") as f:
+            self.index = Index(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self.scanned_to = self.index.covered
+
+    def _scan_tail(self):
+        """
+        Read the records after the point scanned to so far, adding them to the
+        overlay.
+        """
+        segment, offset = self.scanned_to
+        for next_segment in self._segment_numbers():
+            if next_segment < segment:
+                continue
+            if next_segment > segment:
+                segment, offset = next_segment, 0
+            f = self._segment(segment)
+            end = f.seek(0, os.SEEK_END)
+            f.seek(offset)
+            while True:
+                record = _read_record(f, end - offset)
+                if record is None:
+                    break
+                key, length, deletion = record
+                self.overlay[key] = None if deletion else (segment, offset, length)
+                offset += length
+                if key in self.cache:
+                    del self.cache[key]
+            if self.lock.exclusive and end > offset:
+                # an incomplete record, left by a writer that crashed
+                os.truncate(self._segment_path(segment), offset)
+        self.scanned_to = segment, offset
+
+    def _location(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        return self._index_location(key)
+
+    def _index_location(self, key):
+        if self.index is None:
+            return None
+        for location in self.index.candidates(key_hash(key)):
+            if self._read_key(location) == key:
+                return location
+        return None
+
+    def _read(self, location):
+        segment, offset, length = location
+        f = self._segment(segment)
+        f.seek(offset)
+        data = f.read(length)
+        key_length, _, _ = RECORD_HEADER.unpack_from(data)
+        return memoryview(data)[RECORD_HEADER.size + key_length :]
+
+    def _read_key(self, location):
+        segment, offset, _ = location
+        f = self._segment(segment)
+        f.seek(offset)
+        key_length, _, _ = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        return f.read(key_length).decode("utf-8")
+
+    def _append(self, key, data):
+        """
+        Append a record to the log, data is None for a deletion.
+        """
+        self._append_records([(key, data)])
+
+    def _append_records(self, records):
+        """
+        Append the (key, data) records to the log, flushing and marking the store
+        as modified once they are all written.
+        """
+        self.lock.check_exclusive()
+        if not records:
+            return
+        if self.append_file is None:
+            # pick up anything past what we have scanned, and truncate an incomplete
+            # record we might have stopped at while reading
+            self._scan_tail()
+        for key, data in records:
+            segment, offset = self.scanned_to
+            if offset >= self.segment_size:
+                if self.append_file is not None:
+                    self.append_file.close()
+                    self.append_file = None
+                segment, offset = segment + 1, 0
+            if self.append_file is None:
+                # pylint: disable=consider-using-with
+                self.append_file = open(self._segment_path(segment), "ab")
+            key_bytes = key.encode("utf-8")
+            value_length = TOMBSTONE if data is None else len(data)
+            crc = zlib.crc32(data or b"", zlib.crc32(key_bytes))
+            header = RECORD_HEADER.pack(len(key_bytes), value_length, crc)
+            self.append_file.write(header + key_bytes + (data or b""))
+            length = RECORD_HEADER.size + len(key_bytes) + len(data or b"")
+            self.overlay[key] = None if data is None else (segment, offset, length)
+            self.scanned_to = segment, offset + length
+        self.append_file.flush()
+        self.lock.set_last_modified()
+
+    def __getitem__(self, key):
+        self._update()
+        return self._get_without_checking(key)
+
+    def _get_without_checking(self, key):
+        result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
+            location = self._location(key)
+            if location is None:
+                raise KeyError(key)
+            result = self.cache[key] = pickle.loads(self._read(location))
+        return result
+
+    def __contains__(self, key):
+        self._update()
+        return key in self.cache or self._location(key) is not None
+
+    def __setitem__(self, key, value):
+        self.lock.check_exclusive()
+        self._update()
+        self._append(key, pickle.dumps(value, protocol=5))
+        self.cache[key] = value
+
+    def set_multiple(self, items):
+        """
+        Set each of the (key, value) pairs, appending them to the log together.
+        """
+        self.lock.check_exclusive()
+        self._update()
+        items = list(items)
+        self._append_records(
+            [(key, pickle.dumps(value, protocol=5)) for key, value in items]
+        )
+        for key, value in items:
+            self.cache[key] = value
+
+    def __delitem__(self, key):
+        self.lock.check_exclusive()
+        self._update()
+        if self._location(key) is None:
+            raise KeyError(key)
+        if key in self.cache:
+            del self.cache[key]
+        self._append(key, None)
+
+    def get_multiple(self, keys):
+        self._update()
+        return [self._get_without_checking(key) for key in keys]
+
+    def _live_locations(self):
+        """
+        Yields (key, location) for every entry in the store.
+        """
+        if self.index is not None:
+            for location in self.index.locations():
+                key = self._read_key(location)
+                if key not in self.overlay:
+                    yield key, location
+        for key, location in self.overlay.items():
+            if location is not None:
+                yield key, location
+
+    def _live_entries(self):
+        """
+        Yields (key hash, location) for every entry in the store. Unlike
+        _live_locations, only reads the keys of entries in the index that might
+        have been overwritten since.
+        """
+        superseded = {self._index_location(key) for key in self.overlay}
+        if self.index is not None:
+            for hash_value, location in self.index.entries():
+                if location not in superseded:
+                    yield hash_value, location
+        for key, location in self.overlay.items():
+            if location is not None:
+                yield key_hash(key), location
+
+    def items(self):
+        self._update()
+        return [
+            (key, pickle.loads(self._read(location)))
+            for key, location in self._live_locations()
+        ]
+
+    def count(self):
+        self._update()
+        return sum(1 for _ in self._live_entries())
+
+    def key_sizes(self):
+        """
+        List (key, size) for each entry, where size is the size in bytes of its
+        record, without loading the values.
+        """
+        self._update()
+        return [(key, location[2]) for key, location in self._live_locations()]
+
+    def _write_index(self, entries=None, covered=None):
+        """
+        Write an index of the given entries, (key hash, location) pairs, which covers
+        the log up to the given point. By default, index the current entries.
+
+        The index is written to a new file, numbered after the current one, since
+        the current one might be memory mapped by other instances.
+        """
+        self.lock.check_exclusive()
+        if entries is None:
+            entries, covered = list(self._live_entries()), self.scanned_to
+        number = max((n for n, _ in _index_files(self.path)), default=0) + 1
+        path = os.path.join(self.path, f"{INDEX_NAME}.{number}")
+        with open(path + ".tmp", "wb") as f:
+            f.write(Index.build(entries, covered))
+        os.replace(path + ".tmp", path)
+        self.lock.set_last_modified()
+        self._load_index(self._index_identity(), keep_cache=True)
+        self._scan_tail()
+        self._remove_unused_files()
+
+    def _remove_unused_files(self):
+        """
+        Remove the index files before the current one, and the segments before the
+        first one that has an entry, which the current index covers.
+        """
+        current, _ = self.index_identity
+        unused = [path for number, path in _index_files(self.path) if number < current]
+        first = min(
+            [self.index.covered[0]]
+            + [location[0] for _, location in self.index.entries()]
+            + [location[0] for location in self.overlay.values() if location]
+        )
+        unused += [self._segment_path(s) for s in self._segment_numbers() if s < first]
+        for path in unused:
+            try:
+                os.remove(path)
+            except (FileNotFoundError, PermissionError):
+                # still open elsewhere on Windows, removed by a later rewrite
+                pass
+
+    def compact(self):
+        """
+        Rewrite the log keeping only the current entries, and remove the old segments.
+        """
+        with self:
+            self._update()
+            segment = max(self._segment_numbers(), default=0) + 1
+            offset = 0
+            entries = []
+            # pylint: disable=consider-using-with
+            f = open(self._segment_path(segment), "wb")
+            try:
+                for hash_value, location in list(self._live_entries()):
+                    if offset >= self.segment_size:
+                        f.close()
+                        segment, offset = segment + 1, 0
+                        f = open(self._segment_path(segment), "wb")
+                    source = self._segment(location[0])
+                    source.seek(location[1])
+                    f.write(source.read(location[2]))
+                    entries.append((hash_value, (segment, offset, location[2])))
+                    offset += location[2]
+            finally:
+                f.close()
+            # the old segments are removed, as no entry refers to them anymore
+            self._write_index(entries, (segment, offset))
+
+    def compact_in_background(self):
+        """
+        Run compact() in a background thread, which is returned.
+        """
+        thread = threading.Thread(target=self.compact, daemon=True)
+        thread.start()
+        return thread
+
+    def _close_files(self):
+        for f in self.segments.values():
+            f.close()
+        self.segments = {}
+
+    def close(self):
+        self._close_files()
+        if self.index is not None:
+            self.index.close()
+        self.index = None
+        self.scanned_to = None
+
+
+class Index:
+    """
+    A memory-mapped index of the records in the log.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        magic, self.capacity, self.count, segment, offset = INDEX_HEADER.unpack_from(
+            data
+        )
+        assert magic == INDEX_MAGIC, "not a permacache log index"
+        self.covered = segment, offset
+
+    def _entry(self, slot):
+        return INDEX_ENTRY.unpack_from(
+            self.data, INDEX_HEADER.size + slot * INDEX_ENTRY.size
+        )
+
+    def candidates(self, hash_value):
+        """
+        Yields the locations of records whose key has the given hash.
+        """
+        slot = hash_value % self.capacity
+        while True:
+            entry_hash, segment, offset, length = self._entry(slot)
+            if segment == 0:
+                return
+            if entry_hash == hash_value:
+                yield segment, offset, length
+            slot = (slot + 1) % self.capacity
+
+    def locations(self):
+        for _, location in self.entries():
+            yield location
+
+    def entries(self):
+        """
+        Yields (key hash, location) for every record in the index.
+        """
+        for slot in range(self.capacity):
+            hash_value, segment, offset, length = self._entry(slot)
+            if segment != 0:
+                yield hash_value, (segment, offset, length)
+
+    def close(self):
+        self.data.close()
+
+    @staticmethod
+    def build(entries, covered):
+        """
+        The contents of an index of the given (key hash, location) pairs.
+        """
+        capacity = 16
+        while capacity < 2 * len(entries):
+            capacity *= 2
+        data = bytearray(INDEX_HEADER.size + capacity * INDEX_ENTRY.size)
+        INDEX_HEADER.pack_into(data, 0, INDEX_MAGIC, capacity, len(entries), *covered)
+        for hash_value, (segment, offset, length) in entries:
+            slot = hash_value % capacity
+            while INDEX_ENTRY.unpack_from(
+                data, INDEX_HEADER.size + slot * INDEX_ENTRY.size
+            )[1]:
+                slot = (slot + 1) % capacity
+            INDEX_ENTRY.pack_into(
+                data,
+                INDEX_HEADER.size + slot * INDEX_ENTRY.size,
+                hash_value,
+                segment,
+                offset,
+                length,
+            )
+        return bytes(data)
+
+
+def _index_files(path):
+    """
+    The index files in the store at path, as (number, path) pairs. The index of
+    stores written before indices were numbered is number 0.
+    """
+    result = []
+    for name in os.listdir(path):
+        if name == INDEX_NAME:
+            result.append((0, os.path.join(path, name)))
+        elif (
+            name.startswith(INDEX_NAME + ".") and name[len(INDEX_NAME) + 1 :].isdigit()
+        ):
+            result.append((int(name[len(INDEX_NAME) + 1 :]), os.path.join(path, name)))
+    return result
+
+
+def is_log_store(path):
+    """
+    Whether the directory at path holds a LogStore.
+    """
+    return bool(_index_files(path)) or any(
+        name.endswith(SEGMENT_SUFFIX) for name in os.listdir(path)
+    )
+
+
+def _read_record(f, remaining):
+    """
+    Read a record from the file, which has the given number of bytes remaining.
+    Returns its key, length, and whether it is a deletion, or None if there is no
+    complete record.
+    """
+    if remaining < RECORD_HEADER.size:
+        return None
+    key_length, value_length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+    deletion = value_length == TOMBSTONE
+    if deletion:
+        value_length = 0
+    length = RECORD_HEADER.size + key_length + value_length
+    if length > remaining:
+        return None
+    key_bytes = f.read(key_length)
+    if zlib.crc32(f.read(value_length), zlib.crc32(key_bytes)) != crc:
+        return None
+    try:
+        key = key_bytes.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return key, length, deletion
@@ -1,9 +1,13 @@
 import argparse
+import dbm
+import heapq
 import os
 import sys
 
 from .cache import from_file, to_file
-from .locked_shelf import LockedShelf
+from .locked_shelf import DRIVER_SUFFIXES, IndividualFileLockedStore, LockedShelf
+from .log_store import LogStore, is_log_store
+from .sqlite_store import SQLiteStore
 
 
 def cache_args(parser):
@@ -15,6 +19,10 @@ def count_args(parser):
     parser.add_argument("cache_name", help="The name of the cache to count keys in")
 
 
+def compact_args(parser):
+    parser.add_argument("cache_name", help="The name of the log cache to compact")
+
+
 def do_export(args):
     to_file(args.cache_name, normalize_zip(args.zip_path))
 
@@ -23,14 +31,97 @@ def do_import(args):
     from_file(args.cache_name, normalize_zip(args.zip_path))
 
 
-def count_keys_in_cache(cache_path):
-    """Count the number of keys in a cache directory."""
+def stats_args(parser):
+    parser.add_argument("cache_name", help="The name of the cache to describe")
+    parser.add_argument(
+        "--largest", type=int, default=10, help="The number of largest entries to list"
+    )
+
+
+def shelf_type_of_cache(cache_path):
+    """Determine the shelf type of a cache directory from the files in it."""
+    if dbm.whichdb(os.path.join(cache_path, "shelf")):
+        return "combined-file"
+    if os.path.exists(os.path.join(cache_path, "store.sqlite")):
+        return "sqlite"
+    if is_log_store(cache_path):
+        return "log"
+    return "individual-file"
+
+
+def open_cache(cache_path):
+    """Open the store of a cache directory, whatever its shelf type."""
     if not os.path.exists(cache_path):
         raise RuntimeError(f"Cache does not exist: {cache_path}")
+    shelf_type = shelf_type_of_cache(cache_path)
+    if shelf_type == "combined-file":
+        return LockedShelf(cache_path)
+    if shelf_type == "sqlite":
+        return SQLiteStore(cache_path)
+    if shelf_type == "log":
+        return LogStore(cache_path)
+    kwargs = {}
+    if os.path.exists(os.path.join(cache_path, "fanout")):
+        with open(os.path.join(cache_path, "fanout")) as f:
+            kwargs["fanout"] = int(f.read())
+    if os.path.exists(os.path.join(cache_path, "manifest.jsonl")):
+        kwargs["manifest"] = True
+    driver = driver_of_cache(cache_path)
+    if driver is not None:
+        kwargs["driver"] = driver
+    return IndividualFileLockedStore(cache_path, **kwargs)
+
+
+def driver_of_cache(cache_path):
+    """Determine the driver of an individual-file cache from its first entry."""
+    for _, _, filenames in os.walk(cache_path):
+        for filename in filenames:
+            for driver, suffix in DRIVER_SUFFIXES.items():
+                if filename.endswith(suffix):
+                    return driver
+    return None
+
+
+def count_keys_in_cache(cache_path):
+    """Count the number of keys in a cache directory."""
+    store = open_cache(cache_path)
+    try:
+        with store.reading() as shelf:
+            return shelf.count()
+    finally:
+        store.close()
+
+
+def cache_stats(cache_path, largest=10):
+    """
+    Describe the entries of a cache directory without loading their values.
+    Sizes are of the values as stored, so after any compression.
+    """
+    store = open_cache(cache_path)
+    try:
+        with store.reading() as shelf:
+            key_sizes = shelf.key_sizes()
+    finally:
+        store.close()
+    sizes = sorted(size for _, size in key_sizes)
+    return dict(
+        shelf_type=shelf_type_of_cache(cache_path),
+        count=len(sizes),
+        total_size=sum(sizes),
+        percentiles={
+            q: sizes[min(len(sizes) - 1, int(q / 100 * len(sizes)))] if sizes else 0
+            for q in (50, 90, 99, 100)
+        },
+        largest=heapq.nlargest(largest, key_sizes, key=lambda key_size: key_size[1]),
+    )
+
 
-    # Use LockedShelf for combined-file cache
-    with LockedShelf(cache_path) as shelf:
-        return len(list(shelf.items()))
+def format_size(size):
+    for unit in "B", "KB", "MB", "GB":
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
 
 
 def do_count(args):
@@ -47,6 +138,63 @@ def do_count(args):
         sys.exit(1)
 
 
+def do_stats(args):
+    from appdirs import user_cache_dir
+
+    cache_dir = user_cache_dir("permacache")
+    cache_path = os.path.join(cache_dir, args.cache_name)
+
+    try:
+        stats = cache_stats(cache_path, largest=args.largest)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(
+        f"Cache '{args.cache_name}' ({stats['shelf_type']}) contains"
+        f" {stats['count']} keys, {format_size(stats['total_size'])} in total"
+    )
+    print(
+        "Value sizes: "
+        + ", ".join(
+            f"{'max' if q == 100 else f'p{q}'} {format_size(size)}"
+            for q, size in stats["percentiles"].items()
+        )
+    )
+    if stats["largest"]:
+        print("Largest entries:")
+        for key, size in stats["largest"]:
+            if len(key) > 100:
+                key = key[:97] + "..."
+            print(f"{format_size(size):>10}  {key}")
+
+
+def compact_cache(cache_path):
+    """Compact a log-structured cache directory."""
+    if not os.path.exists(cache_path):
+        raise RuntimeError(f"Cache does not exist: {cache_path}")
+    if not is_log_store(cache_path):
+        raise RuntimeError(f"Not a log cache: {cache_path}")
+    store = LogStore(cache_path)
+    try:
+        store.compact()
+    finally:
+        store.close()
+
+
+def do_compact(args):
+    from appdirs import user_cache_dir
+
+    cache_dir = user_cache_dir("permacache")
+    cache_path = os.path.join(cache_dir, args.cache_name)
+
+    try:
+        compact_cache(cache_path)
+        print(f"Compacted cache '{args.cache_name}'")
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
 def normalize_zip(path):
     if path.endswith(".zip"):
         path = path[:-4]
@@ -72,6 +220,16 @@ def main():
     )
     count_args(count_parser)
     count_parser.set_defaults(fn=do_count)
+    stats_parser = subparsers.add_parser(
+        "stats", help="Describe the sizes of the entries in a cache"
+    )
+    stats_args(stats_parser)
+    stats_parser.set_defaults(fn=do_stats)
+    compact_parser = subparsers.add_parser(
+        "compact", help="Reclaim the space of overwritten entries in a log cache"
+    )
+    compact_args(compact_parser)
+    compact_parser.set_defaults(fn=do_compact)
 
     args = parser.parse_args()
     args.fn(args)
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+
+
+@dataclass
+class ManifestEntry:
+    key: str
+    # path of the file holding the entry, relative to the store
+    filename: str
+    size: int
+    write_time: float
+
+
+class Manifest:
+    """
+    An append-only log of the entries written to and deleted from a store with a
+    file per entry, so that its keys and their sizes can be listed without opening
+    every file. Each line is a json record, appended in a single write.
+
+    Reading the manifest is incremental, only the lines appended since the last read
+    are parsed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.offset = 0
+        self.identity = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def record_write(self, filename, key, size):
+        self._append(dict(file=filename, key=key, size=size, time=time.time()))
+
+    def record_delete(self, filename):
+        self._append(dict(file=filename, deleted=True))
+
+    def _append(self, record):
+        line = json.dumps(record) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def current_entries(self):
+        """
+        The entries currently in the manifest, as a dictionary from filename to
+        ManifestEntry.
+        """
+        self._refresh()
+        return self.entries
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.entries, self.offset, self.identity = {}, 0, None
+            return
+        if stat.st_ino != self.identity or stat.st_size < self.offset:
+            # rewritten since we last read it
+            self.entries, self.offset, self.identity = {}, 0, stat.st_ino
+        if stat.st_size == self.offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # a line might still be in the process of being written
+        data = data[: data.rfind(b"\n") + 1]
+        self.offset += len(data)
+        for line in data.decode("utf-8").splitlines():
+            record = json.loads(line)
+            if record.get("deleted"):
+                self.entries.pop(record["file"], None)
+            else:
+                self.entries[record["file"]] = ManifestEntry(
+                    record["key"], record["file"], record["size"], record["time"]
+                )
+
+    def rewrite(self, entries):
+        """
+        Replace the manifest with one containing exactly the given entries.
+        """
+        temporary_path = self.path + "." + uuid.uuid4().hex[:10]
+        with open(temporary_path, "w") as f:
+            for entry in entries:
+                record = dict(
+                    file=entry.filename,
+                    key=entry.key,
+                    size=entry.size,
+                    time=entry.write_time,
+                )
+                f.write(json.dumps(record) + "\n")
+        os.replace(temporary_path, self.path)
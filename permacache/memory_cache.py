@@ -0,0 +1,112 @@
+import sys
+from collections import OrderedDict
+
+# containers larger than this have their size extrapolated from a sample
+SIZE_SAMPLE = 100
+
+
+class MemoryCache:
+    """
+    The in-memory tier of a store. A least-recently-used mapping, bounded in its
+    number of entries and in the approximate total size of its values. Either
+    bound can be None, in which case it is not enforced.
+
+    Keeps count of hits, misses and evictions, which survive clear().
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def bounded(self):
+        return self.max_entries is not None or self.max_bytes is not None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Like dict.get, but counts hits and misses and marks the key as recently used.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self[key]
+
+    def __getitem__(self, key):
+        value, _ = self.entries[key]
+        if self.bounded:
+            self.entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        size = approximate_size(value) if self.max_bytes is not None else 0
+        if key in self.entries:
+            del self[key]
+        if self.max_bytes is not None and size > self.max_bytes:
+            # would evict everything else, and then itself
+            self.evictions += 1
+            return
+        self.entries[key] = value, size
+        self.total_bytes += size
+        self._evict()
+
+    def __delitem__(self, key):
+        _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def _evict(self):
+        while self.entries and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+def approximate_size(obj, depth=3):
+    """
+    Approximate the memory used by obj, in bytes. Counts the buffers of arrays and
+    tensors, and looks into containers up to the given depth, extrapolating from
+    a sample of the elements of large ones.
+    """
+    if type(obj).__module__ == "torch" and type(obj).__name__ in {
+        "Tensor",
+        "Parameter",
+    }:
+        return obj.element_size() * obj.nelement()
+    # includes the buffer for numpy arrays that own it, and deep usage for pandas
+    size = sys.getsizeof(obj)
+    if (
+        type(obj).__module__ == "numpy"
+        and type(obj).__name__ == "ndarray"
+        and obj.base is not None
+    ):
+        size += obj.nbytes
+    if depth == 0 or not isinstance(obj, (list, tuple, set, frozenset, dict)):
+        return size
+    elements = obj.items() if isinstance(obj, dict) else obj
+    sample_size = 0
+    for count, element in enumerate(elements):
+        if count == SIZE_SAMPLE:
+            return size + sample_size * len(obj) // SIZE_SAMPLE
+        if isinstance(obj, dict):
+            sample_size += approximate_size(element[0], depth - 1)
+            element = element[1]
+        sample_size += approximate_size(element, depth - 1)
+    return size + sample_size
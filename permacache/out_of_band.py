@@ -0,0 +1,150 @@
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import uuid
+
+MAGIC = b"OOB5"
+# the magic number, followed by the length of the json list of buffer files
+HEADER = struct.Struct("<4sI")
+# json list of the buffer files that could not be removed yet
+PENDING_REMOVAL = "pending_removal.json"
+
+
+class OutOfBandBuffers:
+    """
+    Pickles values with protocol 5, writing every buffer of at least threshold
+    bytes (the data of a large numpy array, for instance) to its own file in the
+    given directory rather than into the pickle. On load, those files are memory
+    mapped read-only, so loading a large array takes constant time and the pages
+    are shared between the processes reading it.
+
+    A value pickled this way is stored as a header listing its buffer files,
+    followed by the pickle. Without a threshold, or if no buffer is large enough,
+    the value is just the pickle, so stores remain readable either way.
+
+    On Windows, files that are memory mapped cannot be removed, so buffer files
+    that are still in use when their value is overwritten or deleted are listed in
+    PENDING_REMOVAL, and removed by a later removal once they are not.
+    """
+
+    def __init__(self, directory, threshold=None):
+        assert threshold is None or threshold > 0, "threshold must be positive"
+        self.directory = directory
+        self.threshold = threshold
+
+    def dumps(self, value, protocol=None, compress=lambda data: data):
+        """
+        Pickle the value, compressing the pickle, but not the buffers, with the
+        given function.
+        """
+        if self.threshold is None:
+            return compress(pickle.dumps(value, protocol=protocol))
+        names = []
+
+        def buffer_callback(buffer):
+            raw = buffer.raw()
+            if raw.nbytes < self.threshold:
+                # pickled in-band
+                return True
+            names.append(self._write_buffer(raw))
+            return False
+
+        try:
+            data = compress(
+                pickle.dumps(value, protocol=5, buffer_callback=buffer_callback)
+            )
+        except BaseException:
+            self._remove(names)
+            raise
+        if not names:
+            return data
+        listing = json.dumps(names).encode("utf-8")
+        return HEADER.pack(MAGIC, len(listing)) + listing + data
+
+    def _write_buffer(self, raw):
+        name = uuid.uuid4().hex + ".raw"
+        try:
+            f = open(os.path.join(self.directory, name), "wb")
+        except FileNotFoundError:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(os.path.join(self.directory, name), "wb")
+        with f:
+            f.write(raw)
+        return name
+
+    def loads(self, stored, decompress=lambda data: data, unpickler=pickle.Unpickler):
+        """
+        Load a value stored by dumps, with the given decompression function and
+        unpickler class.
+        """
+        names, start = self._split(stored)
+        data = decompress(stored[start:] if start else stored)
+        buffers = [self._map_buffer(name) for name in names]
+        return unpickler(io.BytesIO(data), buffers=buffers).load()
+
+    def _map_buffer(self, name):
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _split(stored):
+        if stored[: len(MAGIC)] != MAGIC:
+            return [], 0
+        _, length = HEADER.unpack_from(stored)
+        start = HEADER.size + length
+        return json.loads(bytes(stored[HEADER.size : start])), start
+
+    def payload(self, stored):
+        """
+        The possibly compressed pickle of a stored value, without its header.
+        """
+        return stored[self._split(stored)[1] :]
+
+    def remove_buffers(self, stored):
+        """
+        Remove the buffer files of a stored value, which only needs to be a prefix
+        of it as long as it contains the header. Processes that have them mapped
+        can keep reading them, see the class docstring for Windows.
+        """
+        self._remove(self._split(stored)[0])
+
+    def remove_pending(self):
+        """
+        Remove the buffer files that could not be removed before.
+        """
+        self._remove([])
+
+    def _remove(self, names):
+        pending_path = os.path.join(self.directory, PENDING_REMOVAL)
+        pending = []
+        if os.path.exists(pending_path):
+            with open(pending_path) as f:
+                pending = json.load(f)
+        left = []
+        for name in pending + names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                # still memory mapped, on Windows
+                left.append(name)
+        if left:
+            with open(pending_path, "w") as f:
+                json.dump(left, f)
+        elif pending:
+            os.remove(pending_path)
+
+    def read_header(self, path):
+        """
+        Read enough of the stored value in the given file to remove its buffers.
+        """
+        with open(path, "rb") as f:
+            prefix = f.read(HEADER.size)
+            if prefix[: len(MAGIC)] != MAGIC:
+                return prefix
+            _, length = HEADER.unpack(prefix)
+            return prefix + f.read(length)
@@ -0,0 +1,150 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+
+from .hash import stable_hash
+
+
+class SingleFlight:
+    """
+    Makes sure that only one caller at a time computes the value for a given key.
+    Other callers wait for it to finish, and then use the value it computed.
+
+    Within a process, waiting callers get the computed value directly. Across
+    processes, the caller computing a key holds a lease file for it in lease_dir,
+    and other processes wait for the lease to be released and then read the value
+    from the store. The lease is refreshed while the computation runs, and a lease
+    that has not been refreshed for lease_timeout seconds (e.g., because its
+    process died) is broken.
+
+    This is an optimization, not a guarantee: if a computation fails, or a lease is
+    broken, another caller computes the value again.
+
+    :param lease_dir: directory to store lease files in, or None to only
+        deduplicate within this process.
+    :param lease_timeout: seconds after which an unrefreshed lease is stale.
+    :param poll_interval: seconds between checks of a lease held elsewhere.
+    """
+
+    def __init__(self, lease_dir=None, *, lease_timeout=60, poll_interval=0.05):
+        self.lease_dir = lease_dir
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def run(self, key, lookup, compute):
+        """
+        Get the value for the given key.
+
+        :param key: the key, a string.
+        :param lookup: function returning (True, value) if the key is in the
+            store, and (False, None) otherwise.
+        :param compute: function that computes the value, stores it, and returns it.
+        """
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = Future(), threading.get_ident()
+                    leader = True
+                else:
+                    leader = False
+            future, owner = flight
+            if leader:
+                break
+            if owner == threading.get_ident():
+                # a reentrant call for the same key, waiting would deadlock
+                return compute()
+            try:
+                return future.result()
+            except Exception:  # pylint: disable=broad-exception-caught
+                # the leader failed, try again ourselves
+                continue
+        try:
+            value = self._lead(key, lookup, compute)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+        future.set_result(value)
+        return value
+
+    def _lead(self, key, lookup, compute):
+        if self.lease_dir is None:
+            return compute()
+        path = os.path.join(self.lease_dir, stable_hash(key)[:20] + ".lease")
+        while True:
+            lease = self._take_lease(path)
+            if lease is not None:
+                with lease:
+                    # the previous holder may have stored the value
+                    found, value = lookup()
+                    if found:
+                        return value
+                    return compute()
+            self._wait_for_lease(path)
+            found, value = lookup()
+            if found:
+                return value
+
+    def _take_lease(self, path):
+        os.makedirs(self.lease_dir, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return Lease(path, self.lease_timeout / 3)
+
+    def _wait_for_lease(self, path):
+        while True:
+            try:
+                age = time.time() - os.stat(path).st_mtime
+            except FileNotFoundError:
+                return
+            if age > self.lease_timeout:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return
+            time.sleep(self.poll_interval)
+
+
+class Lease:
+    """
+    A held lease file. Refreshes the file's modification time in the background
+    until exited, at which point the file is removed.
+    """
+
+    def __init__(self, path, refresh_interval):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._refresh, daemon=True)
+
+    def _refresh(self):
+        while not self.done.wait(self.refresh_interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                # broken by someone else, nothing to refresh
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
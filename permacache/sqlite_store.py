@@ -0,0 +1,235 @@
+import os
+import pickle
+import sqlite3
+import threading
+import weakref
+
+from .locked_shelf import SharedAccess
+from .memory_cache import MemoryCache
+
+# SQLite limits the number of parameters in a statement to 999 on older versions
+BATCH_SIZE = 500
+
+_MISSING = object()
+
+
+class SQLiteStore:
+    """
+    Like LockedShelf, but stores the entries in an SQLite database in WAL mode.
+    Any number of processes can read while one writes, and there is no limit on
+    the size of values.
+
+    Entering the store starts a write transaction, which is committed on exit, so
+    a block of writes is a single transaction. reading() starts a read transaction,
+    which sees a consistent snapshot of the store and never blocks or is blocked
+    by writers.
+
+    Mantains a cache of some of the elements of the dictionary, as LockedShelf
+    does, which is flushed when another connection commits to the database.
+
+    Each thread uses its own connection to the database.
+
+    :param multiprocess_safe: accepted for compatibility with the other stores,
+        this store is always safe to use from multiple processes.
+    :param timeout: seconds to wait for another writer before giving up.
+    """
+
+    def __init__(
+        self,
+        path,
+        multiprocess_safe=True,
+        *,
+        timeout=600,
+        max_cache_entries=None,
+        max_cache_bytes=None,
+    ):
+        del multiprocess_safe
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.database_path = os.path.join(path, "store.sqlite")
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = weakref.WeakSet()
+        self.cache = MemoryCache(max_cache_entries, max_cache_bytes)
+        self.cache_lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None and self.local.pid == os.getpid():
+            return connection
+        # connections cannot be shared with a forked child process
+        connection = sqlite3.connect(
+            self.database_path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=_Connection,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB)"
+        )
+        self.local.connection = connection
+        self.local.pid = os.getpid()
+        self.local.data_version = None
+        self.local.depth = 0
+        self.connections.add(connection)
+        return connection
+
+    def _update(self):
+        (data_version,) = self._execute("PRAGMA data_version").fetchone()
+        if data_version != self.local.data_version:
+            if self.local.data_version is not None:
+                with self.cache_lock:
+                    self.cache.clear()
+            self.local.data_version = data_version
+
+    def _execute(self, *args):
+        return self._connection().execute(*args)
+
+    def acquire(self, shared=False):
+        self._connection()
+        if self.local.depth == 0:
+            self._execute("BEGIN" if shared else "BEGIN IMMEDIATE")
+            self.local.shared = shared
+        elif not shared and self.local.shared:
+            raise RuntimeError("cannot write to the store while reading from it")
+        self.local.depth += 1
+        return self
+
+    def __enter__(self):
+        return self.acquire()
+
+    def reading(self):
+        """
+        Like entering the store, but only allows reading from it.
+        """
+        return SharedAccess(self)
+
+    def __exit__(self, exc_type, *args, **kwargs):
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            if exc_type is None:
+                self._execute("COMMIT")
+                return
+            self._execute("ROLLBACK")
+            if not self.local.shared:
+                # the memory cache has the values that were rolled back
+                with self.cache_lock:
+                    self.cache.clear()
+
+    def _check_writable(self):
+        assert (
+            getattr(self.local, "depth", 0) > 0 and not self.local.shared
+        ), "can only modify the store within a write transaction"
+
+    def __getitem__(self, key):
+        self._update()
+        return self._get_without_checking(key)
+
+    def _get_without_checking(self, key):
+        with self.cache_lock:
+            result = self.cache.get(key, _MISSING)
+        if result is _MISSING:
+            row = self._execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            result = pickle.loads(row[0])
+            with self.cache_lock:
+                self.cache[key] = result
+        return result
+
+    def __contains__(self, key):
+        self._update()
+        with self.cache_lock:
+            if key in self.cache:
+                return True
+        row = self._execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def __setitem__(self, key, value):
+        self._check_writable()
+        self._update()
+        self._execute(
+            "INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)",
+            (key, pickle.dumps(value)),
+        )
+        with self.cache_lock:
+            self.cache[key] = value
+
+    def set_multiple(self, items):
+        """
+        Set each of the (key, value) pairs, with a single statement.
+        """
+        self._check_writable()
+        self._update()
+        items = [(key, value, pickle.dumps(value)) for key, value in items]
+        self._connection().executemany(
+            "INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)",
+            [(key, data) for key, _, data in items],
+        )
+        with self.cache_lock:
+            for key, value, _ in items:
+                self.cache[key] = value
+
+    def __delitem__(self, key):
+        self._check_writable()
+        self._update()
+        with self.cache_lock:
+            if key in self.cache:
+                del self.cache[key]
+        if self._execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def items(self):
+        return [
+            (key, pickle.loads(value))
+            for key, value in self._execute("SELECT key, value FROM entries")
+        ]
+
+    def count(self):
+        return self._execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def key_sizes(self):
+        """
+        List (key, size) for each entry, where size is the size in bytes of the
+        stored value, without loading the values.
+        """
+        return list(self._execute("SELECT key, length(value) FROM entries"))
+
+    def get_multiple(self, keys):
+        self._update()
+        results = {}
+        with self.cache_lock:
+            for key in keys:
+                result = self.cache.get(key, _MISSING)
+                if result is not _MISSING:
+                    results[key] = result
+        missing = list({key for key in keys if key not in results})
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start : start + BATCH_SIZE]
+            rows = self._execute(
+                "SELECT key, value FROM entries WHERE key IN"
+                f" ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for key, value in rows:
+                results[key] = pickle.loads(value)
+                with self.cache_lock:
+                    self.cache[key] = results[key]
+        return [results[key] for key in keys]
+
+    def close(self):
+        for connection in list(self.connections):
+            connection.close()
+        self.connections.clear()
+        self.local = threading.local()
+
+
+class _Connection(sqlite3.Connection):
+    """
+    A connection that can be weakly referenced.
+    """
@@ -1,11 +1,24 @@
 import inspect
 
+_POSITIONAL_KINDS = (
+    inspect.Parameter.POSITIONAL_ONLY,
+    inspect.Parameter.POSITIONAL_OR_KEYWORD,
+)
 
-def parallelize_arguments(arguments, parallel_keys, indices=None):
+
+def parallel_columns(arguments, parallel_keys):
+    """
+    The values of the parallel arguments, checking that they have the same length.
+    """
     parallel_args = [arguments[k] for k in parallel_keys]
     lengths = {len(arg) for arg in parallel_args}
     if len(lengths) != 1:
         raise ValueError("Incompatible lengths: " + ", ".join(str(x) for x in lengths))
+    return parallel_args
+
+
+def parallelize_arguments(arguments, parallel_keys, indices=None):
+    parallel_args = parallel_columns(arguments, parallel_keys)
     if indices is not None:
         parallel_args = [[x[i] for i in indices] for x in parallel_args]
     parallel_args = [dict(zip(parallel_keys, values)) for values in zip(*parallel_args)]
@@ -23,3 +36,82 @@ def bind_arguments(fn, args, kwargs):
     arguments.apply_defaults()
     arguments = arguments.arguments
     return arguments
+
+
+def compile_binder(fn):
+    """
+    Produce a function (args, kwargs) -> arguments equivalent to
+    bind_arguments(fn, args, kwargs), but with the signature of fn resolved
+    once, up front.
+
+    Calls the fast path cannot bind (missing, duplicate or unexpected arguments)
+    are handed to inspect.Signature.bind, so they raise the same errors as before.
+    """
+    try:
+        signature = inspect.signature(fn)
+    except (TypeError, ValueError):
+        return lambda args, kwargs: bind_arguments(fn, args, kwargs)
+
+    parameters = list(signature.parameters.values())
+    positional = [p.name for p in parameters if p.kind in _POSITIONAL_KINDS]
+    positional_only = {
+        p.name for p in parameters if p.kind == inspect.Parameter.POSITIONAL_ONLY
+    }
+    keyword_only = [
+        p.name for p in parameters if p.kind == inspect.Parameter.KEYWORD_ONLY
+    ]
+    keyword_names = {
+        p.name
+        for p in parameters
+        if p.kind
+        in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+    }
+    var_positional = next(
+        (p.name for p in parameters if p.kind == inspect.Parameter.VAR_POSITIONAL),
+        None,
+    )
+    var_keyword = next(
+        (p.name for p in parameters if p.kind == inspect.Parameter.VAR_KEYWORD), None
+    )
+    defaults = {p.name: p.default for p in parameters if p.default is not p.empty}
+    num_positional = len(positional)
+
+    def slow_bind(args, kwargs):
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return arguments.arguments
+
+    def bind(args, kwargs):
+        if len(args) > num_positional and var_positional is None:
+            return slow_bind(args, kwargs)
+        if var_keyword is None and not keyword_names.issuperset(kwargs):
+            return slow_bind(args, kwargs)
+        result = {}
+        for i, name in enumerate(positional):
+            by_keyword = name in kwargs and name not in positional_only
+            if i < len(args):
+                if by_keyword:
+                    return slow_bind(args, kwargs)
+                result[name] = args[i]
+            elif by_keyword:
+                result[name] = kwargs[name]
+            elif name in defaults:
+                result[name] = defaults[name]
+            else:
+                return slow_bind(args, kwargs)
+        if var_positional is not None:
+            result[var_positional] = tuple(args[num_positional:])
+        for name in keyword_only:
+            if name in kwargs:
+                result[name] = kwargs[name]
+            elif name in defaults:
+                result[name] = defaults[name]
+            else:
+                return slow_bind(args, kwargs)
+        if var_keyword is not None:
+            result[var_keyword] = {
+                k: v for k, v in kwargs.items() if k not in keyword_names
+            }
+        return result
+
+    return bind
@@ -23,6 +23,7 @@ setuptools.setup(
     ],
     python_requires=">=3.6",
     install_requires=["filelock>=3.0.12", "appdirs>=1.4.4"],
+    extras_require={"zstd": ["zstandard"], "lz4": ["lz4"]},
     entry_points={
         "console_scripts": ["permacache=permacache.main:main"],
     },
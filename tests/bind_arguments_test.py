@@ -0,0 +1,72 @@
+import unittest
+
+from parameterized import parameterized
+
+from permacache.utils import bind_arguments, compile_binder
+
+
+# pylint: disable=unused-argument,keyword-arg-before-vararg
+def simple(x, y=2, z=3):
+    pass
+
+
+def varargs(x, y=2, z=3, *args):
+    pass
+
+
+def everything(a, /, b, c=3, *args, d, e=5, **kwargs):
+    pass
+
+
+def keyword_only(*, a, b=2):
+    pass
+
+
+CALLS = [
+    (simple, (1,), {}),
+    (simple, (1, 2, 3), {}),
+    (simple, (), dict(x=1, z=10)),
+    (simple, (1,), dict(z=10)),
+    (simple, (1, 2, 3, 4), {}),
+    (simple, (1,), dict(x=2)),
+    (simple, (), dict(y=2)),
+    (simple, (1,), dict(w=2)),
+    (varargs, (1,), {}),
+    (varargs, (1, 2, 3, 4, 5), {}),
+    (varargs, (), dict(x=1, args=2)),
+    (everything, (1, 2), dict(d=4)),
+    (everything, (1, 2, 3, 4, 5), dict(d=4, e=6, f=7, a=8)),
+    (everything, (1,), dict(b=2, d=4)),
+    (everything, (), dict(a=1, b=2, d=4)),
+    (everything, (1, 2), {}),
+    (keyword_only, (), dict(a=1)),
+    (keyword_only, (), dict(a=1, b=3)),
+    (keyword_only, (1,), {}),
+    (keyword_only, (), dict(b=3)),
+]
+
+
+def bind_or_error(binder, args, kwargs):
+    try:
+        return "ok", binder(args, kwargs)
+    except TypeError as e:
+        return "error", str(e)
+
+
+class CompileBinderTest(unittest.TestCase):
+    @parameterized.expand([(i,) for i in range(len(CALLS))])
+    def test_matches_bind_arguments(self, i):
+        fn, args, kwargs = CALLS[i]
+        expected = bind_or_error(
+            lambda args, kwargs: dict(bind_arguments(fn, args, kwargs)), args, kwargs
+        )
+        actual = bind_or_error(compile_binder(fn), args, kwargs)
+        self.assertEqual(expected, actual)
+        if expected[0] == "ok":
+            self.assertEqual(list(expected[1]), list(actual[1]))
+
+    def test_does_not_alias_kwargs(self):
+        kwargs = dict(d=4, f=7)
+        bound = compile_binder(everything)((1, 2), kwargs)
+        bound["kwargs"]["g"] = 8
+        self.assertEqual(kwargs, dict(d=4, f=7))
@@ -0,0 +1,68 @@
+import hashlib
+import tracemalloc
+import unittest
+
+import numpy as np
+import torch
+from parameterized import parameterized
+
+from permacache.hash import best_effort_to_buffer, best_effort_to_bytes, stable_hash
+
+rng = np.random.RandomState(0)
+
+ARRAYS = [
+    rng.randn(7, 5),
+    rng.randn(7, 5).T,
+    np.asfortranarray(rng.randn(3, 4)),
+    rng.randn(4, 6, 5)[:, ::2, 1:],
+    rng.randn(20)[::3],
+    rng.randn(3, 2000)[:, ::2],
+    np.array(3.0),
+    np.zeros((0, 3)),
+    np.zeros((3, 0)).T,
+    np.arange(10, dtype=">i4")[::-1],
+    np.array(["a", "bc"]),
+    np.arange(6).astype("datetime64[D]")[::2],
+    np.zeros(3, dtype=[("a", "i4"), ("b", "f8")]),
+    np.float32(2.5),
+    np.array([1, "x"], dtype=object),
+]
+
+
+class ByteBufferTest(unittest.TestCase):
+    @parameterized.expand([(i,) for i in range(len(ARRAYS))])
+    def test_same_bytes_as_tobytes(self, i):
+        array = ARRAYS[i]
+        buffer = best_effort_to_buffer(array)
+        expected = best_effort_to_bytes(array)
+        self.assertEqual(hashlib.sha256(expected).hexdigest(), buffer.sha256())
+        for chunk_size in (1, 8, 100, 2**24):
+            self.assertEqual(
+                expected,
+                b"".join(
+                    bytes(memoryview(c).cast("B")) for c in buffer.chunks(chunk_size)
+                ),
+            )
+
+    @parameterized.expand([(i,) for i in range(len(ARRAYS))])
+    def test_streaming_slow_bytes(self, i):
+        self.assertEqual(
+            stable_hash(ARRAYS[i], fast_bytes=False, version=2),
+            stable_hash(ARRAYS[i], fast_bytes=False, version=2, streaming=True),
+        )
+
+    def test_torch(self):
+        tensor = torch.randn(5, 6)
+        for t in (tensor, tensor.T, tensor[:, 1::2]):
+            self.assertEqual(
+                hashlib.sha256(best_effort_to_bytes(t)).hexdigest(),
+                best_effort_to_buffer(t).sha256(),
+            )
+
+    def test_no_full_copy(self):
+        for array in (np.ones((1000, 2000)), np.ones((4000, 2000))[:, ::2]):
+            tracemalloc.start()
+            stable_hash(array)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertLess(peak, array.nbytes / 2)
@@ -0,0 +1,180 @@
+import importlib.util
+import os
+import pickle
+import unittest
+
+import numpy as np
+
+from permacache.compression import (
+    GZIP_MAGIC,
+    LZ4_MAGIC,
+    ZSTD_MAGIC,
+    CompressedValues,
+    create_codec,
+)
+from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+
+from . import locked_shelf_test
+
+HAS_ZSTD = importlib.util.find_spec("zstandard") is not None
+HAS_LZ4 = importlib.util.find_spec("lz4") is not None
+
+
+def small_values(count):
+    return {
+        f"key {i}": {"name": f"item {i}", "score": i / 7, "tags": ["a", "b"]}
+        for i in range(count)
+    }
+
+
+class CodecTest(unittest.TestCase):
+    def check_roundtrip(self, name, magic):
+        data = pickle.dumps(np.arange(1000))
+        for level in None, 1:
+            codec = create_codec(name, level)
+            compressed = codec.compress(data)
+            self.assertTrue(compressed.startswith(magic))
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(codec.decompress(compressed), data)
+
+    def test_gzip(self):
+        self.check_roundtrip("gzip", GZIP_MAGIC)
+
+    @unittest.skipUnless(HAS_ZSTD, "zstandard not installed")
+    def test_zstd(self):
+        self.check_roundtrip("zstd", ZSTD_MAGIC)
+
+    @unittest.skipUnless(HAS_LZ4, "lz4 not installed")
+    def test_lz4(self):
+        self.check_roundtrip("lz4", LZ4_MAGIC)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            create_codec("brotli")
+
+    def test_no_compression(self):
+        self.assertIsNone(create_codec(None))
+        data = pickle.dumps([1, 2, 3])
+        self.assertEqual(CompressedValues().compress(data), data)
+        self.assertEqual(CompressedValues().decompress(data), data)
+
+    def test_reads_any_codec(self):
+        data = pickle.dumps("abc" * 100)
+        names = ["gzip"] + ["zstd"] * HAS_ZSTD + ["lz4"] * HAS_LZ4
+        for name in names:
+            compressed = CompressedValues(name).compress(data)
+            for other in [None] + names:
+                self.assertEqual(CompressedValues(other).decompress(compressed), data)
+
+
+class LockedShelfTestGzip(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = LockedShelf("temp/tempshelf", compression="gzip")
+
+    def test_values_compressed(self):
+        with self.shelf as s:
+            s["a"] = "b" * 1000
+        with LockedShelf("temp/tempshelf") as s:
+            _, size = s.key_sizes()[0]
+            self.assertLess(size, 100)
+            # readable without specifying the compression
+            self.assertEqual(s["a"], "b" * 1000)
+
+    def test_change_compression(self):
+        with LockedShelf("temp/tempshelf") as s:
+            s["uncompressed"] = 1
+        with self.shelf as s:
+            s["compressed"] = 2
+            self.assertEqual(s["uncompressed"], 1)
+            self.assertEqual(s["compressed"], 2)
+
+
+@unittest.skipUnless(HAS_ZSTD, "zstandard not installed")
+class LockedShelfTestZstd(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = LockedShelf("temp/tempshelf", compression="zstd")
+
+    def test_dictionary(self):
+        values = small_values(1000)
+        with self.shelf as s:
+            for key, value in values.items():
+                s[key] = value
+        with self.shelf.reading() as s:
+            size_before = sum(size for _, size in s.key_sizes())
+        self.shelf.train_compression_dictionary(dict_size=4096)
+        with self.shelf as s:
+            for key, value in values.items():
+                s[key] = value
+            size_after = sum(size for _, size in s.key_sizes())
+        self.assertLess(size_after, size_before * 0.75)
+        self.shelf.close()
+        with LockedShelf("temp/tempshelf") as s:
+            self.assertEqual(dict(s.items()), values)
+
+
+@unittest.skipUnless(HAS_ZSTD, "zstandard not installed")
+class IndividualFileLockedStoreTestZstd(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = IndividualFileLockedStore(
+            "temp/tempshelf", driver="pickle.zst", compression_level=5
+        )
+
+    def test_put_and_access(self):
+        super().test_put_and_access()
+        self.assertEqual(os.listdir("temp/tempshelf"), [".a.pkl.zst"])
+        with open("temp/tempshelf/.a.pkl.zst", "rb") as f:
+            self.assertTrue(f.read().startswith(ZSTD_MAGIC))
+
+    def test_dictionary(self):
+        values = small_values(1000)
+        with self.shelf as s:
+            for key, value in values.items():
+                s[key] = value
+            s["before"] = values["key 0"]
+        dict_id = self.shelf.train_compression_dictionary(dict_size=4096)
+        self.assertEqual(
+            sorted(os.listdir("temp/tempshelf/dictionaries")),
+            sorted([f"{dict_id}.zdict", "current"]),
+        )
+        with self.shelf as s:
+            s["after"] = values["key 0"]
+        self.assertLess(
+            os.path.getsize("temp/tempshelf/.after.pkl.zst"),
+            os.path.getsize("temp/tempshelf/.before.pkl.zst"),
+        )
+        # a new store picks up the dictionary, and reads entries written with and
+        # without it
+        other = IndividualFileLockedStore("temp/tempshelf", driver="pickle.zst")
+        with other as s:
+            self.assertEqual(s["after"], values["key 0"])
+            self.assertEqual(s["before"], values["key 0"])
+            s["other"] = values["key 0"]
+        self.assertLess(
+            os.path.getsize("temp/tempshelf/.other.pkl.zst"),
+            os.path.getsize("temp/tempshelf/.before.pkl.zst"),
+        )
+
+    def test_get_multiple(self):
+        # each reading thread gets its own decompressor
+        values = small_values(500)
+        with self.shelf as s:
+            for key, value in values.items():
+                s[key] = value
+        with self.shelf.reading() as s:
+            self.assertEqual(s.get_multiple(list(values)), list(values.values()))
+
+    def test_dictionary_requires_zstd(self):
+        with self.assertRaises(AssertionError):
+            IndividualFileLockedStore("temp/tempshelf").train_compression_dictionary()
+
+
+@unittest.skipUnless(HAS_LZ4, "lz4 not installed")
+class IndividualFileLockedStoreTestLz4(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = IndividualFileLockedStore("temp/tempshelf", driver="pickle.lz4")
+
+    def test_put_and_access(self):
+        super().test_put_and_access()
+        self.assertEqual(os.listdir("temp/tempshelf"), [".a.pkl.lz4"])
+        with open("temp/tempshelf/.a.pkl.lz4", "rb") as f:
+            self.assertTrue(f.read().startswith(LZ4_MAGIC))
@@ -1,6 +1,10 @@
 import unittest
 
+import numpy as np
+
+from permacache import stringify
 from permacache.dict_function import dict_function, drop_if_equal, parallel_output
+from permacache.hash import valid_versions
 
 
 class DictFunctionTest(unittest.TestCase):
@@ -68,6 +72,39 @@ class DictFunctionTest(unittest.TestCase):
             dict_function(sig, fn)([[2, 3, 4], "abcd"], dict(), parallel=("t", "k"))
         self.assertEqual("Incompatible lengths: 3, 4", str(context.exception))
 
+    def check_stringify_parallel(self, sig, args, kwargs, parallel):
+        key = dict_function(sig, fn)
+        for version in valid_versions:
+            self.assertEqual(
+                [
+                    stringify(k, version=version)
+                    for k in key(args, kwargs, parallel=parallel).values
+                ],
+                key.stringify_parallel(
+                    args, kwargs, parallel=parallel, version=version
+                ),
+            )
+
+    def test_stringify_parallel(self):
+        self.check_stringify_parallel(
+            dict(t=lambda t: t**2, k=str), [[2, 3, 4]], dict(), "t"
+        )
+        self.check_stringify_parallel(
+            dict(v=lambda v: {None: v}), [[2, 3, 4], "abc"], dict(), ("t", "k")
+        )
+        self.check_stringify_parallel(dict(), [np.arange(3)], dict(v=[1.5]), ("t",))
+
+    def test_stringify_parallel_drop_if(self):
+        self.check_stringify_parallel(
+            dict(t=drop_if_equal(3), k=drop_if_equal(2)), [[2, 3, 4]], dict(), "t"
+        )
+
+    def test_stringify_parallel_lengths(self):
+        with self.assertRaises(ValueError):
+            dict_function(dict(), fn).stringify_parallel(
+                [[2, 3, 4], "abcd"], dict(), parallel=("t", "k"), version=2
+            )
+
 
 def fn(t, k=2, v=3):
     del t, k, v
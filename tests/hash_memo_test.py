@@ -0,0 +1,128 @@
+import gc
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import torch
+
+from permacache import HashMemo, cache, hash_memo_global, stable_hash
+
+
+def frozen(array):
+    array.flags.writeable = False
+    return array
+
+
+def total(x):
+    return x.sum()
+
+
+class HashMemoTest(unittest.TestCase):
+    def setUp(self):
+        self.memo = HashMemo(max_entries=3, min_bytes=0)
+
+    def hash_twice(self, obj):
+        with hash_memo_global(self.memo):
+            first = stable_hash(obj)
+            second = stable_hash(obj)
+        self.assertEqual(first, stable_hash(obj))
+        self.assertEqual(second, first)
+        return first
+
+    def test_frozen_array(self):
+        self.hash_twice(frozen(np.arange(100.0)))
+        self.assertEqual((self.memo.hits, self.memo.misses), (1, 1))
+
+    def test_nested(self):
+        array = frozen(np.arange(100.0))
+        self.hash_twice({"x": [array, array], "y": 2})
+        self.assertEqual((self.memo.hits, self.memo.misses), (3, 1))
+
+    def test_writeable_array(self):
+        array = np.arange(100.0)
+        self.hash_twice(array)
+        self.assertEqual((self.memo.hits, self.memo.misses), (0, 0))
+
+    def test_frozen_view_of_writeable_array(self):
+        array = np.arange(100.0)
+        view = frozen(array[::2])
+        with hash_memo_global(self.memo):
+            before = stable_hash(view)
+            array[0] = 17
+            after = stable_hash(view)
+        self.assertNotEqual(before, after)
+        self.assertEqual(self.memo.hits, 0)
+
+    def test_tensor_version(self):
+        tensor = torch.arange(100.0)
+        with hash_memo_global(self.memo):
+            before = stable_hash(tensor)
+            self.assertEqual(before, stable_hash(tensor))
+            tensor[0] = 17
+            after = stable_hash(tensor)
+        self.assertNotEqual(before, after)
+        self.assertEqual(after, stable_hash(tensor))
+        self.assertEqual((self.memo.hits, self.memo.misses), (1, 2))
+
+    def test_eviction(self):
+        arrays = [frozen(np.arange(100.0) + i) for i in range(5)]
+        with hash_memo_global(self.memo):
+            for array in arrays:
+                stable_hash(array)
+        self.assertEqual(len(self.memo.entries), 3)
+        self.assertEqual(self.memo.evictions, 2)
+
+    def test_garbage_collected(self):
+        with hash_memo_global(self.memo):
+            stable_hash(frozen(np.arange(100.0)))
+        gc.collect()
+        self.assertEqual(len(self.memo), 0)
+
+    def test_collected_under_lock(self):
+        # the weakref callback can run during an allocation made under the lock
+        array = frozen(np.arange(100.0))
+        with hash_memo_global(self.memo):
+            stable_hash(array)
+
+        def collect():
+            nonlocal array
+            with self.memo._lock:  # pylint: disable=protected-access
+                del array
+                gc.collect()
+
+        thread = threading.Thread(target=collect, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), "deadlocked")
+        self.assertEqual(len(self.memo), 0)
+
+    def test_cached_function(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.addCleanup(setattr, cache, "CACHE", cache.CACHE)
+            cache.CACHE = directory
+            hashed = cache.permacache("f", dict(x=stable_hash))(total)
+            by_default = cache.permacache("g")(total)
+            array = frozen(np.arange(100.0))
+            with hash_memo_global(self.memo):
+                for _ in range(3):
+                    hashed(array)
+                self.assertEqual((self.memo.hits, self.memo.misses), (2, 1))
+                # the key includes the bytes themselves
+                by_default(array)
+                self.assertEqual((self.memo.hits, self.memo.misses), (2, 1))
+            hashed.shelf.close()
+            by_default.shelf.close()
+
+    def test_min_bytes(self):
+        memo = HashMemo(min_bytes=10**6)
+        with hash_memo_global(memo):
+            stable_hash(frozen(np.arange(100.0)))
+        self.assertEqual((memo.hits, memo.misses), (0, 0))
+
+    def test_restores_previous(self):
+        with hash_memo_global(self.memo):
+            with hash_memo_global() as inner:
+                self.assertIs(hash_memo_global.memo, inner)
+            self.assertIs(hash_memo_global.memo, self.memo)
+        self.assertIsNone(hash_memo_global.memo)
@@ -0,0 +1,157 @@
+import mmap
+import pickle
+import tempfile
+import unittest
+from collections import namedtuple
+
+import numpy as np
+
+from permacache import cache
+from permacache.lazy import LazyDict, LazyTuple, SegmentedValue
+from permacache.locked_shelf import LockedShelf
+
+Point = namedtuple("Point", ["x", "y"])
+
+
+class Unpicklable:
+    """
+    Raises when unpickled, to check that a field is not unpickled.
+    """
+
+    def __reduce__(self):
+        return _fail, ()
+
+
+def _fail():
+    raise AssertionError("unpickled")
+
+
+def roundtrip(value, protocol=pickle.DEFAULT_PROTOCOL):
+    return pickle.loads(pickle.dumps(SegmentedValue.of(value), protocol=protocol))
+
+
+class SegmentedValueTest(unittest.TestCase):
+    def test_dict(self):
+        proxy = roundtrip({"a": 1, "b": Unpicklable()}).proxy()
+        self.assertIsInstance(proxy, LazyDict)
+        self.assertEqual(len(proxy), 2)
+        self.assertEqual(list(proxy), ["a", "b"])
+        self.assertIn("b", proxy)
+        self.assertEqual(proxy["a"], 1)
+        with self.assertRaises(AssertionError):
+            proxy["b"]  # pylint: disable=pointless-statement
+
+    def test_tuple(self):
+        proxy = roundtrip((1, [2], Unpicklable())).proxy()
+        self.assertIsInstance(proxy, LazyTuple)
+        self.assertEqual(len(proxy), 3)
+        self.assertEqual(proxy[1], [2])
+        self.assertIs(proxy[1], proxy[-2])
+        self.assertEqual(proxy[:2], (1, [2]))
+
+    def test_equality(self):
+        self.assertEqual(roundtrip({"a": [1]}).proxy(), {"a": [1]})
+        self.assertEqual(roundtrip((1, 2)).proxy(), (1, 2))
+        self.assertNotEqual(roundtrip((1, 2)).proxy(), [1, 2])
+        self.assertEqual(hash(roundtrip((1, 2)).proxy()), hash((1, 2)))
+
+    def test_value(self):
+        value = roundtrip([1, 2, 3]).proxy()
+        self.assertEqual(type(value), list)
+        self.assertEqual(value, [1, 2, 3])
+        value = roundtrip(2.5).proxy()
+        self.assertIsInstance(value, float)
+        self.assertEqual((1 + value, -value, f"{value:.2f}"), (3.5, -2.5, "2.50"))
+
+    def test_fields_loaded_once(self):
+        stored = roundtrip({"a": [1]})
+        self.assertIs(stored.proxy()["a"], stored.proxy()["a"])
+        stored = roundtrip([1])
+        self.assertIs(stored.proxy(), stored.proxy())
+
+    def test_subclasses_whole(self):
+        value = roundtrip(Point(1, 2)).materialize()
+        self.assertEqual(type(value), Point)
+
+    def test_materialize(self):
+        for value in {"a": 1, "b": (2,)}, (1, "2"), "3":
+            for protocol in 4, 5:
+                self.assertEqual(roundtrip(value, protocol).materialize(), value)
+
+
+class LazyCacheTest(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        cache.CACHE = self.dir.name
+        self.calls = 0
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def function(self, x):
+        self.calls += 1
+        return {"small": x, "large": np.arange(100_000) * x}
+
+    def test_lazy_hit(self):
+        f = cache.permacache("f", lazy=True)(self.function)
+        self.assertEqual(f(2)["small"], 2)
+        self.assertIsInstance(f(2), LazyDict)
+        self.assertEqual(f(2)["large"][-1], 199_998)
+        self.assertEqual(self.calls, 1)
+
+    def test_other_values(self):
+        def function(x):
+            self.calls += 1
+            return x / 2
+
+        f = cache.permacache("g", lazy=True)(function)
+        for _ in range(2):
+            # the same on a miss and on a hit
+            value = f(5)
+            self.assertIsInstance(value, float)
+            self.assertEqual((1 + value, -value, abs(-value)), (3.5, -2.5, 2.5))
+            self.assertEqual(f"{value:.2f}", "2.50")
+        self.assertEqual(self.calls, 1)
+
+    def test_memory_cache_hits_do_not_unpickle(self):
+        f = cache.permacache("f", lazy=True)(self.function)
+        f(2)
+        first = f(2)["large"]
+        self.assertIs(f(2)["large"], first)
+
+    def test_read_without_lazy(self):
+        cache.permacache("f", lazy=True)(self.function)(2)
+        value = cache.permacache("f")(self.function)(2)
+        self.assertIsInstance(value, dict)
+        self.assertEqual(value["small"], 2)
+        self.assertEqual(self.calls, 1)
+
+    def test_read_with_lazy(self):
+        cache.permacache("f")(self.function)(2)
+        value = cache.permacache("f", lazy=True)(self.function)(2)
+        self.assertIsInstance(value, dict)
+        self.assertEqual(self.calls, 1)
+
+    def test_parallel(self):
+        def function(xs):
+            self.calls += len(xs)
+            return [(x, x + 1) for x in xs]
+
+        f = cache.permacache("g", parallel=("xs",), lazy=True)(function)
+        self.assertEqual(f([1, 2]), [(1, 2), (2, 3)])
+        self.assertEqual(f([1, 2, 3]), [(1, 2), (2, 3), (3, 4)])
+        self.assertEqual(self.calls, 3)
+
+    def test_out_of_band(self):
+        f = cache.permacache("f", lazy=True, out_of_band_threshold=10_000)(
+            self.function
+        )
+        f(2)
+        f.shelf.close()
+        shelf = LockedShelf(f.shelf.path, out_of_band_threshold=10_000)
+        with shelf.reading() as db:
+            [stored] = [value for _, value in db.items()]
+        shelf.close()
+        self.assertIsInstance(stored.segments[1], mmap.mmap)
+        self.assertEqual(stored.proxy()["large"][-1], 199_998)
@@ -1,15 +1,20 @@
+import dbm
 import gzip
 import json
+import multiprocessing
 import os
 import pickle
 import random
 import shutil
+import threading
+import time
 import unittest
 
 import numpy as np
+from filelock import FileLock, Timeout
 
 from permacache.hash import stable_hash
-from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+from permacache.locked_shelf import IndividualFileLockedStore, Lock, LockedShelf
 
 
 class LockedShelfTest(unittest.TestCase):
@@ -63,12 +68,300 @@ class LockedShelfTest(unittest.TestCase):
             self.assertTrue("a" * 100 in s)
             self.assertFalse(stable_hash("a" * 100)[:20] in s)
 
+    def test_set_multiple(self):
+        with self.shelf as s:
+            s["a"] = "old"
+            s.set_multiple([("a", "new"), ("b", "1"), ("c", "2"), ("b", "3")])
+            s.set_multiple([])
+            self.assertEqual(s.get_multiple(["a", "b", "c"]), ["new", "3", "2"])
+        self.shelf.close()
+        with self.shelf.reading() as s:
+            self.assertEqual(sorted(s.items()), [("a", "new"), ("b", "3"), ("c", "2")])
+
 
 class LockedShelfTestLargeObjects(LockedShelfTest):
     def setUp(self):
         self.shelf = LockedShelf("temp/tempshelf", allow_large_values=True)
 
 
+class LockedShelfTestBoundedCache(LockedShelfTest):
+    def setUp(self):
+        self.shelf = LockedShelf(
+            "temp/tempshelf", max_cache_entries=5, max_cache_bytes=2000
+        )
+
+    def test_cache_stays_bounded(self):
+        with self.shelf as s:
+            for i in range(100):
+                s[str(i)] = "x" * i
+            for i in range(100):
+                self.assertEqual(s[str(i)], "x" * i)
+            self.assertLessEqual(len(s.cache), 5)
+            self.assertLessEqual(s.cache.total_bytes, 2000)
+            self.assertGreater(s.cache.evictions, 0)
+
+    def test_numpy_objects_that_are_not_arrays(self):
+        with self.shelf as s:
+            s["a"] = {"reduce": np.add, "dtype": np.dtype("float32")}
+        self.shelf.close()
+        with self.shelf.reading() as s:
+            self.assertIs(s["a"]["reduce"], np.add)
+
+
+class GenerationTest(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+    def test_generation_counter(self):
+        os.makedirs("temp")
+        first, second = Lock("temp/lock", "temp/gen"), Lock("temp/lock", "temp/gen")
+        with first:
+            self.assertEqual(first.generation(), 0)
+            first.set_last_opened()
+            self.assertTrue(first.opened_after_last_modification())
+        with second:
+            second.set_last_modified()
+            second.set_last_modified()
+            self.assertTrue(second.opened_after_last_modification())
+        with first:
+            self.assertEqual(first.generation(), 2)
+            self.assertFalse(first.opened_after_last_modification())
+
+    def test_write_elsewhere_flushes_cache(self):
+        first = LockedShelf("temp/tempshelf")
+        second = LockedShelf("temp/tempshelf")
+        try:
+            with first as s:
+                s["a"] = 1
+                self.assertEqual(s["a"], 1)
+            with first as s:
+                self.assertIn("a", s.cache)
+            with second as s:
+                s["b"] = 2
+            with first as s:
+                self.assertFalse("c" in s)
+                self.assertNotIn("a", s.cache)
+        finally:
+            first.close()
+            second.close()
+
+
+class SetMultipleTest(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+    def test_visible_elsewhere(self):
+        first = LockedShelf("temp/tempshelf")
+        second = LockedShelf("temp/tempshelf")
+        try:
+            with first as s:
+                s["a"] = 0
+                generation = s.lock.generation()
+                s.set_multiple((str(i), i * i) for i in range(1000))
+                # marked as modified once for the whole batch
+                self.assertEqual(s.lock.generation(), generation + 1)
+            with second.reading() as s:
+                self.assertEqual(s.count(), 1001)
+                self.assertEqual(s.get_multiple(["a", "0", "999"]), [0, 0, 999**2])
+        finally:
+            first.close()
+            second.close()
+
+    def test_unpicklable(self):
+        shelf = LockedShelf("temp/tempshelf", out_of_band_threshold=1000)
+        try:
+            with shelf as s:
+                with self.assertRaises(TypeError):
+                    s.set_multiple([("a", np.zeros(1000)), ("b", threading.Lock())])
+                self.assertFalse("a" in s)
+                self.assertEqual(os.listdir("temp/tempshelf/buffers"), [])
+                s.set_multiple([("a", np.zeros(1000)), ("a", np.ones(1000))])
+                self.assertEqual(len(os.listdir("temp/tempshelf/buffers")), 1)
+            shelf.close()
+            with shelf.reading() as s:
+                np.testing.assert_array_equal(s["a"], np.ones(1000))
+        finally:
+            shelf.close()
+
+
+def write_in_process(path, items):
+    shelf = LockedShelf(path, multiprocess_safe=True, keep_open=True)
+    with shelf as s:
+        for k, v in items:
+            s[k] = v
+    shelf.close()
+
+
+def check_in_process(path, items):
+    shelf = LockedShelf(path, multiprocess_safe=True, keep_open=True)
+    with shelf.reading() as s:
+        assert [s[k] for k, _ in items] == [v for _, v in items]
+    shelf.close()
+
+
+class KeepOpenTest(unittest.TestCase):
+    def setUp(self):
+        self.shelf = LockedShelf(
+            "temp/tempshelf", multiprocess_safe=True, keep_open=True
+        )
+
+    def tearDown(self):
+        self.shelf.close()
+        shutil.rmtree("temp")
+
+    def run_in_process(self, target, items):
+        process = multiprocessing.get_context("spawn").Process(
+            target=target, args=("temp/tempshelf", items)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+    def test_stays_open_while_unchanged(self):
+        with self.shelf as s:
+            s["a"] = 1
+        # flushed for other processes
+        self.assertIsNone(self.shelf.shelf)
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+        handle = self.shelf.shelf
+        self.assertIsNotNone(handle)
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertIn("a", s.cache)
+        self.assertIs(self.shelf.shelf, handle)
+
+    def test_other_process_writes(self):
+        with self.shelf as s:
+            s["a"] = 1
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertFalse("b" in s)
+        handle = self.shelf.shelf
+        self.run_in_process(write_in_process, [("a", 2), ("b", 3)])
+        with self.shelf.reading() as s:
+            self.assertEqual(s.get_multiple(["a", "b"]), [2, 3])
+        self.assertIsNot(self.shelf.shelf, handle)
+        with self.shelf as s:
+            s["c"] = 4
+        self.run_in_process(check_in_process, [("a", 2), ("b", 3), ("c", 4)])
+        # a reader does not invalidate anything
+        with self.shelf.reading() as s:
+            self.assertEqual(s["c"], 4)
+            self.assertIn("a", s.cache)
+
+
+class SharedLockTest(unittest.TestCase):
+    def setUp(self):
+        os.makedirs("temp")
+
+    def tearDown(self):
+        shutil.rmtree("temp")
+
+    def test_shared_locks_coexist(self):
+        first, second = Lock("temp/lock", "temp/gen"), Lock("temp/lock", "temp/gen")
+        first.acquire(shared=True)
+        second.acquire(shared=True)
+        with self.assertRaises(Timeout):
+            FileLock("temp/lock", timeout=0).acquire()
+        first.release()
+        second.release()
+        with FileLock("temp/lock", timeout=0):
+            pass
+
+    def test_exclusive_excludes_shared(self):
+        first, second = Lock("temp/lock", "temp/gen"), Lock("temp/lock", "temp/gen")
+        with first:
+            self.assertTrue(first.exclusive)
+            thread = threading.Thread(target=second.acquire, kwargs=dict(shared=True))
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        self.assertFalse(second.exclusive)
+
+    def test_readers_do_not_starve_writer(self):
+        done = threading.Event()
+
+        def read():
+            lock = Lock("temp/lock", "temp/gen")
+            while not done.is_set():
+                lock.acquire(shared=True)
+                time.sleep(0.02)
+                lock.release()
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        time.sleep(0.1)
+        start = time.time()
+        try:
+            with Lock("temp/lock", "temp/gen"):
+                elapsed = time.time() - start
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        self.assertLess(elapsed, 1)
+
+    def test_reentrant(self):
+        lock = Lock("temp/lock", "temp/gen")
+        with lock:
+            lock.acquire(shared=True)
+            self.assertTrue(lock.exclusive)
+            lock.set_last_modified()
+            lock.release()
+        lock.acquire(shared=True)
+        with self.assertRaises(RuntimeError):
+            lock.acquire()
+        with self.assertRaises(AssertionError):
+            lock.set_last_modified()
+        lock.release()
+        self.assertEqual(lock.depth, 0)
+
+    def test_reading_shelf(self):
+        shelf = LockedShelf("temp/tempshelf", multiprocess_safe=True)
+        with shelf.reading() as s:
+            self.assertFalse("a" in s)
+            with self.assertRaises(AssertionError):
+                s["a"] = 1
+        self.assertEqual(
+            sorted(os.listdir("temp/tempshelf")), ["generation", "lock", "lock.gate"]
+        )
+        with shelf as s:
+            s["a"] = 1
+        with shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertEqual(s.get_multiple(["a"]), [1])
+
+    def test_reading_corrupted_shelf(self):
+        shelf = LockedShelf("temp/tempshelf")
+        with shelf as s:
+            s["a"] = 1
+        shelf.close()
+        for name in os.listdir("temp/tempshelf"):
+            if name.startswith("shelf"):
+                with open(os.path.join("temp/tempshelf", name), "wb") as f:
+                    f.write(b"garbage")
+        # rather than reading as an empty cache
+        with self.assertRaises(dbm.error):
+            with shelf.reading() as s:
+                s["a"]  # pylint: disable=pointless-statement
+        shelf.close()
+
+    def test_reading_then_writing_reopens(self):
+        shelf = LockedShelf("temp/tempshelf")
+        try:
+            with shelf.reading() as s:
+                self.assertFalse("a" in s)
+            with shelf as s:
+                s["a"] = 1
+            with shelf.reading() as s:
+                self.assertEqual(s["a"], 1)
+        finally:
+            shelf.close()
+
+
 class IndividualFileLockedStoreTest(LockedShelfTest):
     def setUp(self):
         self.shelf = IndividualFileLockedStore("temp/tempshelf", driver="json")
@@ -139,6 +432,56 @@ class IndividualFileLockedStoreTestPickle(LockedShelfTest):
             self.assertEqual(list(s.items()), [])
 
 
+class IndividualFileLockedStoreTestGetMultiple(LockedShelfTest):
+    def setUp(self):
+        self.shelf = IndividualFileLockedStore(
+            "temp/tempshelf", driver="pickle.gz", read_threads=4
+        )
+
+    def test_get_multiple(self):
+        with self.shelf as s:
+            for i in range(100):
+                s[str(i)] = i
+        keys = [str(i) for i in range(100)][::-1] + ["3", "3"]
+        with self.shelf.reading() as s:
+            self.assertEqual(s.get_multiple(keys), [int(k) for k in keys])
+            self.assertEqual(s.get_multiple(iter(["1", "2"])), [1, 2])
+            self.assertEqual(s.get_multiple([]), [])
+
+    def test_get_multiple_missing(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["b"] = 2
+        sequential = IndividualFileLockedStore(
+            "temp/tempshelf", driver="pickle.gz", read_threads=1
+        )
+        for store in self.shelf, sequential:
+            with self.assertRaises(FileNotFoundError) as e:
+                store.get_multiple(["a", "c", "b", "d"])
+            self.assertIn(".c.pkl.gz", e.exception.filename)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_get_multiple_after_fork(self):
+        with self.shelf as s:
+            for i in range(10):
+                s[str(i)] = i
+        keys = [str(i) for i in range(10)]
+        self.assertEqual(self.shelf.get_multiple(keys), list(range(10)))
+        process = multiprocessing.get_context("fork").Process(
+            target=get_multiple_in_process, args=(self.shelf, keys)
+        )
+        process.start()
+        process.join(timeout=30)
+        if process.is_alive():
+            process.kill()
+            self.fail("get_multiple hung in the forked process")
+        self.assertEqual(process.exitcode, 0)
+
+
+def get_multiple_in_process(store, keys):
+    assert store.get_multiple(keys) == list(range(len(keys)))
+
+
 class IndividualFileLockedStoreTestPickleGZ(LockedShelfTest):
     def setUp(self):
         self.shelf = IndividualFileLockedStore("temp/tempshelf", driver="pickle.gz")
@@ -175,3 +518,163 @@ class IndividualFileLockedStoreTestPickleGZ(LockedShelfTest):
         with self.shelf as s:
             self.assertFalse("a" in s)
             self.assertEqual(list(s.items()), [])
+
+
+class IndividualFileLockedStoreTestFanout(LockedShelfTest):
+    def setUp(self):
+        self.shelf = IndividualFileLockedStore("temp/tempshelf", fanout=2)
+
+    def entry_paths(self):
+        return sorted(
+            os.path.relpath(os.path.join(d, f), "temp/tempshelf")
+            for d, _, fs in os.walk("temp/tempshelf")
+            for f in fs
+            if f.endswith(".pkl")
+        )
+
+    def test_put_and_access(self):
+        super().test_put_and_access()
+        [path] = self.entry_paths()
+        self.assertEqual(len(path.split(os.sep)), 3)
+        self.assertEqual(path.split(os.sep)[-1], ".a.pkl")
+        self.assertEqual(
+            sorted(os.listdir("temp/tempshelf")),
+            sorted(["fanout", path.split(os.sep)[0]]),
+        )
+
+    def test_several_accesses(self):
+        super().test_several_accesses()
+        self.assertGreater(len(os.listdir("temp/tempshelf")), 10)
+
+    def test_delete(self):
+        with self.shelf as s:
+            s["a"] = 1
+            del s["a"]
+            self.assertFalse("a" in s)
+            with self.assertRaises(FileNotFoundError):
+                del s["a"]
+
+    def test_migrate(self):
+        flat = IndividualFileLockedStore("temp/tempshelf/flat")
+        with flat as s:
+            for i in range(20):
+                s[str(i)] = i
+        store = IndividualFileLockedStore("temp/tempshelf/flat", fanout=1)
+        self.assertTrue(store.flat_entries)
+        with store as s:
+            self.assertEqual(s["3"], 3)
+            self.assertTrue("4" in s)
+            s["5"] = "five"
+            del s["6"]
+            self.assertFalse("6" in s)
+        self.assertEqual(
+            sorted(v for _, v in store.items() if isinstance(v, int)),
+            [i for i in range(20) if i not in (5, 6)],
+        )
+        store.migrate_to_fanout()
+        self.assertFalse(store.flat_entries)
+        self.assertEqual(
+            [p for p in os.listdir("temp/tempshelf/flat") if p.endswith(".pkl")], []
+        )
+        store = IndividualFileLockedStore("temp/tempshelf/flat", fanout=1)
+        self.assertFalse(store.flat_entries)
+        with store as s:
+            self.assertEqual(s["3"], 3)
+            self.assertEqual(s["5"], "five")
+            self.assertFalse("6" in s)
+        self.assertEqual(len(list(store.items())), 19)
+
+    def test_items_skips_other_files(self):
+        store = IndividualFileLockedStore(
+            "temp/tempshelf/mp", multiprocess_safe=True, fanout=1
+        )
+        with store as s:
+            s["a"] = 1
+        self.assertIn("lock", os.listdir("temp/tempshelf/mp"))
+        self.assertEqual(list(store.items()), [("a", 1)])
+
+
+class IndividualFileLockedStoreTestManifest(LockedShelfTest):
+    def setUp(self):
+        self.shelf = IndividualFileLockedStore("temp/tempshelf", manifest=True)
+
+    def test_entries(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["b" * 100] = list(range(100))
+            s["c"] = 3
+            del s["c"]
+            s["a"] = 2
+        entries = sorted(self.shelf.entries(), key=lambda e: e.key)
+        self.assertEqual([e.key for e in entries], ["a", "b" * 100])
+        for entry in entries:
+            self.assertEqual(
+                entry.size,
+                os.path.getsize(os.path.join("temp/tempshelf", entry.filename)),
+            )
+        self.assertEqual(sorted(self.shelf.keys()), ["a", "b" * 100])
+        self.assertEqual(sorted(self.shelf.items(), key=str)[0], ("a", 2))
+
+    def test_entries_do_not_load(self):
+        with self.shelf as s:
+            for i in range(10):
+                s[str(i)] = i
+
+        def fail(path):
+            raise AssertionError(f"loaded {path}")
+
+        self.shelf._load = fail  # pylint: disable=protected-access
+        self.assertEqual(
+            sorted(self.shelf.keys(), key=int), [str(i) for i in range(10)]
+        )
+
+    def test_other_instance(self):
+        other = IndividualFileLockedStore("temp/tempshelf", manifest=True)
+        with self.shelf as s:
+            s["a"] = 1
+        self.assertEqual(other.keys(), ["a"])
+        with self.shelf as s:
+            s["b"] = 1
+            del s["a"]
+        self.assertEqual(other.keys(), ["b"])
+
+    def test_built_for_existing_store(self):
+        with IndividualFileLockedStore("temp/tempshelf/old") as s:
+            s["a"] = 1
+            s["b" * 100] = 2
+        store = IndividualFileLockedStore("temp/tempshelf/old", manifest=True)
+        self.assertEqual(sorted(store.keys()), ["a", "b" * 100])
+        with IndividualFileLockedStore("temp/tempshelf/old") as s:
+            s["c"] = 3
+        self.assertEqual(sorted(store.keys()), ["a", "b" * 100])
+        store.rebuild_manifest()
+        self.assertEqual(sorted(store.keys()), ["a", "b" * 100, "c"])
+
+    def test_items_skips_deleted(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["b"] = 2
+        os.remove("temp/tempshelf/.a.pkl")
+        self.assertEqual(list(self.shelf.items()), [("b", 2)])
+
+    def test_with_fanout(self):
+        with IndividualFileLockedStore("temp/tempshelf/flat", manifest=True) as s:
+            s["a"] = 1
+            s["b"] = 2
+        store = IndividualFileLockedStore(
+            "temp/tempshelf/flat", fanout=2, manifest=True
+        )
+        with store as s:
+            s["a"] = 3
+        self.assertEqual(sorted(store.items()), [("a", 3), ("b", 2)])
+        store.migrate_to_fanout()
+        self.assertEqual(sorted(store.items()), [("a", 3), ("b", 2)])
+        for entry in store.entries():
+            self.assertEqual(len(entry.filename.split(os.sep)), 3)
+
+    def test_without_manifest(self):
+        store = IndividualFileLockedStore("temp/tempshelf/plain")
+        with store as s:
+            s["a"] = 1
+        [entry] = store.entries()
+        self.assertEqual((entry.key, entry.filename), ("a", ".a.pkl"))
@@ -0,0 +1,215 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+
+from permacache.log_store import LogStore
+from permacache.main import compact_cache
+
+from . import locked_shelf_test
+
+
+class LogStoreTest(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = LogStore("temp/tempshelf")
+
+    def segments(self):
+        return sorted(p for p in os.listdir("temp/tempshelf") if p.endswith(".log"))
+
+    def indices(self):
+        return sorted(p for p in os.listdir("temp/tempshelf") if p.startswith("index"))
+
+    def reopen(self, **kwargs):
+        self.shelf.close()
+        self.shelf = LogStore("temp/tempshelf", **kwargs)
+
+    def test_persists(self):
+        with self.shelf as s:
+            for i in range(100):
+                s[str(i)] = i
+            del s["3"]
+            s["4"] = "four"
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(s["4"], "four")
+            self.assertFalse("3" in s)
+            self.assertEqual(len(s.items()), 99)
+
+    def test_index(self):
+        self.reopen(index_flush_entries=10)
+        with self.shelf as s:
+            for i in range(25):
+                s[str(i)] = i
+        self.assertEqual(self.indices(), ["index.1"])
+        self.assertLess(len(self.shelf.overlay), 10)
+        self.reopen()
+        self.assertEqual(self.shelf.index, None)
+        with self.shelf.reading() as s:
+            self.assertFalse("25" in s)
+            self.assertEqual(self.shelf.index.count, 25)
+            self.assertEqual(self.shelf.overlay, {})
+            self.assertEqual(
+                s.get_multiple([str(i) for i in range(25)]), list(range(25))
+            )
+
+    def test_segments(self):
+        self.reopen(segment_size=1000)
+        with self.shelf as s:
+            for i in range(100):
+                s[str(i)] = i
+        self.assertGreater(len(self.segments()), 1)
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(sorted(v for _, v in s.items()), list(range(100)))
+
+    def test_incomplete_record(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["b"] = 2
+        [segment] = self.segments()
+        path = os.path.join("temp/tempshelf", segment)
+        size = os.path.getsize(path)
+        with open(path, "r+b") as f:
+            f.truncate(size - 3)
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertFalse("b" in s)
+        with self.shelf as s:
+            s["c"] = 3
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual([s["a"], s["c"]], [1, 3])
+            self.assertFalse("b" in s)
+
+    def test_corrupted_record(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["b"] = 2
+        [segment] = self.segments()
+        path = os.path.join("temp/tempshelf", segment)
+        with open(path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"\xff")
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertFalse("b" in s)
+
+    def test_other_instance_writes(self):
+        other = LogStore("temp/tempshelf", index_flush_entries=5)
+        try:
+            with self.shelf as s:
+                s["a"] = 1
+                self.assertEqual(s["a"], 1)
+            with other as o:
+                for i in range(10):
+                    o["a"] = i
+            with self.shelf.reading() as s:
+                self.assertEqual(s["a"], 9)
+            other.compact()
+            with self.shelf.reading() as s:
+                self.assertEqual(s["a"], 9)
+        finally:
+            other.close()
+
+    def test_compact(self):
+        with self.shelf as s:
+            for i in range(100):
+                s[str(i % 10)] = i
+            del s["0"]
+        size = sum(
+            os.path.getsize(os.path.join("temp/tempshelf", p)) for p in self.segments()
+        )
+        [old] = self.segments()
+        self.shelf.compact_in_background().join()
+        self.assertNotIn(old, self.segments())
+        self.assertLess(
+            sum(
+                os.path.getsize(os.path.join("temp/tempshelf", p))
+                for p in self.segments()
+            ),
+            size / 5,
+        )
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(sorted(v for _, v in s.items()), list(range(91, 100)))
+            self.assertFalse("0" in s)
+
+    def test_compact_cache(self):
+        with self.shelf as s:
+            s["a"] = 1
+            s["a"] = 2
+        compact_cache("temp/tempshelf")
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 2)
+            self.assertEqual(len(s.items()), 1)
+
+    def test_compact_not_log(self):
+        with tempfile.TemporaryDirectory() as path:
+            with self.assertRaises(RuntimeError):
+                compact_cache(path)
+
+    def test_compact_cli(self):
+        with self.shelf as s:
+            s["a"] = 1
+        result = subprocess.run(
+            [sys.executable, "-c", "from permacache.main import main; main()"]
+            + ["compact", "does_not_exist_for_permacache_tests"],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Cache does not exist", result.stderr)
+
+    def test_files_in_use_are_removed_later(self):
+        with self.shelf as s:
+            for i in range(20):
+                s[str(i % 10)] = i
+        [old] = self.segments()
+        # as on Windows, for files that are open elsewhere
+        with patch("os.remove", side_effect=PermissionError):
+            self.shelf.compact()
+        self.assertIn(old, self.segments())
+        with self.shelf.reading() as s:
+            self.assertEqual(sorted(v for _, v in s.items()), list(range(10, 20)))
+        self.shelf.compact()
+        self.assertNotIn(old, self.segments())
+        self.assertEqual(self.indices(), ["index.2"])
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(s.count(), 10)
+
+    def test_index_flush_reads_overwritten_keys_only(self):
+        self.reopen(index_flush_entries=10)
+        with self.shelf as s:
+            s.set_multiple((str(i), i) for i in range(100))
+        # pylint: disable=protected-access
+        with patch.object(
+            LogStore, "_read_key", autospec=True, side_effect=LogStore._read_key
+        ) as read_key:
+            with self.shelf as s:
+                s.set_multiple((str(i), -i) for i in range(100, 110))
+            self.assertEqual(read_key.call_count, 0)
+        self.reopen()
+        with self.shelf.reading() as s:
+            self.assertEqual(s.count(), 110)
+            self.assertEqual(s["105"], -105)
+
+    def test_unnumbered_index(self):
+        self.reopen(index_flush_entries=10)
+        with self.shelf as s:
+            s.set_multiple((str(i), i) for i in range(20))
+        self.shelf.close()
+        # as written before index files were numbered
+        os.rename("temp/tempshelf/index.1", "temp/tempshelf/index")
+        self.reopen(index_flush_entries=10)
+        with self.shelf as s:
+            self.assertEqual(s["3"], 3)
+            self.assertEqual(self.shelf.index.count, 20)
+            s.set_multiple((str(i), -i) for i in range(20))
+        self.assertEqual(self.indices(), ["index.1"])
+        with self.shelf.reading() as s:
+            self.assertEqual(s["3"], -3)
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+from permacache.memory_cache import MemoryCache, approximate_size
+
+
+class MemoryCacheTest(unittest.TestCase):
+    def test_unbounded(self):
+        cache = MemoryCache()
+        for i in range(1000):
+            cache[i] = i
+        self.assertEqual(len(cache), 1000)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = MemoryCache(max_entries=2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache["a"], 1)
+        cache["c"] = 3
+        self.assertEqual(sorted(cache.entries), ["a", "c"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes(self):
+        cache = MemoryCache(max_bytes=3 * 8000)
+        for i in range(10):
+            cache[i] = np.zeros(1000)
+        self.assertEqual(sorted(cache.entries), [8, 9])
+        self.assertLessEqual(cache.total_bytes, 3 * 8000)
+        self.assertEqual(cache.evictions, 8)
+
+    def test_value_larger_than_bound_is_not_kept(self):
+        cache = MemoryCache(max_bytes=1000)
+        cache["small"] = 1
+        cache["large"] = np.zeros(1000)
+        self.assertNotIn("large", cache)
+        self.assertIn("small", cache)
+
+    def test_overwrite_replaces_size(self):
+        cache = MemoryCache(max_bytes=10**6)
+        cache["a"] = np.zeros(1000)
+        cache["a"] = 1
+        self.assertEqual(cache.total_bytes, approximate_size(1))
+
+    def test_numpy_objects_that_are_not_arrays(self):
+        cache = MemoryCache(max_bytes=10**6)
+        cache["a"] = {"reduce": np.add, "dtype": np.dtype("float32")}
+        self.assertIs(cache["a"]["reduce"], np.add)
+
+    def test_hits_and_misses(self):
+        cache = MemoryCache()
+        cache["a"] = 1
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_clear_keeps_counters(self):
+        cache = MemoryCache(max_entries=1)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.clear()
+        self.assertEqual((len(cache), cache.total_bytes, cache.evictions), (0, 0, 1))
+
+
+class ApproximateSizeTest(unittest.TestCase):
+    def test_arrays(self):
+        self.assertGreaterEqual(approximate_size(np.zeros(1000)), 8000)
+        self.assertGreaterEqual(approximate_size(np.zeros(1000)[::2]), 4000)
+
+    def test_other_numpy_objects(self):
+        for obj in np.add, np.sum, np.dtype("float32"), np.finfo(np.float32):
+            self.assertGreater(approximate_size(obj), 0)
+
+    def test_containers(self):
+        self.assertGreaterEqual(approximate_size({"a": np.zeros(1000)}), 8000)
+        self.assertGreaterEqual(approximate_size([np.zeros(100)] * 1000), 800 * 1000)
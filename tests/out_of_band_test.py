@@ -0,0 +1,203 @@
+import mmap
+import os
+import pickle
+import shutil
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from permacache import cache
+from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+from permacache.out_of_band import PENDING_REMOVAL, OutOfBandBuffers
+
+from . import locked_shelf_test
+
+THRESHOLD = 1000
+
+
+def underlying_buffer(array):
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return array.obj
+
+
+def large_value():
+    return {"array": np.arange(10_000, dtype=np.float32), "small": np.arange(10)}
+
+
+def check_large_value(value):
+    np.testing.assert_array_equal(value["array"], large_value()["array"])
+    np.testing.assert_array_equal(value["small"], large_value()["small"])
+
+
+class OutOfBandBuffersTest(unittest.TestCase):
+    def setUp(self):
+        self.buffers = OutOfBandBuffers("temp/buffers", THRESHOLD)
+
+    def tearDown(self):
+        shutil.rmtree("temp", ignore_errors=True)
+
+    def test_roundtrip(self):
+        stored = self.buffers.dumps(large_value())
+        self.assertEqual(os.listdir("temp/buffers"), [os.listdir("temp/buffers")[0]])
+        # the large array is not in the pickle, the small one is
+        self.assertLess(len(stored), 1000)
+        self.assertEqual(
+            os.path.getsize(
+                os.path.join("temp/buffers", os.listdir("temp/buffers")[0])
+            ),
+            40_000,
+        )
+        loaded = self.buffers.loads(stored)
+        check_large_value(loaded)
+        self.assertIsInstance(underlying_buffer(loaded["array"]), mmap.mmap)
+        self.assertFalse(loaded["array"].flags.writeable)
+        self.assertTrue(loaded["small"].flags.writeable)
+
+    def test_small_values_in_band(self):
+        stored = self.buffers.dumps(np.arange(10))
+        self.assertFalse(os.path.exists("temp/buffers"))
+        self.assertEqual(pickle.loads(stored).tolist(), list(range(10)))
+
+    def test_no_threshold(self):
+        buffers = OutOfBandBuffers("temp/buffers")
+        stored = buffers.dumps(large_value())
+        self.assertFalse(os.path.exists("temp/buffers"))
+        self.assertEqual(pickle.loads(stored)["array"].shape, (10_000,))
+        self.assertEqual(buffers.loads(stored)["array"].shape, (10_000,))
+
+    def test_remove_buffers(self):
+        stored = self.buffers.dumps(large_value())
+        loaded = self.buffers.loads(stored)
+        self.buffers.remove_buffers(stored)
+        # still mapped
+        self.assertEqual(loaded["array"][-1], 9999)
+        del loaded
+        # on Windows, the file is only removed once it is no longer mapped
+        self.buffers.remove_pending()
+        self.assertEqual(os.listdir("temp/buffers"), [])
+
+    def test_remove_mapped_buffers_later(self):
+        first = self.buffers.dumps(large_value())
+        second = self.buffers.dumps(large_value())
+        # as on Windows, while the files are mapped
+        with patch("os.remove", side_effect=PermissionError):
+            self.buffers.remove_buffers(first)
+        self.assertIn(PENDING_REMOVAL, os.listdir("temp/buffers"))
+        self.assertEqual(len(os.listdir("temp/buffers")), 3)
+        self.buffers.remove_buffers(second)
+        self.assertEqual(os.listdir("temp/buffers"), [])
+
+    def test_failed_pickle_removes_buffers(self):
+        with self.assertRaises(Exception):
+            self.buffers.dumps([np.arange(10_000), lambda x: x])
+        self.assertEqual(os.listdir("temp/buffers"), [])
+
+    def test_compression(self):
+        stored = self.buffers.dumps(large_value(), compress=lambda data: b"!" + data)
+        self.assertTrue(stored.startswith(b"OOB5"))
+        loaded = self.buffers.loads(stored, decompress=lambda data: data[1:])
+        self.assertEqual(loaded["array"][-1], 9999)
+
+
+class LockedShelfTestOutOfBand(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = self.create()
+
+    @staticmethod
+    def create(threshold=THRESHOLD):
+        return LockedShelf("temp/tempshelf", out_of_band_threshold=threshold)
+
+    def buffer_files(self):
+        if not os.path.exists("temp/tempshelf/buffers"):
+            return []
+        return os.listdir("temp/tempshelf/buffers")
+
+    def test_memory_mapped(self):
+        with self.shelf as s:
+            s["a"] = large_value()
+        self.shelf.close()
+        self.assertEqual(len(self.buffer_files()), 1)
+        other = self.create()
+        with other.reading() as s:
+            loaded = s["a"]
+        other.close()
+        self.assertIsInstance(underlying_buffer(loaded["array"]), mmap.mmap)
+        self.assertFalse(loaded["array"].flags.writeable)
+        check_large_value(loaded)
+
+    def test_overwrite_and_delete(self):
+        with self.shelf as s:
+            s["a"] = large_value()
+            s["b"] = large_value()
+        [first_a, first_b] = sorted(self.buffer_files())
+        with self.shelf as s:
+            s["a"] = large_value()
+            s["b"] = "small"
+        self.assertEqual(len(self.buffer_files()), 1)
+        self.assertNotIn(first_a, self.buffer_files())
+        self.assertNotIn(first_b, self.buffer_files())
+        with self.shelf as s:
+            del s["a"]
+        self.assertEqual(self.buffer_files(), [])
+
+    def test_readable_without_threshold(self):
+        with self.shelf as s:
+            s["a"] = large_value()
+        self.shelf.close()
+        other = self.create(threshold=None)
+        with other as s:
+            check_large_value(s["a"])
+            # and removes the buffers when deleted
+            del s["a"]
+        other.close()
+        self.assertEqual(self.buffer_files(), [])
+
+
+class IndividualFileLockedStoreTestOutOfBand(LockedShelfTestOutOfBand):
+    @staticmethod
+    def create(threshold=THRESHOLD):
+        return IndividualFileLockedStore(
+            "temp/tempshelf",
+            driver="pickle.gz",
+            fanout=1,
+            manifest=True,
+            out_of_band_threshold=threshold,
+        )
+
+    def test_buffers_removed_concurrently(self):
+        with self.shelf as s:
+            s["a"] = large_value()
+        # as by another process overwriting the entry
+        for name in self.buffer_files():
+            os.remove(os.path.join("temp/tempshelf/buffers", name))
+        with self.shelf.reading() as s:
+            self.assertIn("a", s)
+            with self.assertRaises(KeyError):
+                s["a"]  # pylint: disable=pointless-statement
+
+    def test_buffers_removed_concurrently_is_a_miss(self):
+        calls = []
+
+        def function(x):
+            calls.append(x)
+            return large_value()
+
+        self.addCleanup(setattr, cache, "CACHE", cache.CACHE)
+        cache.CACHE = "temp"
+        f = cache.permacache(
+            "f", shelf_type="individual-file", out_of_band_threshold=THRESHOLD
+        )(function)
+        f(1)
+        for name in os.listdir("temp/f/buffers"):
+            os.remove(os.path.join("temp/f/buffers", name))
+        check_large_value(f(1))
+        self.assertEqual(calls, [1, 1])
+
+    def test_count(self):
+        with self.shelf as s:
+            s["a"] = large_value()
+            s["b"] = 2
+        self.assertEqual(self.shelf.count(), 2)
+        self.assertEqual(sorted(self.shelf.keys()), ["a", "b"])
@@ -0,0 +1,78 @@
+import threading
+import unittest
+from dataclasses import dataclass
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from torch import nn
+
+from permacache import stable_hash
+from permacache.hash import ByteBuffer, large_buffers
+
+rng = np.random.RandomState(0)
+
+
+@dataclass
+class Holder:
+    array: np.ndarray
+    name: str
+
+
+def big(*shape):
+    return rng.randn(*shape)
+
+
+class ParallelHashTest(unittest.TestCase):
+    def assertSameHash(self, obj, **kwargs):
+        self.assertEqual(
+            stable_hash(obj, **kwargs), stable_hash(obj, threads=4, **kwargs)
+        )
+
+    def test_dict_of_arrays(self):
+        self.assertSameHash({f"x{i}": big(400, 400) for i in range(6)})
+
+    def test_mixed(self):
+        self.assertSameHash(
+            [
+                big(400, 400).T,
+                torch.tensor(big(400, 400)),
+                Holder(big(400, 400), "a"),
+                {"small": np.arange(3), "same": [big(400, 400)] * 2},
+            ]
+        )
+
+    def test_module(self):
+        module = nn.Sequential(nn.Linear(600, 600), nn.ReLU(), nn.Linear(600, 600))
+        for version in (1, 2):
+            self.assertSameHash(module, version=version)
+
+    def test_slow_bytes_unaffected(self):
+        self.assertSameHash([big(400, 400), big(400, 400)], fast_bytes=False)
+
+    def test_large_buffers(self):
+        shared = big(600, 600)
+        found = large_buffers(
+            {"a": shared, "b": [shared, shared[::2]], "c": np.arange(3)}
+        )
+        self.assertEqual(len(found), 2)
+
+    def test_large_buffers_skip_cuda(self):
+        class Tensor:  # pylint: disable=too-few-public-methods
+            is_cuda = True
+
+        found = large_buffers({"a": Tensor(), "b": big(600, 600)})
+        self.assertEqual(len(found), 1)
+
+    def test_hashed_on_worker_threads(self):
+        threads = []
+        original = ByteBuffer._sha256  # pylint: disable=protected-access
+
+        def record(buffer):
+            threads.append(threading.current_thread())
+            return original(buffer)
+
+        with patch.object(ByteBuffer, "_sha256", record):
+            stable_hash([big(400, 400) for _ in range(4)], threads=2)
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(threading.main_thread(), threads)
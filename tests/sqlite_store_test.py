@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+
+from permacache.sqlite_store import SQLiteStore
+
+from . import locked_shelf_test
+
+
+def write_in_process(path, key, value):
+    with SQLiteStore(path) as s:
+        s[key] = value
+
+
+class SQLiteStoreTest(locked_shelf_test.LockedShelfTest):
+    def setUp(self):
+        self.shelf = SQLiteStore("temp/tempshelf")
+
+    def test_wal_mode(self):
+        with self.shelf as s:
+            s["a"] = 1
+        with sqlite3.connect("temp/tempshelf/store.sqlite") as connection:
+            self.assertEqual(
+                connection.execute("PRAGMA journal_mode").fetchone(), ("wal",)
+            )
+
+    def test_get_multiple(self):
+        with self.shelf as s:
+            for i in range(1200):
+                s[str(i)] = i
+        reader = SQLiteStore("temp/tempshelf")
+        try:
+            with reader.reading() as s:
+                keys = [str(i) for i in range(1200)][::-1] + ["3"]
+                self.assertEqual(s.get_multiple(keys), list(range(1200))[::-1] + [3])
+                with self.assertRaises(KeyError):
+                    s.get_multiple(["3", "nope"])
+        finally:
+            reader.close()
+
+    def test_delete(self):
+        with self.shelf as s:
+            s["a"] = 1
+            del s["a"]
+            self.assertFalse("a" in s)
+            with self.assertRaises(KeyError):
+                del s["a"]
+
+    def test_no_writes_while_reading(self):
+        with self.shelf.reading() as s:
+            with self.assertRaises(AssertionError):
+                s["a"] = 1
+            with self.assertRaises(RuntimeError):
+                with self.shelf:
+                    pass
+
+    def test_write_is_one_transaction(self):
+        with self.shelf as s:
+            s["a"] = 1
+        with self.assertRaises(ValueError):
+            with self.shelf as s:
+                s.set_multiple([("a", 2), ("b", 3)])
+                raise ValueError
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 1)
+            self.assertFalse("b" in s)
+
+    def test_reader_sees_snapshot_while_writer_writes(self):
+        with self.shelf as s:
+            s["a"] = 1
+        writer = SQLiteStore("temp/tempshelf", timeout=1)
+        try:
+            with self.shelf.reading() as s:
+                self.assertEqual(s["a"], 1)
+                with writer as w:
+                    w["a"] = 2
+                    w["b"] = 3
+                self.assertFalse("b" in s)
+            with self.shelf.reading() as s:
+                self.assertEqual(s["a"], 2)
+                self.assertEqual(s["b"], 3)
+        finally:
+            writer.close()
+
+    def test_threads(self):
+        def write(i):
+            with self.shelf as s:
+                s[str(i)] = i
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with self.shelf.reading() as s:
+            self.assertEqual(sorted(v for _, v in s.items()), list(range(10)))
+
+    def test_other_process_write_flushes_cache(self):
+        with self.shelf as s:
+            s["a"] = 1
+            self.assertEqual(s["a"], 1)
+        process = multiprocessing.get_context("spawn").Process(
+            target=write_in_process, args=("temp/tempshelf", "a", 2)
+        )
+        process.start()
+        process.join()
+        with self.shelf.reading() as s:
+            self.assertEqual(s["a"], 2)
+
+    def test_files(self):
+        with self.shelf as s:
+            s["a"] = 1
+        self.shelf.close()
+        self.assertIn("store.sqlite", os.listdir("temp/tempshelf"))
@@ -0,0 +1,184 @@
+import enum
+import json
+import unittest
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pandas as pd
+from parameterized import parameterized, parameterized_class
+
+from permacache import stringify
+from permacache.hash import (
+    ByteBuffer,
+    _iterencode_bytes,
+    fix_dictionary,
+    iter_stringify,
+    make_json_encoder,
+    valid_versions,
+)
+from tests.test_module.c import A, C
+
+
+class Color(enum.Enum):
+    RED = "red"
+    BLUE = 2
+
+
+# outputs of the two-pass implementation, json.dumps(fix_dictionary(obj), ...)
+CORPUS = [
+    (
+        [1, -2.5, "hi", None, True, False, float("inf"), float("nan")],
+        '[1, -2.5, "hi", null, true, false, Infinity, NaN]',
+    ),
+    (
+        {"naïve": "snow ☃", 'quote"s': "back\\slash\n"},
+        '{"na\\u00efve": "snow \\u2603", "quote\\"s": "back\\\\slash\\n"}',
+    ),
+    (
+        {"b": [1, (2, 3), {"c": ()}], "a": {"z": {}, "y": [[]]}},
+        '{"a": {"y": [[]], "z": {}}, "b": [1, [2, 3], {"c": []}]}',
+    ),
+    (
+        {(1, 2): "a", (0, "x"): ["b", {(3,): 4}]},
+        '{".fixed_dictionary_nonjson_keys": true, "contents": {"[0, \\"x\\"]": '
+        '["b", {".fixed_dictionary_nonjson_keys": true, "contents": {"[3]": 4}}], '
+        '"[1, 2]": "a"}}',
+    ),
+    (
+        {None: 1},
+        '{".fixed_dictionary_nonjson_keys": true, "contents": {"null": 1}}',
+    ),
+    (
+        [{"a": {None: [1, 2]}}],
+        '[{"a": {".fixed_dictionary_nonjson_keys": true, "contents": {"null": [1, 2]}}}]',
+    ),
+    ({1: "a", 2.5: "b", -3: {4: 5}}, '{"-3": {"4": 5}, "1": "a", "2.5": "b"}'),
+    ({True: "t"}, '{"true": "t"}'),
+    (OrderedDict([("b", 1), ("a", 2)]), '{"a": 2, "b": 1}'),
+    (
+        C(1, {(1, 2): None}, 3.5),
+        '{".dataclass.__name__": "C", "x": 1, "y": '
+        '{".fixed_dictionary_nonjson_keys": true, "contents": {"[1, 2]": null}}, '
+        '"z": 3.5}',
+    ),
+    (
+        A([1, 2], "x", {None: "y"}),
+        '{".attr.__name__": "A", "x": [1, 2], "y": "x", "z": '
+        '{".fixed_dictionary_nonjson_keys": true, "contents": {"null": "y"}}}',
+    ),
+    (
+        SimpleNamespace(x=1, y={(2,): 3}),
+        '{".builtin.__name__": "types.SimpleNamespace", "x": 1, "y": '
+        '{".fixed_dictionary_nonjson_keys": true, "contents": {"[2]": 3}}}',
+    ),
+    (
+        [Color.RED, Color.BLUE],
+        '[{".type": "enum", "enum.name": "Color", "enum.value": "red"}, '
+        '{".type": "enum", "enum.name": "Color", "enum.value": 2}]',
+    ),
+    (
+        [range(3), range(1, 10, 2), int, OrderedDict],
+        '[{".type": "range", "representation": "range(0, 3)"}, '
+        '{".type": "range", "representation": "range(1, 10, 2)"}, '
+        '{".type": "type", "name": "builtins.int"}, '
+        '{".type": "type", "name": "collections.OrderedDict"}]',
+    ),
+    ({"null": 1, "x": "null"}, '{"null": 1, "x": "null"}'),
+    (
+        # dataframes are not passed through fix_dictionary, so the None key stays
+        pd.DataFrame({None: [1, 2]}),
+        '{".type": "pandas.DataFrame", "columns": [null], "values": {"null": '
+        '{".type": "pandas.Series", "index": [0, 1], "values": [1, 2]}}}',
+    ),
+]
+
+BYTES = {"data": b"\x00\x01'\"abc", "more": [b"x" * 3]}
+BYTES_SLOW = '{"data": "b\'\\\\x00\\\\x01\\\\\'\\"abc\'", "more": ["b\'xxx\'"]}'
+BYTES_FAST = (
+    '{"data": "8e5a1f1fb6e845dbbb8ae00a3dd9796df1c556ae7da0cbe7026f7880ad781b34", '
+    '"more": ["cd2eb0837c9b4c962c22d2ff8b5441b7b45805887f051d39bf133b583baf6860"]}'
+)
+
+
+def two_pass_stringify(obj, *, version, fast_bytes):
+    return make_json_encoder(fast_bytes, version)(sort_keys=True).encode(
+        fix_dictionary(obj, version=version)
+    )
+
+
+@parameterized_class([{"version": v} for v in valid_versions])
+class StringifyGoldenTest(unittest.TestCase):
+    version: int
+
+    @parameterized.expand(
+        [(i, fast_bytes) for i in range(len(CORPUS)) for fast_bytes in (False, True)]
+    )
+    def test_golden(self, i, fast_bytes):
+        obj, expected = CORPUS[i]
+        self.assertEqual(
+            expected, stringify(obj, version=self.version, fast_bytes=fast_bytes)
+        )
+        self.assertEqual(
+            expected,
+            two_pass_stringify(obj, version=self.version, fast_bytes=fast_bytes),
+        )
+
+    @parameterized.expand(
+        [(i, fast_bytes) for i in range(len(CORPUS)) for fast_bytes in (False, True)]
+    )
+    def test_golden_streaming(self, i, fast_bytes):
+        obj, expected = CORPUS[i]
+        self.assertEqual(
+            expected,
+            "".join(iter_stringify(obj, version=self.version, fast_bytes=fast_bytes)),
+        )
+
+    def test_bytes_streaming(self):
+        self.assertEqual(
+            BYTES_SLOW, "".join(iter_stringify(BYTES, version=self.version))
+        )
+        self.assertEqual(
+            BYTES_FAST,
+            "".join(iter_stringify(BYTES, version=self.version, fast_bytes=True)),
+        )
+
+    def test_bytes(self):
+        self.assertEqual(BYTES_SLOW, stringify(BYTES, version=self.version))
+        self.assertEqual(
+            BYTES_FAST, stringify(BYTES, version=self.version, fast_bytes=True)
+        )
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            stringify({1: "a", "b": 2}, version=self.version)
+        with self.assertRaises(TypeError):
+            stringify([object()], version=self.version)
+
+    def test_encoder_is_memoized(self):
+        self.assertIs(
+            make_json_encoder(True, self.version), make_json_encoder(True, self.version)
+        )
+
+
+class BytesChunkingTest(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (data, chunk_size)
+            for data in [
+                b"",
+                b"abc",
+                b"a'b",
+                b'a"b',
+                b"a'b\"c",
+                b"''\"",
+                b"\\\x00\xff\n'",
+                b"xx'" + b'"',
+            ]
+            for chunk_size in (1, 2, 3, 100)
+        ]
+    )
+    def test_chunks_match_repr(self, data, chunk_size):
+        self.assertEqual(
+            json.dumps(str(data)),
+            "".join(_iterencode_bytes(ByteBuffer(data), chunk_size)),
+        )
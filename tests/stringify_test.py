@@ -1,3 +1,4 @@
+import enum
 import json
 import sys
 import unittest
@@ -8,7 +9,7 @@ import torch
 from parameterized import parameterized_class
 
 from permacache import stable_hash, stringify
-from permacache.hash import valid_versions
+from permacache.hash import stringify_rows, valid_versions
 from tests.test_module.c import A, B, C, D
 
 NUMPY_VERSION = np.version.version.split(".", maxsplit=1)[0]
@@ -74,6 +75,18 @@ class StringifyTest(unittest.TestCase):
     def test_stringify_numpy_fast(self):
         self.assertEqual(self.fast_hash, stable_hash(self.data, version=self.version))
 
+    def test_stringify_numpy_streaming(self):
+        self.assertEqual(
+            self.slow_hash,
+            stable_hash(
+                self.data, fast_bytes=False, version=self.version, streaming=True
+            ),
+        )
+        self.assertEqual(
+            self.fast_hash,
+            stable_hash(self.data, version=self.version, streaming=True),
+        )
+
     def test_stringify_torch(self):
         self.assertEqual(
             self.slow_hash,
@@ -112,3 +125,65 @@ class StringifyTest(unittest.TestCase):
             "945c95c1f21efc1185ee4e4bcf3a24263881bc16564ec89ab7bb3a5d313455cb",
             stable_hash(frame, version=self.version),
         )
+
+
+@parameterized_class([{"version": v} for v in valid_versions])
+class StringifyRowsTest(unittest.TestCase):
+    version: int
+
+    def check(self, shared, columns):
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        self.assertEqual(
+            [stringify({**shared, **row}, version=self.version) for row in rows],
+            stringify_rows(shared, columns, version=self.version),
+        )
+
+    def test_scalars(self):
+        self.check(
+            dict(a=1, z="%s 100%"),
+            dict(
+                m=[1, -2, 2**70, 0.5, float("nan"), float("-inf"), True, None],
+                b=["x", "é", '"%s"', "\n", "", "☃", "%", "%%"],
+            ),
+        )
+
+    def test_other_types(self):
+        self.check(
+            dict(shared=[np.arange(3), {None: 2}], s=1.5),
+            dict(
+                x=[
+                    np.float32(2),
+                    np.arange(4),
+                    {2: 3, None: 4},
+                    {"a": [1, {(1, 2): 3}]},
+                    Color.RED,
+                    Size.LARGE,
+                    Flag(True),
+                    (1, 2),
+                ]
+            ),
+        )
+
+    def test_no_shared(self):
+        self.check({}, dict(x=[1, 2, 3]))
+
+    def test_empty(self):
+        self.assertEqual(
+            [], stringify_rows(dict(a=1), dict(x=[]), version=self.version)
+        )
+
+    def test_invalid_version(self):
+        with self.assertRaises(ValueError):
+            stringify_rows({}, dict(x=["a"]), version=17)
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+class Size(enum.IntEnum):
+    LARGE = 3
+
+
+class Flag(int):
+    pass
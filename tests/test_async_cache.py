@@ -0,0 +1,167 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from permacache import CacheMissError, cache
+from permacache.cache import AsyncCachedFunction
+
+
+class AsyncCacheTest(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        cache.CACHE = self.dir.name
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def square(self, x):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return x * x
+
+    async def async_square(self, x):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return x * x
+
+    def test_acall(self):
+        f = cache.permacache("f")(self.square)
+
+        async def run():
+            self.assertEqual(await f.acall(3), 9)
+            self.assertEqual(await f.acall(3), 9)
+            self.assertEqual(await f.acall(x=4), 16)
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 2)
+        # shares the cache with synchronous calls
+        self.assertEqual(f(4), 16)
+        self.assertEqual(self.calls, 2)
+
+    def test_async_function(self):
+        f = cache.permacache("f")(self.async_square)
+        self.assertIsInstance(f, AsyncCachedFunction)
+
+        async def run():
+            self.assertEqual(await f(3), 9)
+            self.assertEqual(await f(3), 9)
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(f.cache_contains(3))
+
+    def test_deduplicates(self):
+        f = cache.permacache("f")(self.async_square)
+
+        async def run():
+            return await asyncio.gather(*[f(i % 3) for i in range(30)])
+
+        self.assertEqual(asyncio.run(run()), [(i % 3) ** 2 for i in range(30)])
+        self.assertEqual(self.calls, 3)
+
+    def test_cancelled_caller(self):
+        f = cache.permacache("f")(self.async_square)
+
+        async def run():
+            first = asyncio.ensure_future(f(3))
+            second = asyncio.ensure_future(f(3))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), 9)
+        self.assertEqual(self.calls, 1)
+
+    def test_bounded_concurrency(self):
+        f = cache.permacache("f", async_concurrency=2)(self.square)
+
+        async def run():
+            return await asyncio.gather(*[f.acall(i) for i in range(8)])
+
+        self.assertEqual(asyncio.run(run()), [i * i for i in range(8)])
+        self.assertEqual(self.calls, 8)
+        self.assertEqual(self.max_running, 2)
+
+    def test_does_not_block_loop(self):
+        f = cache.permacache("f")(self.square)
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.time())
+                await asyncio.sleep(0.005)
+
+        async def run():
+            await asyncio.gather(f.acall(2), ticker())
+
+        asyncio.run(run())
+        self.assertEqual(len(ticks), 5)
+        # the ticker kept running while the function slept in the executor
+        self.assertLess(ticks[-1] - ticks[0], 0.045)
+
+    def test_parallel(self):
+        async def squares(xs):
+            self.calls += len(xs)
+            return [x * x for x in xs]
+
+        f = cache.permacache("f", parallel=("xs",))(squares)
+
+        async def run():
+            self.assertEqual(await f([1, 2]), [1, 4])
+            self.assertEqual(await f([1, 2, 3, 3]), [1, 4, 9, 9])
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 3)
+
+    def test_error_on_miss(self):
+        f = cache.permacache("f")(self.async_square)
+
+        async def run():
+            await f(2)
+            with f.error_on_miss():
+                self.assertEqual(await f(2), 4)
+                with self.assertRaises(CacheMissError):
+                    await f(3)
+
+        asyncio.run(run())
+
+    def test_several_loops(self):
+        f = cache.permacache("f", async_concurrency=1)(self.square)
+        self.assertEqual(asyncio.run(f.acall(2)), 4)
+        self.assertEqual(asyncio.run(f.acall(3)), 9)
+
+    def test_single_flight_requires_sync(self):
+        with self.assertRaises(AssertionError):
+            cache.permacache("f", single_flight=True)(self.async_square)
+        f = cache.permacache("g", single_flight=True)(self.square)
+
+        async def run():
+            return await asyncio.gather(*[f.acall(2) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), [4] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_executor_requires_sync(self):
+        async def async_squares(xs):
+            return [x * x for x in xs]
+
+        with ThreadPoolExecutor(2) as executor:
+            with self.assertRaises(AssertionError):
+                cache.permacache("f", parallel=["xs"], executor=executor)(async_squares)
+            f = cache.permacache("g", parallel=["xs"], executor=executor)(
+                lambda xs: [x * x for x in xs]
+            )
+            self.assertEqual(asyncio.run(f.acall([1, 2, 3])), [1, 4, 9])
@@ -68,6 +68,24 @@ class PermacacheIndividualTest(PermacacheTest):
         return cache.permacache("func", shelf_type="individual-file")(fn)
 
 
+class PermacacheSQLiteTest(PermacacheTest):
+
+    def create_cache_fn(self):
+        return cache.permacache("func", shelf_type="sqlite")(fn)
+
+
+class PermacacheLogTest(PermacacheTest):
+
+    def create_cache_fn(self):
+        return cache.permacache("func", shelf_type="log")(fn)
+
+
+class PermacacheLazyTest(PermacacheTest):
+
+    def create_cache_fn(self):
+        return cache.permacache("func", lazy=True)(fn)
+
+
 class PermacacheIndividualTestLocal(PermacacheTest):
 
     def create_cache_fn(self):
@@ -7,7 +7,16 @@ import unittest
 from unittest.mock import patch
 
 from permacache import cache
-from permacache.main import count_keys_in_cache, do_count
+from permacache.locked_shelf import IndividualFileLockedStore, LockedShelf
+from permacache.log_store import LogStore
+from permacache.main import (
+    cache_stats,
+    count_keys_in_cache,
+    do_count,
+    do_stats,
+    shelf_type_of_cache,
+)
+from permacache.sqlite_store import SQLiteStore
 
 
 # pylint: disable=keyword-arg-before-vararg
@@ -141,6 +150,90 @@ class CountTest(unittest.TestCase):
         self.assertEqual(count, 3)
 
 
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "stats_cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def populate(self, store):
+        with store:
+            for i in range(20):
+                store[f"key {i}"] = "x" * (i * 100)
+        store.close()
+
+    def check_store(self, store, shelf_type):
+        self.populate(store)
+        self.assertEqual(shelf_type_of_cache(self.path), shelf_type)
+        self.assertEqual(count_keys_in_cache(self.path), 20)
+        stats = cache_stats(self.path, largest=3)
+        self.assertEqual(stats["shelf_type"], shelf_type)
+        self.assertEqual(stats["count"], 20)
+        sizes = [size for _, size in stats["largest"]]
+        self.assertEqual(len(sizes), 3)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        # values are pickled, so slightly larger than the strings themselves
+        self.assertGreaterEqual(sizes[0], 1900)
+        self.assertLess(sizes[0], 2000)
+        self.assertEqual(stats["percentiles"][100], sizes[0])
+        self.assertGreaterEqual(stats["total_size"], 19000)
+        return stats
+
+    def test_combined_file(self):
+        stats = self.check_store(LockedShelf(self.path), "combined-file")
+        self.assertEqual(stats["largest"][0][0], "key 19")
+
+    def test_individual_file(self):
+        self.check_store(IndividualFileLockedStore(self.path), "individual-file")
+
+    def test_individual_file_fanout_manifest(self):
+        stats = self.check_store(
+            IndividualFileLockedStore(self.path, fanout=2, manifest=True),
+            "individual-file",
+        )
+        self.assertEqual(stats["largest"][0][0], "key 19")
+
+    def test_sqlite(self):
+        stats = self.check_store(SQLiteStore(self.path), "sqlite")
+        self.assertEqual(stats["largest"][0][0], "key 19")
+
+    def test_log(self):
+        stats = self.check_store(LogStore(self.path), "log")
+        self.assertEqual(stats["largest"][0][0], "key 19")
+
+    def test_empty(self):
+        self.populate(LockedShelf(self.path))
+        with LockedShelf(self.path) as shelf:
+            for i in range(20):
+                del shelf[f"key {i}"]
+        stats = cache_stats(self.path)
+        self.assertEqual(stats["count"], 0)
+        self.assertEqual(stats["total_size"], 0)
+        self.assertEqual(stats["largest"], [])
+
+    def test_do_stats(self):
+        self.populate(LogStore(self.path))
+
+        class MockArgs:
+            cache_name = "stats_cache"
+            largest = 2
+
+        captured_output = io.StringIO()
+        with patch("appdirs.user_cache_dir", return_value=self.temp_dir.name), patch(
+            "sys.stdout", captured_output
+        ):
+            do_stats(MockArgs())
+        output = captured_output.getvalue()
+        self.assertIn("Cache 'stats_cache' (log) contains 20 keys", output)
+        self.assertIn("p50", output)
+        self.assertIn("key 19", output)
+        self.assertIn("key 18", output)
+        self.assertNotIn("key 17", output)
+
+
 class CountCLITest(unittest.TestCase):
     """Test the CLI interface for the count command."""
 
@@ -1,7 +1,9 @@
 import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from permacache import cache
+from permacache import CacheMissError, cache
+from permacache.cache import UnderlyingFunction
 
 
 def fn(xs, ys):
@@ -76,3 +78,77 @@ class ParallelCacheTestFullyParallel(unittest.TestCase):
             [(c, c) for c in range(10, 20)],
         )
         self.assertEqual(fn_2.counter, 16)
+
+
+def squares(xs):
+    return [x * x for x in xs]
+
+
+def chunks_seen(xs):
+    chunks_seen.chunks.append(list(xs))
+    if -1 in xs:
+        raise ValueError("negative")
+    return [x * x for x in xs]
+
+
+class ParallelCacheTestExecutor(unittest.TestCase):
+    def setUp(self):
+        # we clean this up in tearDown
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        cache.CACHE = self.dir.name
+        chunks_seen.chunks = []
+
+    def tearDown(self):
+        self.dir.__exit__(None, None, None)
+
+    def test_thread_pool(self):
+        with ThreadPoolExecutor(2) as executor:
+            f = cache.permacache(
+                "func", parallel=["xs"], executor=executor, chunk_size=2
+            )(chunks_seen)
+            self.assertEqual(f([1, 2, 3, 4, 5]), [1, 4, 9, 16, 25])
+            self.assertEqual(sorted(chunks_seen.chunks), [[1, 2], [3, 4], [5]])
+            self.assertEqual(f([5, 6, 1, 7, 6]), [25, 36, 1, 49, 36])
+            self.assertEqual(sorted(chunks_seen.chunks), [[1, 2], [3, 4], [5], [6, 7]])
+
+    def test_failed_chunk(self):
+        with ThreadPoolExecutor(1) as executor:
+            f = cache.permacache(
+                "func", parallel=["xs"], executor=executor, chunk_size=2
+            )(chunks_seen)
+            with self.assertRaises(ValueError):
+                f([1, 2, -1, 3])
+            # the chunk before the failure was stored
+            with f.error_on_miss():
+                self.assertEqual(f([1, 2]), [1, 4])
+
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as executor:
+            f = cache.permacache(
+                "func", parallel=["xs"], executor=executor, chunk_size=3
+            )(squares)
+            self.assertEqual(f(list(range(10))), [x * x for x in range(10)])
+        with f.error_on_miss():
+            self.assertEqual(f(list(range(10))), [x * x for x in range(10)])
+
+    def test_default_chunk_size(self):
+        with ThreadPoolExecutor(2) as executor:
+            f = cache.permacache("func", parallel=["xs"], executor=executor)(
+                chunks_seen
+            )
+            self.assertEqual(f(list(range(100))), [x * x for x in range(100)])
+        self.assertEqual(sum(len(chunk) for chunk in chunks_seen.chunks), 100)
+
+    def test_underlying_function(self):
+        # module level names refer to the cached function when it is decorated
+        global squares  # pylint: disable=global-statement
+        original = squares
+        try:
+            squares = cache.permacache("func", parallel=["xs"])(original)
+            self.assertEqual(UnderlyingFunction(original)([1, 2]), [1, 4])
+            with squares.error_on_miss():
+                with self.assertRaises(CacheMissError):
+                    squares([1])
+        finally:
+            squares = original
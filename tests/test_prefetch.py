@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from permacache import cache
+
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        cache.CACHE = self.dir.name
+        self.calls = 0
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def square(self, x, offset=0):
+        self.calls += 1
+        return x * x + offset
+
+    def squares(self, xs):
+        self.calls += len(xs)
+        return [x * x for x in xs]
+
+    def test_prefetch(self):
+        f = cache.permacache("f")(self.square)
+        f(2)
+        f(3, offset=1)
+        # another process writing to the cache, without the values in memory
+        f.shelf.close()
+        f.shelf.cache.clear()
+        report = f.prefetch(
+            [((2,), {}), ((4,), {}), ((3,), dict(offset=1)), ((2,), {})]
+        ).result()
+        self.assertEqual(report.missing, [1])
+        self.assertEqual(report.missing_elements, [[], [0], [], []])
+        self.assertEqual(report.loaded, 2)
+        hits = f.shelf.cache.hits
+        self.assertEqual(f(2), 4)
+        self.assertEqual(f(3, offset=1), 10)
+        self.assertEqual(f.shelf.cache.hits, hits + 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_not_in_background(self):
+        f = cache.permacache("f")(self.square)
+        f(2)
+        report = f.prefetch([((2,), {}), ((3,), {})], background=False)
+        self.assertEqual(report.missing, [1])
+        self.assertEqual(self.calls, 1)
+
+    def test_chunks(self):
+        f = cache.permacache("f")(self.square)
+        for x in range(0, cache.PREFETCH_CHUNK_SIZE * 3, 2):
+            f(x)
+        f.shelf.cache.clear()
+        report = f.prefetch(
+            [((x,), {}) for x in range(cache.PREFETCH_CHUNK_SIZE * 3)],
+            background=False,
+        )
+        self.assertEqual(
+            report.missing, list(range(1, cache.PREFETCH_CHUNK_SIZE * 3, 2))
+        )
+        self.assertEqual(len(f.shelf.cache), cache.PREFETCH_CHUNK_SIZE * 3 // 2)
+
+    def test_parallel(self):
+        f = cache.permacache("f", parallel=["xs"])(self.squares)
+        f([1, 2, 3])
+        f.shelf.cache.clear()
+        report = f.prefetch(
+            [(([1, 4, 2],), {}), ((), dict(xs=[3])), (([5, 6],), {})],
+            background=False,
+        )
+        self.assertEqual(report.missing, [0, 2])
+        self.assertEqual(report.missing_elements, [[1], [], [0, 1]])
+        self.assertEqual(report.loaded, 3)
+        hits = f.shelf.cache.hits
+        self.assertEqual(f([3, 2, 1]), [9, 4, 1])
+        self.assertEqual(f.shelf.cache.hits, hits + 3)
+        self.assertEqual(self.calls, 3)
+
+    def test_individual_file(self):
+        f = cache.permacache("f", shelf_type="individual-file")(self.square)
+        f(2)
+        report = f.prefetch([((2,), {}), ((3,), {})]).result()
+        self.assertEqual(report.missing, [1])
+        self.assertEqual(report.loaded, 1)
+
+    def test_lazy(self):
+        f = cache.permacache("f", lazy=True)(self.square)
+        f(2)
+        f.shelf.cache.clear()
+        report = f.prefetch([((2,), {})], background=False)
+        self.assertEqual(report.missing, [])
+        self.assertEqual(f(2), 4)
+        self.assertEqual(self.calls, 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_after_fork(self):
+        f = cache.permacache("f")(self.square)
+        f(2)
+        self.assertEqual(f.prefetch([((2,), {})]).result().missing, [])
+        process = multiprocessing.get_context("fork").Process(
+            target=prefetch_in_process, args=(f,)
+        )
+        process.start()
+        process.join(timeout=30)
+        if process.is_alive():
+            process.kill()
+            self.fail("prefetch hung in the forked process")
+        self.assertEqual(process.exitcode, 0)
+
+
+def prefetch_in_process(f):
+    assert f.prefetch([((2,), {}), ((3,), {})]).result().missing == [1]
@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from permacache import cache
+from permacache.hash import stable_hash
+from permacache.single_flight import SingleFlight
+
+
+def slow(x):
+    slow.counter += 1
+    time.sleep(0.2)
+    return x * 2
+
+
+def slow_logged(x, log):
+    with open(log, "a") as f:
+        f.write(f"{x}\n")
+    time.sleep(0.5)
+    return x * 2
+
+
+def call_in_process(cache_dir, x, log, results):
+    cache.CACHE = cache_dir
+    f = cache.permacache("func", single_flight=True, multiprocess_safe=True)(
+        slow_logged
+    )
+    results.put(f(x, log))
+
+
+def run_in_threads(target, count):
+    results = [None] * count
+
+    def run(i):
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class SingleFlightCacheTest(unittest.TestCase):
+    def setUp(self):
+        # we clean this up in tearDown
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        cache.CACHE = self.dir.name
+        slow.counter = 0
+
+    def tearDown(self):
+        self.dir.__exit__(None, None, None)
+
+    def test_threads_compute_once(self):
+        f = cache.permacache("func", single_flight=True)(slow)
+        self.assertEqual(run_in_threads(lambda: f(3), 8), [6] * 8)
+        self.assertEqual(slow.counter, 1)
+        self.assertEqual(f(3), 6)
+        self.assertEqual(slow.counter, 1)
+
+    def test_without_single_flight(self):
+        f = cache.permacache("func")(slow)
+        self.assertEqual(run_in_threads(lambda: f(3), 4), [6] * 4)
+        self.assertEqual(slow.counter, 4)
+
+    def test_different_keys(self):
+        f = cache.permacache("func", single_flight=True)(slow)
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f(2), 4)
+        self.assertEqual(slow.counter, 2)
+
+    def test_leases_cleaned_up(self):
+        f = cache.permacache("func", single_flight=True)(slow)
+        f(3)
+        self.assertEqual(os.listdir(os.path.join(self.dir.name, "func", "leases")), [])
+
+    def test_processes_compute_once(self):
+        log = os.path.join(self.dir.name, "log")
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=call_in_process, args=(self.dir.name, 3, log, results)
+            )
+            for _ in range(3)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        self.assertEqual(sorted(results.get() for _ in processes), [6] * 3)
+        with open(log) as f:
+            self.assertEqual(f.read(), "3\n")
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        # we clean this up in tearDown
+        # pylint: disable=consider-using-with
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = {}
+        self.computed = []
+
+    def tearDown(self):
+        self.dir.__exit__(None, None, None)
+
+    def lookup(self):
+        return ("k" in self.store), self.store.get("k")
+
+    def compute(self, delay=0.2, fail=False):
+        def compute():
+            self.computed.append(threading.get_ident())
+            time.sleep(delay)
+            if fail:
+                raise ValueError("failed")
+            self.store["k"] = 1
+            return 1
+
+        return compute
+
+    def test_failure_is_retried(self):
+        flight = SingleFlight()
+        attempts = []
+
+        def target():
+            fail = not attempts
+            attempts.append(None)
+            try:
+                return flight.run("k", self.lookup, self.compute(fail=fail))
+            except ValueError:
+                return "failed"
+
+        results = run_in_threads(target, 4)
+        self.assertEqual(sorted(results, key=str), [1, 1, 1, "failed"])
+        self.assertEqual(len(self.computed), 2)
+
+    def test_interrupt_is_not_retried(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def interrupted():
+            started.set()
+            time.sleep(0.2)
+            raise KeyboardInterrupt
+
+        def lead():
+            try:
+                flight.run("k", self.lookup, interrupted)
+            except KeyboardInterrupt:
+                pass
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        with self.assertRaises(KeyboardInterrupt):
+            flight.run("k", self.lookup, self.compute(delay=0))
+        leader.join()
+        self.assertEqual(self.computed, [])
+
+    def test_reentrant(self):
+        flight = SingleFlight()
+        inner = self.compute(delay=0)
+        self.assertEqual(
+            flight.run("k", self.lookup, lambda: flight.run("k", self.lookup, inner)),
+            1,
+        )
+
+    def test_separate_instances_share_leases(self):
+        flights = [SingleFlight(self.dir.name, poll_interval=0.01) for _ in range(4)]
+        results = run_in_threads(
+            lambda: flights[len(self.computed) % 4].run(
+                "k", self.lookup, self.compute()
+            ),
+            4,
+        )
+        self.assertEqual(results, [1] * 4)
+        self.assertEqual(len(self.computed), 1)
+
+    def lease_path(self):
+        return os.path.join(self.dir.name, stable_hash("k")[:20] + ".lease")
+
+    def test_stale_lease_is_broken(self):
+        # left behind by a process that died long ago
+        with open(self.lease_path(), "w"):
+            pass
+        os.utime(self.lease_path(), (time.time() - 10, time.time() - 10))
+        flight = SingleFlight(self.dir.name, lease_timeout=1)
+        self.assertEqual(flight.run("k", self.lookup, self.compute(delay=0)), 1)
+        self.assertEqual(len(self.computed), 1)
+        self.assertFalse(os.path.exists(self.lease_path()))
+
+    def test_waits_for_held_lease(self):
+        with open(self.lease_path(), "w"):
+            pass
+
+        def release():
+            time.sleep(0.3)
+            self.store["k"] = 2
+            os.remove(self.lease_path())
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        flight = SingleFlight(self.dir.name, lease_timeout=1, poll_interval=0.01)
+        self.assertEqual(flight.run("k", self.lookup, self.compute(delay=0)), 2)
+        thread.join()
+        self.assertEqual(self.computed, [])